@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import pandas as pd
-import numpy as np
 from model.analysis import Analysis
 from model.state import CancerState, HpvState, HpvStrain, LifeState
 
@@ -76,7 +75,9 @@ def run_analysis(scenario_dir: Path, iteration: int):
 
     # Cause of Cancer
     cancer_counts = {
-        strain: np.sum(analysis.agent_events[strain.name]["To"] == HpvState.CANCER.value)
+        strain: analysis.agent_events[strain.name].loc[
+            lambda df: df["To"] == HpvState.CANCER.value, "Weight"
+        ].sum()
         for strain in [HpvStrain.SIXTEEN, HpvStrain.EIGHTEEN, HpvStrain.HIGH_RISK]
     }
     cancer_total = max(sum(cancer_counts.values()), 1)
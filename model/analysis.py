@@ -5,6 +5,43 @@ from model.parameters import Parameters
 from model.state import HpvState, HpvStrain, HivState, CancerState, CancerDetectionState, LifeState
 
 
+def read_weights(iteration_dir: Path) -> pd.DataFrame:
+    """ Return the splits of an importance weighted run (see `CervicalModel.split_agents`), or None if no agents
+    were split. Each row gives the weight of an agent from the time of the split on. Copies created by the split
+    have a Parent_ID that differs from their Unique_ID.
+    """
+    path = Path(iteration_dir).joinpath("weights.parquet")
+    if not path.exists():
+        return None
+    weights = pd.read_parquet(path)
+    return weights if len(weights) > 0 else None
+
+
+def add_weights(events: pd.DataFrame, weights: pd.DataFrame, copy_parent_events: bool = False) -> pd.DataFrame:
+    """ Add the weight of each event's agent at the time of the event as column `Weight`.
+
+    Args:
+        events (pd.DataFrame): State changes or events, with Time and Unique_ID columns
+        weights (pd.DataFrame): The output of `read_weights`
+        copy_parent_events (bool, optional): Give each copy the events of its parent from before the split, with a
+            weight of 0. The copies then have the complete history of their parent. Defaults to False.
+    """
+    events = events.assign(Weight=1.0)
+    if weights is None:
+        return events
+    if copy_parent_events:
+        copies = weights.loc[weights.Unique_ID != weights.Parent_ID, ["Unique_ID", "Parent_ID", "Time"]]
+        copies = copies.rename(columns={"Unique_ID": "Copy_ID", "Time": "Split_Time"})
+        copied = copies.merge(events, left_on="Parent_ID", right_on="Unique_ID")
+        copied = copied[copied.Time < copied.Split_Time].assign(Unique_ID=lambda df: df.Copy_ID, Weight=0.0)
+        events = pd.concat([events, copied[events.columns]], ignore_index=True)
+        events = events.sort_values("Time", kind="stable", ignore_index=True)
+    splits = weights.set_index("Unique_ID")
+    split = events.Time >= events.Unique_ID.map(splits.Time)
+    events.loc[split, "Weight"] = events.Unique_ID[split].map(splits.Weight)
+    return events
+
+
 class Analysis:
     """
     Provide some common analysis routines for the model's output data.
@@ -35,7 +72,12 @@ class Analysis:
         self.time_index = pd.Index(range(self.params.num_steps + 1))
         ia = self.params.initial_age
         self.age_index = pd.Index(range(ia, int(self.params.num_steps / self.params.steps_per_year + 1) + ia))
-        self.agent_index = pd.Index(range(self.params.num_agents))
+        # --- Importance weighted runs also contain the agents created by splitting
+        self.weights = read_weights(self.iteration_dir)
+        num_agents = self.params.num_agents
+        if self.weights is not None:
+            num_agents += int((self.weights.Unique_ID != self.weights.Parent_ID).sum())
+        self.agent_index = pd.Index(range(num_agents))
         self.agent_age_index = pd.MultiIndex.from_product(
             [self.agent_index, self.age_index], names=["Unique_ID", "Age"],
         )
@@ -47,7 +89,9 @@ class Analysis:
         self.agent_events = {}
         agent_timelines = {}
 
-        self.state_events = pd.read_parquet(self.iteration_dir.joinpath("state_changes.parquet"))
+        self.state_events = add_weights(
+            pd.read_parquet(self.iteration_dir.joinpath("state_changes.parquet")), self.weights, copy_parent_events=True
+        )
 
         for chart_id in self.chart_ids:
             self.agent_events[chart_id] = (
@@ -58,6 +102,8 @@ class Analysis:
             agent_timelines[chart_id] = self.create_timeline_from_events(self.agent_events[chart_id])
 
         self.agent_timeline = pd.DataFrame(agent_timelines)
+        if self.weights is not None:
+            self.agent_timeline["weight"] = self.create_weight_timeline()
 
         if add_computed_fields:
             self._add_computed_timelines()
@@ -87,6 +133,19 @@ class Analysis:
 
         return timeline
 
+    def create_weight_timeline(self) -> pd.Series:
+        """ The weight of each agent at each age. Agents weigh 1 until the age at which they are split, and copies weigh
+        0 before that age, as their parent represents them.
+        """
+        splits = self.weights.set_index("Unique_ID")
+        ages = self.agent_age_index.get_level_values("Age")
+        unique_ids = self.agent_age_index.get_level_values("Unique_ID")
+        split_age = (unique_ids.map(splits.Time) / self.params.steps_per_year).round() + self.params.initial_age
+        before = np.where(unique_ids.map(splits.Parent_ID) == unique_ids, 1.0, 0.0)
+        after = unique_ids.map(splits.Weight)
+        weight = np.where(ages >= split_age, after, before)
+        return pd.Series(np.where(np.isnan(split_age), 1.0, weight), index=self.agent_age_index)
+
     def prevalence(self, field: str, states: tuple, filter_dict: dict = dict(), alive_only: bool = True):
         """ Return a series containing the prevalence rate for the given states. The prevalence rate at a given time
         step is defined as the proportion of the living population who are in one of the states at that time step.
@@ -123,7 +182,11 @@ class Analysis:
         try:
             return self.cache_count_in[(field, target_states, str(filter_dict))]
         except KeyError:
-            count = df[df[field].isin(target_states)].groupby(level="Age").size().reindex(self.age_index).fillna(0)
+            selected = df[df[field].isin(target_states)]
+            if self.weights is None:
+                count = selected.groupby(level="Age").size().reindex(self.age_index).fillna(0)
+            else:
+                count = selected["weight"].groupby(level="Age").sum().reindex(self.age_index).fillna(0)
             self.cache_count_in[(field, target_states, str(filter_dict))] = count
 
             return count
@@ -149,9 +212,11 @@ class Analysis:
             use_indices = indices.intersection(events_idx)
             events = events.loc[list(use_indices)]
 
-            count = (
-                events[events["To"].isin(target_states)].groupby(level="Age").size().reindex(self.age_index).fillna(0)
-            )
+            selected = events[events["To"].isin(target_states)]
+            if self.weights is None:
+                count = selected.groupby(level="Age").size().reindex(self.age_index).fillna(0)
+            else:
+                count = selected["Weight"].groupby(level="Age").sum().reindex(self.age_index).fillna(0)
             self.cache_count_new[(field, target_states, str(filter_dict))] = count
 
             return count
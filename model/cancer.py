@@ -1,15 +1,19 @@
-import pickle as pickle
-
 import numpy as np
+from pathlib import Path
 
-from model.misc_functions import normalize, random_selection
-from model.state import CancerDetectionState, CancerState, EventState, LifeState, TimeSinceCancerDetectionState
+from model.misc_functions import dict_to_array
+from model.state import CancerDetectionState, CancerState, EventState
+from model.tables import TransitionTables
 
 
 class Cancer(EventState):
+    # --- Position of the cancer state in the keys of the cancer dictionary
+    STATE_KEY = 1
+
     def __init__(self, model):
-        with (open(model.transition_dir.joinpath("cancer_dictionary.pickle"), "rb")) as openfile:
-            cancer_dict = pickle.load(openfile)
+        # --- Keyed by (cancer detection, cancer)
+        path = model.transition_dir.joinpath("cancer_dictionary.pickle")
+        cancer_dict = model.tables.load(path, model.table_steps, state_key=self.STATE_KEY)
         super().__init__(enum=CancerState, transition_dict=cancer_dict)
         """ Cancer Status Tracker
             - Probability of NORMAL -> LOCAL transition is handled within the HPV class
@@ -17,13 +21,16 @@ class Cancer(EventState):
             - Probabilities are updated if:
                 - Cancer detection status changes (handled in the cancer detection state)
                 - Cancer progression status changes (handled in this class)
+            - Dense tables indexed by (cancer detection, cancer) are shared between models and are read only
         """
         self.model = model
-        self.transition_probability_dict = self.make_transition_probabilities()
+        self.rng = model.rng.stream("cancer")
+        self.transition_array, self.key_offsets, self.transition_probability_array, self.next_state_cdf = (
+            self.load_tables(model.tables, path, model.table_steps)
+        )
         self.probabilities = np.zeros(0)
         # Everyone starts out cancer free
-        self.initiate(count=self.model.params.num_agents, state=CancerState.NORMAL, dtype=np.int8)
-
+        self.initiate(count=self.model.num_agents, state=CancerState.NORMAL, dtype=self.model.dtypes.state)
 
     def step(self):
         """ Simulate progression through the cancer states: Must be living, be LOCAL or REGIONAL, and not be detected
@@ -31,66 +38,115 @@ class Cancer(EventState):
         """
         non_normal_status = np.isin(self.values, [CancerState.LOCAL, CancerState.REGIONAL])
         not_detected = self.model.cancer_detection.values == CancerDetectionState.UNDETECTED
-        unique_ids = self.model.unique_ids[self.model.life.living & non_normal_status & not_detected]
-
-        probabilities = self.probabilities[unique_ids]
-        selected_agents = unique_ids[probabilities > self.model.rng.rand(len(probabilities))]
-
-        # ----- Force a transition
-        for unique_id in selected_agents:
-            key = (self.model.cancer_detection.values[unique_id], self.values[unique_id])
-
-            current_state = self.values[unique_id]
-            key = (self.model.cancer_detection.values[unique_id], current_state)
-            probs_list = self.transition_dict[key]
-            # --- Remove their current states probability
-            probs_list[current_state - 1] = 0
-            cdf = normalize(probs_list, return_cdf=True)
-            new = random_selection(self.model.rng.rand(), cdf, self.integers)
-
-            self.model.state_changes.record_event(
-                (self.model.time, unique_id, CancerState.int, self.values[unique_id], new)
-            )
-            self.values[unique_id] = new
-
-            # ----- Update Cancer detection probability and cancer transition probability
-            self.model.cancer_detection.probabilities[unique_id] = self.model.cancer_detection.transition_dict[new]
-            key = (self.model.cancer_detection.values[unique_id], new)
-            self.probabilities[unique_id] = self.transition_probability_dict[key]
-
-            # ----- Update death probabilities
-            hiv_state = self.model.hiv.values[unique_id]
-            self.model.life.probabilities[unique_id] = self.model.life.transition_dict[(self.model.age, hiv_state, new)]
-
-            # --- If agent dies:
-            if new == CancerState.DEAD:
-                self.model.state_changes.record_event(
-                    (self.model.time, unique_id, LifeState.int, LifeState.ALIVE.value, LifeState.DEAD.value)
-                )
-                self.model.life.values[unique_id] = LifeState.DEAD.value
+        selected_agents = self.select_agents(self.model.life.living & non_normal_status & not_detected)
+
+        # ----- Force a transition: Draw the new state from the conditional cdf that excludes the current state
+        randoms = self.rng.for_agents(selected_agents, draw=1)
+        current = self.values[selected_agents]
+        new = self.model.kernels.draw_states(
+            self.next_state_cdf, self.table_index(selected_agents), randoms, CancerState.NORMAL.value, current.dtype
+        )
+
+        # --- Agents without another state to move to remain where they are
+        changed = new != current
+        selected_agents, current, new = selected_agents[changed], current[changed], new[changed]
+        self.model.state_changes.record_events(
+            (self.model.time, self.model.agent_ids[selected_agents], CancerState.int, current, new)
+        )
+        self.values[selected_agents] = new
+
+        # ----- Cancer detection, cancer transition, and death probabilities follow the new states
+        self.model.dependencies.invalidate("cancer_progression", selected_agents)
+
+        # --- If agent dies:
+        self.model.life.die(selected_agents[new == CancerState.DEAD])
 
         # ----- Update Cancer Detection
-        for unique_id, v in self.model.dicts.time_since_cancer_detection.items():
-            if v == TimeSinceCancerDetectionState.WITHIN_5_YEARS:
-                if self.model.compute_years_since(self.model.dicts.cancer_detection_time[unique_id]) > 5:
-                    self.model.dicts.time_since_cancer_detection[
-                        unique_id
-                    ] = TimeSinceCancerDetectionState.BEYOND_5_YEARS.value
-
-    def make_transition_probabilities(self):
-        """ Create a dictionary of probabilities to transition (excluding the current state)
+        self.model.cancer_detection.update_time_since_detection()
+
+    @staticmethod
+    def load_tables(tables: TransitionTables, path: Path, steps: int = 1) -> tuple:
+        """ Return the dense tables of a cancer dictionary file, creating them the first time. Returns the transition
+        array, its key offsets, the transition probabilities, and the next state cdf. See `TransitionTables.load`.
+        """
+        return tables.get(
+            ("cancer", path.resolve(), steps),
+            lambda: Cancer.make_tables(tables.load(path, steps, Cancer.STATE_KEY)),
+        )
+
+    @staticmethod
+    def make_tables(cancer_dict: dict) -> tuple:
+        """ Create the dense tables of the cancer dictionary. See `load_tables`.
         """
-        probs = dict()
-        for k, v in self.transition_dict.items():
-            state = k[1]
-            probability_to_transition = 1 - v[state - 1]
-            probs[k] = probability_to_transition
-        return probs
+        transition_array, offsets = dict_to_array(cancer_dict)
+        tables = (
+            transition_array,
+            tuple(offsets.tolist()),
+            Cancer.make_transition_probabilities(transition_array, offsets[1]),
+            Cancer.make_next_state_cdf(transition_array, offsets[1]),
+        )
+        for table in tables:
+            if isinstance(table, np.ndarray):
+                table.setflags(write=False)
+        return tables
+
+    @staticmethod
+    def current_state_index(transition_array: np.array, state_offset: int) -> tuple:
+        """ Return the (cancer, to_state) index of the probability to remain in each current state. The cancer axis
+        starts at `state_offset`, while the to_state axis starts at the first CancerState.
+        """
+        states = np.arange(transition_array.shape[-2])
+        return states, states + state_offset - CancerState.NORMAL.value
+
+    @staticmethod
+    def make_transition_probabilities(transition_array: np.array, state_offset: int) -> np.array:
+        """ Create an array of probabilities to transition (excluding the current state), indexed by
+        (cancer detection, cancer)
+        """
+        return 1 - transition_array[(Ellipsis,) + Cancer.current_state_index(transition_array, state_offset)]
+
+    @staticmethod
+    def make_next_state_cdf(transition_array: np.array, state_offset: int) -> np.array:
+        """ Create an array with the cdf of the next state given that a transition occurs, indexed by
+        (cancer detection, cancer, to_state). The current state is removed before normalizing. If no other state can be
+        reached, all of the probability is given to the current state.
+        """
+        probs = transition_array.copy()
+        current = (Ellipsis,) + Cancer.current_state_index(transition_array, state_offset)
+        probs[current] = 0
+        stuck = probs.sum(axis=-1) == 0
+        probs[current] = stuck
+
+        cdf = np.cumsum(probs / probs.sum(axis=-1, keepdims=True), axis=-1)
+        cdf[..., -1] = 1
+        return cdf
+
+    def table_index(self, unique_ids: np.array, states: np.array = None) -> tuple:
+        """ Return the (cancer detection, cancer) index into the transition arrays for the given agents
+
+        Args:
+            unique_ids (np.array): The agents
+            states (np.array, optional): Cancer states to use instead of the current states of the agents
+        """
+        if states is None:
+            states = self.values[unique_ids]
+        return (
+            self.model.cancer_detection.values[unique_ids] - self.key_offsets[0],
+            states - self.key_offsets[1],
+        )
+
+    def find_transition_probabilities(self, unique_ids: np.array, states: np.array = None) -> np.array:
+        """ Look up the probability of transitioning out of the current cancer state for the given agents. See
+        `table_index`.
+        """
+        return self.transition_probability_array[self.table_index(unique_ids, states)]
+
+    def update_agent_probabilities(self, unique_ids: np.array):
+        self.probabilities[unique_ids] = self.find_transition_probabilities(unique_ids)
 
     def initiate_probabilities(self):
-        """ Loop up each agents transition probability.
+        """ Look up each agents transition probability.
         """
-        keys = list(zip(self.model.cancer_detection.values, self.values))
-        self.probabilities = np.zeros(len(keys))
-        for unique_id, key in enumerate(keys):
-            self.probabilities[unique_id] = self.transition_probability_dict[key]
+        self.probabilities = self.find_transition_probabilities(self.model.unique_ids).astype(
+            self.model.dtypes.probability
+        )
@@ -1,5 +1,3 @@
-import pickle
-
 import numpy as np
 
 from model.event import Event
@@ -8,46 +6,89 @@ from model.state import CancerDetectionState, CancerState, EventState, TimeSince
 
 class CancerDetection(EventState):
     def __init__(self, model):
-        with (open(model.transition_dir.joinpath("cancer_detection_dictionary.pickle"), "rb")) as openfile:
-            cancer_detection_dict = pickle.load(openfile)
+        path = model.transition_dir.joinpath("cancer_detection_dictionary.pickle")
+        cancer_detection_dict = model.tables.load(path, model.table_steps)
         super().__init__(enum=CancerDetectionState, transition_dict=cancer_detection_dict)
+        # --- Dense table indexed by cancer state
+        self.transition_array, self.key_offsets = model.tables.array(path, model.table_steps)
         self.model = model
+        self.rng = model.rng.stream("cancer_detection")
         # No one can be deteced yet
-        self.initiate(count=self.model.params.num_agents, state=CancerDetectionState.UNDETECTED, dtype=np.int8)
-        self.probabilities = np.zeros(self.model.params.num_agents)
+        self.initiate(count=self.model.num_agents, state=CancerDetectionState.UNDETECTED, dtype=model.dtypes.state)
+        self.probabilities = np.zeros(self.model.num_agents, dtype=model.dtypes.probability)
+        # --- The time step of detection and the TimeSinceCancerDetectionState of agents detected by this state. Agents
+        # who were not detected have a time since detection of 0, and their detection time is not used.
+        self.detection_time = np.zeros(self.model.num_agents, dtype=model.dtypes.agent_time)
+        self.time_since_detection = np.zeros(self.model.num_agents, dtype=model.dtypes.state)
 
     def step(self):
         """ Simulate NORMAL Cancer Detection: Must be alive, undetected, and have cancer
-        Note: cancer.step() is responsible for updating the cancer_detection probabilities
+        Note: The probabilities are updated as cancer progresses. See ProbabilityDependencies.
         """
         undetected = self.values == CancerDetectionState.UNDETECTED
         non_normal_status = self.model.cancer.values != CancerState.NORMAL
 
-        use_agents = self.model.unique_ids[self.model.life.living & undetected & non_normal_status]
-        probabilities = self.probabilities[use_agents]
-        selected_agents = probabilities > self.model.rng.rand(len(probabilities))
+        selected_agents = self.select_agents(self.model.life.living & undetected & non_normal_status)
 
         from_v = CancerDetectionState.UNDETECTED.value
         to_v = CancerDetectionState.DETECTED.value
-        for unique_id in self.model.unique_ids[use_agents][selected_agents]:
-            self.model.state_changes.record_event((self.model.time, unique_id, CancerDetectionState.int, from_v, to_v))
-            self.values[unique_id] = CancerDetectionState.DETECTED.value
-            # ----- Treat cancer and update dictionaries
-            self.treat_cancer(unique_id)
-            self.model.dicts.cancer_detection_time[unique_id] = self.model.time
-            self.model.dicts.time_since_cancer_detection[unique_id] = TimeSinceCancerDetectionState.WITHIN_5_YEARS.value
-
-    def treat_cancer(self, unique_id: int):
+        self.model.state_changes.record_events(
+            (self.model.time, self.model.agent_ids[selected_agents], CancerDetectionState.int, from_v, to_v)
+        )
+        self.values[selected_agents] = to_v
+        # ----- Treat cancer and record the time of detection
+        self.treat_cancer(selected_agents)
+        self.detection_time[selected_agents] = self.model.time
+        self.time_since_detection[selected_agents] = TimeSinceCancerDetectionState.WITHIN_5_YEARS.value
+
+    def update_time_since_detection(self):
+        """ Move agents who were detected more than 5 years ago to BEYOND_5_YEARS
+        """
+        within = self.time_since_detection == TimeSinceCancerDetectionState.WITHIN_5_YEARS
+        expired = within & (self.model.compute_years_since(self.detection_time) > 5)
+        self.time_since_detection[expired] = TimeSinceCancerDetectionState.BEYOND_5_YEARS.value
+
+    def compact(self, keep: np.array):
+        super().compact(keep)
+        self.detection_time = self.detection_time[keep]
+        self.time_since_detection = self.time_since_detection[keep]
+
+    def get_state(self) -> dict:
+        state = super().get_state()
+        state["detection_time"] = self.detection_time
+        state["time_since_detection"] = self.time_since_detection
+        return state
+
+    def set_state(self, state: dict):
+        super().set_state(state)
+        self.detection_time = state["detection_time"]
+        self.time_since_detection = state["time_since_detection"]
+
+    def find_cancer_probabilities(self, cancer_states: np.array) -> np.array:
+        """ Look up the detection probability of undetected agents in the given cancer states
+        """
+        return self.find_probabilities(cancer_states)
+
+    def update_agent_probabilities(self, unique_ids: np.array):
+        self.probabilities[unique_ids] = self.find_cancer_probabilities(self.model.cancer.values[unique_ids])
+
+    def treatment_costs(self) -> np.array:
+        """ Return the cost of treating cancer indexed by cancer state. States without treatment have a cost of NaN.
+        """
+        costs = np.full(max(CancerState) + 1, np.nan)
+        costs[CancerState.LOCAL] = self.model.params.treatment.cancer_cost_local
+        costs[CancerState.REGIONAL] = self.model.params.treatment.cancer_cost_regional
+        costs[CancerState.DISTANT] = self.model.params.treatment.cancer_cost_distant
+        return costs
+
+    def treat_cancer(self, unique_ids: np.array):
         """ Other than the cost, the model doesn't explicitly implement anything related to cancer treatment.
         """
-        state = self.model.cancer.values[unique_id]
-        if state == CancerState.LOCAL:
-            cost = self.model.params.treatment.cancer_cost_local
-        elif state == CancerState.REGIONAL:
-            cost = self.model.params.treatment.cancer_cost_regional
-        elif state == CancerState.DISTANT:
-            cost = self.model.params.treatment.cancer_cost_distant
-        else:
-            raise NotImplementedError("Unexpected cancer state {}".format(state))
-
-        self.model.events.record_event((self.model.time, unique_id, Event.TREATMENT_CANCER.value, cost))
+        states = self.model.cancer.values[unique_ids]
+        costs = self.treatment_costs()[states]
+        if np.isnan(costs).any():
+            raise NotImplementedError("Unexpected cancer state {}".format(states[np.isnan(costs)][0]))
+
+        self.model.events.record_events(
+            (self.model.time, self.model.agent_ids[unique_ids], Event.TREATMENT_CANCER.value, costs)
+        )
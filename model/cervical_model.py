@@ -1,4 +1,10 @@
+import copy
+import math
+import os
+import pickle
+
 import numpy as np
+import pandas as pd
 
 from enum import Enum
 from pathlib import Path
@@ -6,22 +12,36 @@ from tqdm import trange
 
 from model.event import Event
 from model.logger import LoggerFactory
-from model.parameters import Parameters
+from model.memory import DtypeProfile, array_bytes
+from model.parameters import ParameterContainer, Parameters
 from model.vaccine import VaccinationProtocol
 from model.misc_functions import EventStorage
+from model.kernels import make_kernels
+from model.rng import RandomService
+from model.scheduler import WaitingTimeScheduler
+from model.tables import TransitionTables, table_steps
 from model.treatment import CinTreatmentMethodFactory
 from model.screening import ScreeningState, DnaScreeningTest, ViaScreeningTest, CancerInspectionScreeningTest, protocols
-from model.state import HpvState, HpvStrain, CancerDetectionState, HpvImmunity, Empty, int_map
+from model.state import HpvState, HpvStrain, HivState, CancerDetectionState, HpvImmunity, Empty, int_map
 
 from model.cancer_detection import CancerDetection
 from model.cancer import Cancer
 from model.life import Life
+from model.dependencies import ProbabilityDependencies
 from model.hiv import Hiv
-from model.hpv import Hpv
+from model.hpv import MultiStrainHpv
 
 
 class CervicalModel:
-    def __init__(self, scenario_dir: Path, iteration: int = 0, logger: LoggerFactory = None, seed: int = 1111):
+    def __init__(
+        self,
+        scenario_dir: Path,
+        iteration: int = 0,
+        logger: LoggerFactory = None,
+        seed: int = 1111,
+        replicate_seeds: list = None,
+        tables: TransitionTables = None,
+    ):
         """Create a new CervicalModel simulator.
 
         Args:
@@ -29,46 +49,75 @@ class CervicalModel:
             iteration (int, optional): [description]. Defaults to 0.
             logger (LoggerFactory, optional): Logger to use for writing log messages. Defaults to None.
             seed (int, optional): [description]. Defaults to 1111.
+            replicate_seeds (list, optional): Simulate one replicate of the scenario per seed, as a single stacked
+                population. Replicate i is written to iteration `iteration + i` and matches a run with seed
+                `replicate_seeds[i]`. Overrides `seed`. Defaults to None.
+            tables (TransitionTables, optional): Transition tables to share with other models. Defaults to None.
         """
 
         # ----- Setup the class structure
         self.scenario_dir = scenario_dir
-        self.iteration_dir = self.scenario_dir.joinpath(f"iteration_{iteration}")
-        self.iteration_dir.mkdir(exist_ok=True)
+        self.iteration = iteration
+        self.replicate_seeds = list(replicate_seeds) if replicate_seeds else [seed]
+        self.replicates = len(self.replicate_seeds)
+        self.iteration_dirs = [
+            self.scenario_dir.joinpath(f"iteration_{iteration + replicate}") for replicate in range(self.replicates)
+        ]
+        for iteration_dir in self.iteration_dirs:
+            iteration_dir.mkdir(exist_ok=True)
+        self.iteration_dir = self.iteration_dirs[0]
         # Use the iteration specific transition dictionaries if they exists
         self.transition_dir = self.scenario_dir.joinpath("transition_dictionaries")
         if self.iteration_dir.joinpath("transition_dictionaries").exists():
             self.transition_dir = self.iteration_dir.joinpath("transition_dictionaries")
+        if any(d.joinpath("transition_dictionaries").exists() for d in self.iteration_dirs[1:]):
+            raise ValueError("Stacked replicates share their transition dictionaries. Run these iterations separately.")
+        self.tables = tables if tables is not None else TransitionTables()
         self.params = Parameters()
         self.params.update_from_file(self.scenario_dir.joinpath("parameters.yml"))
+        # The number of time steps of the transition dictionaries in one time step of the model
+        self.table_steps = table_steps(self.params)
+        max_age = self.params.initial_age + math.ceil(self.params.num_steps / self.params.steps_per_year) - 1
+        self.dtypes = DtypeProfile(self.params.memory_profile, self.params.num_steps, max_age=max_age)
+        # --- Replicate i holds the agents with Unique_IDs [i * replicate_size, (i + 1) * replicate_size)
+        self.replicate_size = self.params.num_agents
+        self.num_agents = self.replicate_size * self.replicates
+        if self.params.importance.split_factor > 1 and self.replicates > 1:
+            raise ValueError("Agents cannot be split in stacked replicates. Run the replicates separately.")
         self.time = 0
-        self.rng = np.random.RandomState(seed)
+        self.rng = RandomService(
+            self.replicate_seeds[0],
+            bit_generator=self.params.rng.bit_generator,
+            buffer_size=self.params.rng.buffer_size,
+            common_random_numbers=self.params.rng.common_random_numbers,
+            model=self,
+            replicate_seeds=self.replicate_seeds if self.replicates > 1 else None,
+        )
         self.logger = logger
-        self.logger.info("Random seed: {}".format(seed))
+        self.logger.info("Random seed: {}".format(", ".join(str(item) for item in self.replicate_seeds)))
         self.logger.info("Model parameters: \n{}".format(self.params))
+        self.kernels = make_kernels(self.params.kernel_backend, logger=self.logger)
 
         # ----- Setup the storage containers
-        self.state_changes = EventStorage(column_names=["Time", "Unique_ID", "State_ID", "From", "To"])
-        self.events = EventStorage(column_names=["Time", "Unique_ID", "Event", "Cost"])
+        self.state_changes = self.make_event_storage(["Time", "Unique_ID", "State_ID", "From", "To"])
+        self.events = self.make_event_storage(["Time", "Unique_ID", "Event", "Cost"])
+        # --- The weight of agents from the time they are split. See `split_agents`.
+        self.splits = self.make_event_storage(["Time", "Unique_ID", "Parent_ID", "Weight"])
         # --- Dictionaries
         self.dicts = Empty("Collection of Dictionaries")
-        self.dicts.cancer_detection_time = dict()
-        self.dicts.time_since_cancer_detection = dict()
         self.dicts.cin_treatment_methods = dict()
-        self.dicts.last_screen_age = dict()
         # --- Sets
-        self.hiv_detected = set()
         self.hpv_vaccinations = set()
 
         # ----- Setup the model states
+        self.dependencies = ProbabilityDependencies(model=self)
         self.life = Life(model=self)
         self.hiv = Hiv(model=self)
         self.cancer_detection = CancerDetection(model=self)
         self.cancer = Cancer(model=self)
-        # --- HPV State: One for every strain
-        self.hpv_strains = dict()
-        for strain in [item.value for item in HpvStrain]:
-            self.hpv_strains[strain] = Hpv(model=self, strain=strain)
+        # --- HPV State: One for every strain, simulated together
+        self.hpv = MultiStrainHpv(model=self)
+        self.hpv_strains = self.hpv.strains
 
         # ----- Now that States are in place, load the agents
         self.load_agents()
@@ -89,28 +138,48 @@ class CervicalModel:
         self.vaccination_protocol = VaccinationProtocol(model=self)
 
     def run(self, print_status=False):
-        # Run the model
-        run_range = range(self.params.num_steps)
+        # Run the model. A model restored with `set_state` or `resume` continues from its current time step.
+        run_range = range(self.time, self.params.num_steps)
         if print_status:
-            run_range = trange(self.params.num_steps, desc="---> Running model")
+            run_range = trange(self.time, self.params.num_steps, desc="---> Running model")
+        checkpoint_steps = self.params.checkpoint_interval * self.params.steps_per_year
         for _ in run_range:
             self.step()
+            if checkpoint_steps and self.time % checkpoint_steps == 0 and self.time < self.params.num_steps:
+                self.save_checkpoint()
+        self.log_memory_report()
         self.save_output()
+        # --- The output is complete, so the checkpoint is no longer needed
+        if self.checkpoint_path.exists():
+            self.checkpoint_path.unlink()
 
     def save_output(self):
         # Save the output
         df = self.state_changes.make_events()
         df["State"] = df["State_ID"].map(int_map)
-        location1 = self.iteration_dir.joinpath("state_changes.parquet")
-        df.drop("State_ID", axis=1).to_parquet(location1, index=False)
-        location2 = self.iteration_dir.joinpath("events.parquet")
-        self.events.make_events().to_parquet(location2, index=False)
+        df = df.drop("State_ID", axis=1)
+        events = self.events.make_events()
+        splits = self.splits.make_events()
+        for iteration_dir, state_changes, replicate_events, replicate_splits in zip(
+            self.iteration_dirs, self.split_replicates(df), self.split_replicates(events), self.split_replicates(splits)
+        ):
+            state_changes.to_parquet(iteration_dir.joinpath("state_changes.parquet"), index=False)
+            replicate_events.to_parquet(iteration_dir.joinpath("events.parquet"), index=False)
+            replicate_splits.to_parquet(iteration_dir.joinpath("weights.parquet"), index=False)
+
+    def split_replicates(self, df: pd.DataFrame) -> list:
+        """ Split an output table into one table per replicate, with the Unique_IDs of a single run
+        """
+        if self.replicates == 1:
+            return [df]
+        replicate = df["Unique_ID"].to_numpy() // self.replicate_size
+        df = df.assign(Unique_ID=df["Unique_ID"] % self.replicate_size)
+        return [df[replicate == i].reset_index(drop=True) for i in range(self.replicates)]
 
     def step(self):
         if self.time % self.params.steps_per_year == 0:
             self.yearly_update()
         # ----- Order: Hpv (by strain), Hiv, Cancer Progression, Cancer Detection, Life
-        self.life.update_living()
         self.step_hpv()
         self.step_hiv()
         self.step_cancer()
@@ -119,57 +188,92 @@ class CervicalModel:
         self.time += 1
 
     def step_hpv(self):
-        self.hpv_strains[HpvStrain.LOW_RISK].step()
-        self.hpv_strains[HpvStrain.HIGH_RISK].step()
-        self.hpv_strains[HpvStrain.SIXTEEN].step()
-        self.hpv_strains[HpvStrain.EIGHTEEN].step()
-        self.hpv_strains[max(HpvStrain)].update_hpv_state()
+        self.hpv.step()
+        self.dependencies.flush()
 
     def step_hiv(self):
         self.hiv.step()
+        self.dependencies.flush()
 
     def step_cancer(self):
         self.cancer.step()
+        self.dependencies.flush()
 
     def step_cancer_detection(self):
         self.cancer_detection.step()
+        self.dependencies.flush()
 
     def step_life(self):
         self.life.step()
+        self.dependencies.flush()
 
     def load_agents(self):
         """ Add the agents to the model based on parameter inputs
         Order matters here, as some states rely on others
         """
-        num_agents = self.params.num_agents
+        num_agents = self.num_agents
         self.age = self.params.initial_age
-        self.unique_ids = np.array([item for item in range(num_agents)])
+        self.unique_ids = np.arange(num_agents, dtype=self.dtypes.id)
+        # The Unique_ID recorded for the agent at each index. Only differs from unique_ids after compaction.
+        self.agent_ids = self.unique_ids.copy()
+        # The sampling weight of each agent, and the Unique_ID of the next agent created by splitting
+        self.weights = np.ones(num_agents, dtype=self.dtypes.probability)
+        self.next_agent_id = num_agents
+        # The age of each agent's last screening (-1 if never screened), and whether her HIV was detected
+        self.last_screen_age = np.full(num_agents, -1, dtype=self.dtypes.age)
+        self.hiv_detected = np.zeros(num_agents, dtype=bool)
 
         self.cancer.initiate_probabilities()
 
-        for hpv in self.hpv_strains.values():
-            hpv.initiate(count=num_agents, state=HpvState.NORMAL, dtype=np.int8)
-            hpv.hpv_immunity = self.initiate_array(count=num_agents, state=HpvImmunity.NORMAL, dtype=np.int8)
-            hpv.update_probabilities()
+        self.hpv.initiate(count=num_agents)
+        self.hpv.update_probabilities()
 
-        # - Only required to call this for one strain - as it finds the max of all strains
         self.max_hpv_state = Empty("max_hpv_state")
-        self.hpv_strains[max(HpvStrain)].update_hpv_state()
+        self.hpv.update_hpv_state()
 
+        self.life.update_living()
         self.life.update_probabilities()
         self.hiv.update_probabilities()
 
+        if self.params.sample_waiting_times:
+            states = {
+                "life": self.life,
+                "hiv": self.hiv,
+                "cancer_detection": self.cancer_detection,
+                "cancer": self.cancer,
+            }
+            for name, state in states.items():
+                rng = self.rng.stream(f"{name}_waiting_times")
+                state.scheduler = WaitingTimeScheduler(model=self, count=num_agents, rng=rng)
+            self.hpv.schedulers = [
+                WaitingTimeScheduler(model=self, count=num_agents, rng=self.rng.stream(f"hpv_{strain}_waiting_times"))
+                for strain in self.hpv.strains
+            ]
+
         # ----- Additional Intervention States
         self.screening_state = Empty("screening")
-        self.screening_state.values = self.initiate_array(count=num_agents, state=ScreeningState.ROUTINE, dtype=np.int8)
-        self.compliant_routine_state = Empty("compliant_routine")
-        self.compliant_routine_state.values = np.array(
-            self.rng.rand(num_agents) >= self.params.screening.compliance.never
+        self.screening_state.values = self.initiate_array(
+            count=num_agents, state=ScreeningState.ROUTINE, dtype=self.dtypes.state
         )
-        self.compliant_surveillance_state = Empty("compliant_surveillance")
-        self.compliant_surveillance_state.values = np.array(
-            self.rng.rand(num_agents) >= self.params.screening.compliance.never_surveillance
+        # --- The random numbers are kept, so that a forked model can apply its own compliance parameters
+        rng = self.rng.stream("compliance")
+        self.compliance_random = np.array(
+            [rng.for_agents(self.unique_ids, draw=0), rng.for_agents(self.unique_ids, draw=1)],
+            dtype=self.dtypes.probability,
         )
+        self.compliant_routine_state = Empty("compliant_routine")
+        self.compliant_surveillance_state = Empty("compliant_surveillance")
+        self.update_compliance()
+
+    def make_event_storage(self, column_names: list) -> EventStorage:
+        return EventStorage(column_names=column_names, dtypes=self.dtypes.event_dtypes(column_names))
+
+    def update_compliance(self):
+        """ Decide which agents comply with routine and surveillance screening
+        """
+        compliance = self.params.screening.compliance
+        self.compliant_routine_state.values = self.compliance_random[0] >= compliance.never
+        self.compliant_surveillance_state.values = self.compliance_random[1] >= compliance.never_surveillance
 
     def initiate_array(self, count: int, state: Enum, dtype: type = np.int8) -> np.array:
         array = np.zeros(count, dtype=dtype)
@@ -179,36 +283,308 @@ class CervicalModel:
     def yearly_update(self):
         if self.time != 0:
             self.age += 1
+            interval = self.params.compaction_interval
+            if interval and (self.age - self.params.initial_age) % interval == 0:
+                self.compact()
+            if self.params.importance.split_factor > 1:
+                self.split_agents()
         # ----- Life, HIV, and HPV probabilities are based on age
         self.life.update_probabilities()
         self.hiv.update_probabilities()
-        for strain in self.hpv_strains:
-            self.hpv_strains[strain].update_probabilities()
+        self.hpv.update_probabilities()
         # ------ Apply screening and vaccination protocols
         self.screening_protocol.apply()
         self.vaccination_protocol.apply()
 
+    def compact(self):
+        """ Pack the agent arrays down to the living agents. Afterwards, the agent at index i is recorded with
+        Unique_ID `agent_ids[i]`, so the output is unaffected.
+        """
+        keep = self.life.living_ids
+        if len(keep) == len(self.unique_ids):
+            return
+        new_index = np.full(len(self.unique_ids), -1)
+        new_index[keep] = np.arange(len(keep))
+
+        self.take_agents(keep)
+        # --- Dictionaries and sets are keyed by index
+        for name, value in vars(self.dicts).items():
+            if isinstance(value, dict):
+                setattr(self.dicts, name, {int(new_index[k]): v for k, v in value.items() if new_index[k] >= 0})
+        self.hpv_vaccinations = {int(new_index[k]) for k in self.hpv_vaccinations if new_index[k] >= 0}
+        self.life.update_living()
+        self.logger.info("Compacted agent arrays to {} living agents at time {}".format(len(keep), self.time))
+
+    def take_agents(self, keep: np.array):
+        """ Rebuild the agent arrays from the agents at the given indices. An index may be repeated to copy an agent.
+        Dictionaries and sets are keyed by index, and must be updated by the caller.
+        """
+        self.unique_ids = np.arange(len(keep), dtype=self.unique_ids.dtype)
+        self.agent_ids = self.agent_ids[keep]
+        self.weights = self.weights[keep]
+        self.last_screen_age = self.last_screen_age[keep]
+        self.hiv_detected = self.hiv_detected[keep]
+        for state in [self.life, self.hiv, self.cancer_detection, self.cancer, self.hpv]:
+            state.compact(keep)
+        for state in [self.max_hpv_state, self.screening_state, self.compliant_routine_state]:
+            state.values = state.values[keep]
+        self.compliant_surveillance_state.values = self.compliant_surveillance_state.values[keep]
+        self.compliance_random = self.compliance_random[:, keep]
+
+    def split_agents(self):
+        """ Split each living high risk agent into `split_factor` agents of equal weight (see ImportanceParameters).
+            - The copies share the history of the agent, but continue independently with new Unique_IDs
+            - Agents are split once: Agents with a weight below 1 are not split again
+            - The splits are recorded in `weights.parquet`, which `Analysis` uses to weight agents and events
+        """
+        params = self.params.importance
+        high_risk = np.zeros(len(self.unique_ids), dtype=bool)
+        if params.split_hiv:
+            high_risk |= self.hiv.values == HivState.HIV.value
+        if params.split_hpv_state:
+            rows = [row for row, strain in enumerate(self.hpv.strain_ints) if strain != HpvStrain.LOW_RISK.int]
+            high_risk |= (self.hpv.values[rows] >= params.split_hpv_state).any(axis=0)
+        parents = np.flatnonzero(high_risk & self.life.living & (self.weights == 1))
+        if len(parents) == 0:
+            return
+
+        count = len(self.unique_ids)
+        sources = np.repeat(parents, params.split_factor - 1)
+        clones = np.arange(count, count + len(sources))
+        self.take_agents(np.concatenate([np.arange(count), sources]))
+        self.agent_ids[clones] = np.arange(self.next_agent_id, self.next_agent_id + len(sources))
+        self.next_agent_id += len(sources)
+        self.weights[parents] /= params.split_factor
+        self.weights[clones] = self.weights[sources]
+        self.splits.record_events((self.time, self.agent_ids[parents], self.agent_ids[parents], self.weights[parents]))
+        self.splits.record_events((self.time, self.agent_ids[clones], self.agent_ids[sources], self.weights[clones]))
+        # --- Copies draw their own waiting times
+        schedulers = [self.life, self.hiv, self.cancer_detection, self.cancer]
+        schedulers = [state.scheduler for state in schedulers if state.scheduler is not None]
+        for scheduler in schedulers + (self.hpv.schedulers or []):
+            scheduler.forget(clones)
+        # --- Dictionaries and sets are keyed by index
+        for value in vars(self.dicts).values():
+            if isinstance(value, dict):
+                value.update({int(clone): value[source] for clone, source in zip(clones, sources) if source in value})
+        self.hpv_vaccinations.update(
+            int(clone) for clone, source in zip(clones, sources) if source in self.hpv_vaccinations
+        )
+        self.life.update_living()
+        self.logger.info("Split {} high risk agents at time {}".format(len(parents), self.time))
+
+    def memory_report(self) -> pd.Series:
+        """ Return the number of bytes used by the agent arrays of each component, the recorded events, and the
+        transition tables. `per_agent` is the number of bytes of agent arrays per agent.
+        """
+        report = pd.Series(
+            {
+                "ids": self.unique_ids.nbytes + self.agent_ids.nbytes + self.weights.nbytes,
+                "life": array_bytes(self.life),
+                "hiv": array_bytes(self.hiv) + self.hiv_detected.nbytes,
+                "cancer": array_bytes(self.cancer),
+                "cancer_detection": array_bytes(self.cancer_detection),
+                "hpv": array_bytes(self.hpv),
+                "interventions": array_bytes(
+                    self.max_hpv_state,
+                    self.screening_state,
+                    self.compliant_routine_state,
+                    self.compliant_surveillance_state,
+                )
+                + self.compliance_random.nbytes
+                + self.last_screen_age.nbytes,
+            }
+        )
+        report["per_agent"] = report.sum() / max(len(self.unique_ids), 1)
+        report["state_changes"] = self.state_changes.nbytes()
+        report["events"] = self.events.nbytes() + self.splits.nbytes()
+        report["tables"] = self.tables.nbytes()
+        report["total"] = report.drop("per_agent").sum()
+        return report
+
+    def log_memory_report(self):
+        report = self.memory_report()
+        self.logger.info(
+            "Memory report ({} profile, {} agents): {}".format(
+                self.params.memory_profile,
+                len(self.unique_ids),
+                ", ".join(
+                    "{} {:.0f} B".format(name, value)
+                    if name == "per_agent"
+                    else "{} {:.1f} MB".format(name, value / 2 ** 20)
+                    for name, value in report.items()
+                ),
+            )
+        )
+
+    # ------ Snapshots -------------------------------------------------------------------------------------------------
+    structure_params = [
+        "num_agents",
+        "steps_per_year",
+        "initial_age",
+        "include_hiv",
+        "sample_waiting_times",
+        "rng",
+        "importance",
+    ]
+
+    def get_state(self, copy_arrays: bool = True) -> dict:
+        """ Return a copy of the complete state of the model: Agent arrays, dictionaries, sets, random number
+        streams, and the events recorded so far. The state can be pickled, and restored with `set_state`.
+
+        Args:
+            copy_arrays (bool, optional): If False, the state refers to the arrays of the model instead of copying
+                them. Only use this if the state is saved before the model continues. Defaults to True.
+        """
+        state = {
+            "structure": {name: self.structure_param(name) for name in self.structure_params},
+            "replicate_seeds": self.replicate_seeds,
+            "time": self.time,
+            "age": self.age,
+            "unique_ids": self.unique_ids,
+            "agent_ids": self.agent_ids,
+            "weights": self.weights,
+            "next_agent_id": self.next_agent_id,
+            "states": {
+                "life": self.life.get_state(),
+                "hiv": self.hiv.get_state(),
+                "cancer_detection": self.cancer_detection.get_state(),
+                "cancer": self.cancer.get_state(),
+            },
+            "hpv": self.hpv.get_state(),
+            "max_hpv_state": self.max_hpv_state.values,
+            "screening_state": self.screening_state.values,
+            "compliance_random": self.compliance_random,
+            "last_screen_age": self.last_screen_age,
+            "dicts": {name: value for name, value in vars(self.dicts).items() if isinstance(value, dict)},
+            "hiv_detected": self.hiv_detected,
+            "hpv_vaccinations": self.hpv_vaccinations,
+            "rng": self.rng.get_state(),
+            "state_changes": self.state_changes.get_state(),
+            "events": self.events.get_state(),
+            "splits": self.splits.get_state(),
+        }
+        return copy.deepcopy(state) if copy_arrays else state
+
+    def set_state(self, state: dict):
+        """ Continue from a state returned by `get_state`, possibly of a model with other parameters. Parameters
+        that change the structure of the model (ex: num_agents) must match. The continued run is identical to a
+        full run with this model's parameters if the parameters that differ were not used before the snapshot.
+        """
+        for name, value in state["structure"].items():
+            if self.structure_param(name) != value:
+                raise ValueError("Cannot restore a model state with a different {}".format(name))
+        if list(state["replicate_seeds"]) != self.replicate_seeds:
+            raise ValueError("Cannot restore a model state with different seeds")
+        state = copy.deepcopy(state)
+
+        self.time = state["time"]
+        self.age = state["age"]
+        self.unique_ids = state["unique_ids"]
+        self.agent_ids = state["agent_ids"]
+        self.weights = state["weights"]
+        self.next_agent_id = state["next_agent_id"]
+        for name, state_state in state["states"].items():
+            getattr(self, name).set_state(state_state)
+        self.hpv.set_state(state["hpv"])
+        self.max_hpv_state.values = state["max_hpv_state"]
+        self.screening_state.values = state["screening_state"]
+        self.compliance_random = state["compliance_random"]
+        self.last_screen_age = state["last_screen_age"]
+        self.update_compliance()
+        for name, value in state["dicts"].items():
+            setattr(self.dicts, name, value)
+        self.hiv_detected = state["hiv_detected"]
+        self.hpv_vaccinations = state["hpv_vaccinations"]
+        self.rng.set_state(state["rng"])
+        self.state_changes.set_state(state["state_changes"])
+        self.events.set_state(state["events"])
+        self.splits.set_state(state["splits"])
+        self.life.update_living()
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.iteration_dir.joinpath("checkpoint.pickle")
+
+    def save_checkpoint(self, path: Path = None):
+        """ Save the state of the model to the iteration directory, so that the run can be resumed after a crash.
+        The file is written under a temporary name and then renamed, so a crash while writing never leaves a partial
+        checkpoint behind: The previous checkpoint remains until the new one is complete.
+
+        Args:
+            path (Path, optional): The checkpoint file. Defaults to `checkpoint_path`.
+        """
+        path = self.checkpoint_path if path is None else path
+        checkpoint = {"params": self.params.export_to_dict(), "state": self.get_state(copy_arrays=False)}
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(temporary_path, "wb") as openfile:
+            pickle.dump(checkpoint, openfile, protocol=pickle.HIGHEST_PROTOCOL)
+            openfile.flush()
+            os.fsync(openfile.fileno())
+        os.replace(temporary_path, path)
+        self.logger.info("Saved checkpoint at time {}".format(self.time))
+
+    def resume(self, path: Path = None) -> bool:
+        """ Continue from the checkpoint in the iteration directory, if there is a valid one. Checkpoints that
+        cannot be read or that were made with other parameters are ignored. Returns True if the model resumed.
+
+        Args:
+            path (Path, optional): The checkpoint file. Defaults to `checkpoint_path`.
+        """
+        path = self.checkpoint_path if path is None else path
+        if not path.exists():
+            return False
+        try:
+            with open(path, "rb") as openfile:
+                checkpoint = pickle.load(openfile)
+            if checkpoint["params"] != self.params.export_to_dict():
+                raise ValueError("The parameters have changed since the checkpoint was saved")
+            self.set_state(checkpoint["state"])
+        except Exception as e:
+            self.logger.warning("Ignoring checkpoint {}: {}".format(path, e))
+            return False
+        self.logger.info("Resumed from checkpoint at time {}".format(self.time))
+        return True
+
+    def structure_param(self, name: str):
+        value = getattr(self.params, name)
+        return value.export_to_dict() if isinstance(value, ParameterContainer) else value
+
+    def fork(self, scenario_dir: Path, iteration: int = None, logger: LoggerFactory = None) -> "CervicalModel":
+        """ Create a model of another scenario that continues from the current state of this model. Use this to
+        simulate the time steps that scenarios have in common once. See `set_state`.
+
+        Args:
+            scenario_dir (Path): Directory containing the input files of the new scenario
+            iteration (int, optional): The iteration of the new model. Defaults to the iteration of this model.
+            logger (LoggerFactory, optional): Logger of the new model. Defaults to the logger of this model.
+        """
+        model = CervicalModel(
+            scenario_dir,
+            self.iteration if iteration is None else iteration,
+            logger=self.logger if logger is None else logger,
+            seed=self.replicate_seeds[0],
+            replicate_seeds=self.replicate_seeds if self.replicates > 1 else None,
+            tables=self.tables,
+        )
+        model.set_state(self.get_state())
+        return model
+
     # ------ Additional Functions --------------------------------------------------------------------------------------
     def vaccinate(self, unique_id: int):
-        self.events.record_event((self.time, unique_id, Event.VACCINATION.value, self.params.vaccination.cost))
+        self.events.record_event(
+            (self.time, self.agent_ids[unique_id], Event.VACCINATION.value, self.params.vaccination.cost)
+        )
         self.hpv_vaccinations.add(unique_id)
         for item in self.hpv_strains:
             if HpvStrain(item).name != HpvStrain.LOW_RISK.name:
-                strain = self.hpv_strains[item]
-                strain.hpv_immunity[unique_id] = HpvImmunity.VACCINE.value
-                # Update transition probability
-                key = (
-                    self.age,
-                    item,
-                    strain.hpv_immunity[unique_id],
-                    strain.values[unique_id],
-                    self.hiv.values[unique_id],
-                )
-                strain.probabilities[unique_id] = strain.transition_probability_dict[key]
+                self.hpv_strains[item].hpv_immunity[unique_id] = HpvImmunity.VACCINE.value
+        # Update transition probability
+        self.hpv.update_agent_probabilities(unique_id)
 
     def treat_cin(self, unique_id: int):
         if unique_id not in self.dicts.cin_treatment_methods:
-            self.dicts.cin_treatment_methods[unique_id] = self.cin_treatment_method_factory.get_method()
+            self.dicts.cin_treatment_methods[unique_id] = self.cin_treatment_method_factory.get_method(unique_id)
 
         method = self.cin_treatment_method_factory.methods[self.dicts.cin_treatment_methods[unique_id]]
 
@@ -217,21 +593,22 @@ class CervicalModel:
             "cryo": Event.TREATMENT_CRYO,
         }
 
-        self.events.record_event((self.time, unique_id, events[method.name].value, method.params.cost))
+        self.events.record_event((self.time, self.agent_ids[unique_id], events[method.name].value, method.params.cost))
         # ----- If treatment is effective, all strains return to normal
-        if method.is_effective():
+        if method.is_effective(unique_id):
             for strain in self.hpv_strains:
                 if self.hpv_strains[strain].values[unique_id] != HpvState.NORMAL:
                     self.state_changes.record_event(
                         (
                             self.time,
-                            unique_id,
+                            self.agent_ids[unique_id],
                             HpvStrain(strain).int,
                             self.hpv_strains[strain].values[unique_id],
                             HpvState.NORMAL,
                         )
                     )
                     self.hpv_strains[strain].values[unique_id] = HpvState.NORMAL.value
+            self.max_hpv_state.values[unique_id] = HpvState.NORMAL.value
 
     def detect_cancer(self, unique_id: int):
         """ During a screening, an agents cancer was detected. Record this and update the agents value.
@@ -239,7 +616,13 @@ class CervicalModel:
         state_int = CancerDetectionState.int
         # Record state change
         self.state_changes.record_event(
-            (self.time, unique_id, state_int, self.cancer_detection.values[unique_id], CancerDetectionState.DETECTED)
+            (
+                self.time,
+                self.agent_ids[unique_id],
+                state_int,
+                self.cancer_detection.values[unique_id],
+                CancerDetectionState.DETECTED,
+            )
         )
         # Update value
         self.cancer_detection.values[unique_id] = CancerDetectionState.DETECTED.value
@@ -0,0 +1,334 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from model.hpv import MultiStrainHpv
+from model.parameters import Parameters
+from model.state import CancerDetectionState, CancerState, HivState, HpvImmunity, HpvState, HpvStrain, LifeState
+from model.tables import TransitionTables, table_steps
+
+NATURAL = HpvImmunity.NATURAL.value - 1
+VACCINE = HpvImmunity.VACCINE.value - 1
+HPV_NORMAL = HpvState.NORMAL.value - 1
+HPV_CANCER = HpvState.CANCER.value - 1
+LOCAL = CancerState.LOCAL.value - 1
+REGIONAL = CancerState.REGIONAL.value - 1
+DEAD = CancerState.DEAD.value - 1
+
+
+class CohortModel:
+    def __init__(self, scenario_dir: Path, iteration: int = 0, tables: TransitionTables = None):
+        """ Deterministic cohort version of CervicalModel. Instead of sampling agents, the expected number of agents in
+        each state is propagated with the same transition tables, in the same order as the agent model.
+            - Cancer free agents are grouped by (hiv, vaccinated). Within a group, each strain has its own
+              distribution over (immunity, hpv state). Agents with cancer are grouped by (hiv, detection, cancer)
+              and keep the distribution of the strain states they had when they got cancer.
+            - Approximation: Strains are treated as independent within a group. The agent model couples them, as
+              hiv infection and cancer (caused by any strain) depend on every strain of an agent. The expected
+              number of cancers given independent strains is exact, but mixing agents into a group (ex: when they
+              get hiv) averages their strain distributions.
+            - Screening is not simulated. Only scenarios without screening (ex: vaccination only) can be run.
+            - `prevalence` and `incidence` follow `Analysis`. Incidence counts every entry during the year, while
+              `Analysis` only counts the entries of agents still alive at the end of the year.
+
+        Args:
+            scenario_dir (Path): Directory containing the model's input files.
+            iteration (int, optional): The iteration, for iteration specific transition dictionaries. Defaults to 0.
+            tables (TransitionTables, optional): Transition tables to share with other models. Defaults to None.
+        """
+        self.scenario_dir = Path(scenario_dir)
+        self.params = Parameters()
+        self.params.update_from_file(self.scenario_dir.joinpath("parameters.yml"))
+        if self.params.screening.protocol != "none":
+            raise ValueError("The cohort model does not simulate screening")
+        self.transition_dir = self.scenario_dir.joinpath("transition_dictionaries")
+        iteration_transition_dir = self.scenario_dir.joinpath(f"iteration_{iteration}", "transition_dictionaries")
+        if iteration_transition_dir.exists():
+            self.transition_dir = iteration_transition_dir
+        self.tables = tables if tables is not None else TransitionTables()
+
+        # ----- Transition tables
+        steps = table_steps(self.params)
+        _, self.hpv_offsets, self.hpv_transition_probabilities, self.hpv_next_state_cdf = MultiStrainHpv.load_tables(
+            self.tables, self.transition_dir.joinpath("hpv_dictionary.pickle"), steps
+        )
+        self.life_array, self.life_offsets = self.tables.array(
+            self.transition_dir.joinpath("life_dictionary.pickle"), steps
+        )
+        self.hiv_dict = self.tables.load(self.transition_dir.joinpath("hiv_dictionary.pickle"), steps)
+        self.cancer_matrix = self.make_cancer_matrix(
+            self.tables.load(self.transition_dir.joinpath("cancer_dictionary.pickle"), steps, state_key=1)
+        )
+        detection_dict = self.tables.load(self.transition_dir.joinpath("cancer_detection_dictionary.pickle"), steps)
+        self.detection_probabilities = np.array([detection_dict[state.value] for state in CancerState], dtype=float)
+        # The agent model only sets the detection probability of an agent when Cancer.step changes its cancer state,
+        # so agents who are LOCAL (reached from HPV) keep a detection probability of 0
+        self.detection_probabilities[LOCAL] = 0
+        self.strains = [HpvStrain(row + self.hpv_offsets[0]) for row in range(len(HpvStrain))]
+        self.hpv_matrices = dict()
+
+        # ----- Expected number of agents
+        self.time = 0
+        self.age = self.params.initial_age
+        num_strains, num_hiv, num_immunity, num_hpv = len(HpvStrain), len(HivState), len(HpvImmunity), len(HpvState)
+        # Cancer free agents by (hiv, vaccinated), and each strain's (immunity, hpv state) distribution among them
+        self.free = np.zeros((num_hiv, 2))
+        self.free[0, 0] = self.params.num_agents
+        self.free_strains = np.zeros((num_strains, num_hiv, 2, num_immunity, num_hpv))
+        self.free_strains[..., 0, HPV_NORMAL] = 1
+        # Agents with cancer by (hiv, detection, cancer), and the number of them in each state of each strain
+        self.cancer = np.zeros((num_hiv, len(CancerDetectionState), len(CancerState)))
+        self.cancer_strains = np.zeros((num_strains,) + self.cancer.shape + (num_hpv,))
+
+        # ----- Output: The number of agents in each state after every time step, and the number of entries
+        self.fields = [HivState, CancerState, CancerDetectionState, LifeState]
+        self.occupancy_rows = []
+        self.entry_rows = []
+        self.entries = None
+
+    def make_cancer_matrix(self, cancer_dict: dict) -> np.array:
+        """ Create the cancer transition matrix of undetected agents, indexed by (from_state, to_state).
+        Like Cancer.step, only LOCAL and REGIONAL agents transition, and the current state is excluded before the
+        next state is drawn.
+        """
+        matrix = np.eye(len(CancerState))
+        for state in [LOCAL, REGIONAL]:
+            probabilities = np.array(cancer_dict[(CancerDetectionState.UNDETECTED.value, state + 1)], dtype=float)
+            stay = probabilities[state]
+            probabilities[state] = 0
+            if probabilities.sum() > 0:
+                matrix[state] = (1 - stay) * probabilities / probabilities.sum()
+                matrix[state, state] = stay
+        return matrix
+
+    def hpv_matrix(self, age: int) -> np.array:
+        """ Return the HPV transition matrix of every strain for an age, indexed by
+        (strain, hiv, immunity, state, to_immunity, to_state). Like MultiStrainHpv.step, returning to NORMAL builds
+        natural immunity.
+        """
+        if age not in self.hpv_matrices:
+            offsets = self.hpv_offsets
+            # --- (strain, immunity, state, hiv[, to_state]) -> (strain, hiv, immunity, state[, to_state])
+            transition = np.nan_to_num(self.hpv_transition_probabilities[:, age - offsets[1]])
+            transition = np.moveaxis(transition, -1, 1)
+            cdf = np.nan_to_num(self.hpv_next_state_cdf[:, age - offsets[1]])
+            next_state = np.moveaxis(np.diff(cdf, prepend=0, axis=-1), -2, 1)
+
+            num_immunity, num_hpv = transition.shape[2], transition.shape[3]
+            matrix = np.zeros(transition.shape + (num_immunity, num_hpv))
+            for immunity in range(num_immunity):
+                for state in range(num_hpv):
+                    moved = transition[:, :, immunity, state, None] * next_state[:, :, immunity, state]
+                    to_immunity = np.full(num_hpv, immunity)
+                    to_immunity[HPV_NORMAL] = max(immunity, NATURAL)
+                    # --- Agents without another state to move to remain where they are
+                    moved[:, :, state] += 1 - transition[:, :, immunity, state]
+                    to_immunity[state] = immunity
+                    matrix[:, :, immunity, state, to_immunity, np.arange(num_hpv)] = moved
+            self.hpv_matrices[age] = matrix
+        return self.hpv_matrices[age]
+
+    def run(self):
+        for _ in range(self.time, self.params.num_steps):
+            self.step()
+        self.entries = pd.DataFrame(self.entry_rows).fillna(0)
+        self.entries.index.name = "Time"
+        return self
+
+    def step(self):
+        if self.time % self.params.steps_per_year == 0:
+            self.yearly_update()
+        entries = dict()
+        self.step_hpv(entries)
+        self.step_hiv(entries)
+        self.step_cancer(entries)
+        self.step_cancer_detection(entries)
+        self.step_life(entries)
+        self.occupancy_rows.append(self.count_states())
+        self.entry_rows.append(entries)
+        self.time += 1
+
+    def yearly_update(self):
+        if self.time != 0:
+            self.age += 1
+        # ------ Vaccinate living agents, which gives vaccine immunity to every strain but LOW_RISK
+        p = self.params.vaccination.schedule.get(self.age, 0)
+        if p > 0:
+            vaccinated = self.free_strains[:, :, 0].copy()
+            high_risk = [row for row, strain in enumerate(self.strains) if strain != HpvStrain.LOW_RISK]
+            vaccinated[high_risk, :, VACCINE] = vaccinated[high_risk].sum(axis=2)
+            vaccinated[high_risk, :, :VACCINE] = 0
+            self.move_free(self.free[:, 0] * p, source=(slice(None), 0), target=(slice(None), 1), strains=vaccinated)
+
+    def move_free(self, count: np.array, source: tuple, target: tuple, strains: np.array):
+        """ Move cancer free agents between groups. The strain distributions of the target group become the average
+        of its agents and the moved agents, whose distributions are `strains`.
+        """
+        total = self.free[target] + count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mixed = (self.free[target][..., None, None] * self.free_strains[(slice(None),) + target] +
+                     count[..., None, None] * strains) / total[..., None, None]
+        self.free_strains[(slice(None),) + target] = np.where(total[..., None, None] > 0, mixed, strains)
+        self.free[source] -= count
+        self.free[target] = total
+
+    def step_hpv(self, entries: dict):
+        """ Every strain of cancer free agents transitions. Agents with a strain that reaches CANCER get LOCAL cancer.
+        """
+        matrix = self.hpv_matrix(self.age)
+        after = np.einsum("shvix,shixjy->shvjy", self.free_strains, matrix)
+        # --- Entries into each state, excluding agents who stay in their state
+        num_hpv = matrix.shape[-1]
+        moves = matrix * (1 - np.eye(num_hpv))[None, None, None, :, None, :]
+        flows = np.einsum("hv,shvix,shixjy->sy", self.free, self.free_strains, moves)
+        for row, strain in enumerate(self.strains):
+            entries.update({(strain.name, state + 1): flows[row, state] for state in range(num_hpv)})
+
+        states = after.sum(axis=3)
+        to_cancer = states[..., HPV_CANCER]
+        no_cancer = 1 - to_cancer
+        # --- Probability that none of the other strains reached cancer
+        others = np.stack([np.prod(np.delete(no_cancer, row, axis=0), axis=0) for row in range(len(no_cancer))])
+        cancer_free = no_cancer.prod(axis=0)
+        new_cancer = self.free * (1 - cancer_free)
+        # The strain states of new cancers: Everyone who reached a state, less those who remain cancer free
+        strains_of_new = states.copy()
+        strains_of_new[..., :HPV_CANCER] *= 1 - others[..., None]
+        strains_of_new[..., HPV_CANCER + 1 :] *= 1 - others[..., None]
+        self.cancer[:, CancerDetectionState.UNDETECTED - 1, LOCAL] += new_cancer.sum(axis=1)
+        self.cancer_strains[:, :, CancerDetectionState.UNDETECTED - 1, LOCAL] += np.einsum(
+            "hv,shvx->shx", self.free, strains_of_new
+        )
+        entries[(CancerState.id, CancerState.LOCAL.value)] = new_cancer.sum()
+
+        after[..., HPV_CANCER] = 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.free_strains = np.where(
+                no_cancer[..., None, None] > 0, after / no_cancer[..., None, None], self.free_strains
+            )
+        self.free = self.free * cancer_free
+
+    def step_hiv(self, entries: dict):
+        """ Living agents without hiv get hiv
+        """
+        if not self.params.include_hiv:
+            return
+        p = self.hiv_dict[(self.age,)]
+        normal, hiv = HivState.NORMAL.value - 1, HivState.HIV.value - 1
+        moved_free = self.free[normal] * p
+        self.move_free(moved_free, source=(normal,), target=(hiv,), strains=self.free_strains[:, normal])
+        moved_cancer = self.cancer[normal] * p
+        self.cancer[normal] -= moved_cancer
+        self.cancer[hiv] += moved_cancer
+        moved_strains = self.cancer_strains[:, normal] * p
+        self.cancer_strains[:, normal] -= moved_strains
+        self.cancer_strains[:, hiv] += moved_strains
+        entries[(HivState.id, HivState.HIV.value)] = moved_free.sum() + moved_cancer.sum()
+
+    def step_cancer(self, entries: dict):
+        """ Undetected LOCAL and REGIONAL cancers progress. Agents who reach the DEAD cancer state die.
+        """
+        undetected = CancerDetectionState.UNDETECTED - 1
+        moves = self.cancer_matrix * (1 - np.eye(len(CancerState)))
+        flows = np.einsum("hc,cd->d", self.cancer[:, undetected], moves)
+        for state in range(1, len(CancerState)):
+            key = (CancerState.id, state + 1)
+            entries[key] = entries.get(key, 0) + flows[state]
+        self.cancer[:, undetected] = self.cancer[:, undetected] @ self.cancer_matrix
+        self.cancer_strains[:, :, undetected] = np.einsum(
+            "shcx,cd->shdx", self.cancer_strains[:, :, undetected], self.cancer_matrix
+        )
+        entries[(LifeState.id, LifeState.DEAD.value)] = self.cancer[..., DEAD].sum()
+        self.cancer[..., DEAD] = 0
+        self.cancer_strains[..., DEAD, :] = 0
+
+    def step_cancer_detection(self, entries: dict):
+        """ Undetected cancers are detected
+        """
+        undetected, detected = CancerDetectionState.UNDETECTED - 1, CancerDetectionState.DETECTED - 1
+        moved = self.cancer[:, undetected] * self.detection_probabilities
+        self.cancer[:, undetected] -= moved
+        self.cancer[:, detected] += moved
+        moved_strains = self.cancer_strains[:, :, undetected] * self.detection_probabilities[:, None]
+        self.cancer_strains[:, :, undetected] -= moved_strains
+        self.cancer_strains[:, :, detected] += moved_strains
+        entries[(CancerDetectionState.id, CancerDetectionState.DETECTED.value)] = moved.sum()
+
+    def step_life(self, entries: dict):
+        """ Living agents die, based on their age, hiv, and cancer states
+        """
+        offsets = self.life_offsets
+        hiv = np.array([state.value for state in HivState]) - offsets[1]
+        cancer = np.array([state.value for state in CancerState]) - offsets[2]
+        death = self.life_array[self.age - offsets[0]][np.ix_(hiv, cancer)]
+        deaths = self.free.sum(axis=1) @ death[:, CancerState.NORMAL - 1] + (self.cancer * death[:, None]).sum()
+        self.free = self.free * (1 - death[:, CancerState.NORMAL - 1, None])
+        self.cancer = self.cancer * (1 - death[:, None])
+        self.cancer_strains = self.cancer_strains * (1 - death[:, None, :, None])
+        dead = (LifeState.id, LifeState.DEAD.value)
+        entries[dead] = entries.get(dead, 0) + deaths
+
+    def count_states(self) -> dict:
+        """ Return the number of living agents in each state of every field
+        """
+        free_states = np.einsum("hv,shvix->sx", self.free, self.free_strains)
+        strain_states = free_states + self.cancer_strains.sum(axis=(1, 2, 3))
+        counts = dict()
+        for row, strain in enumerate(self.strains):
+            counts.update({(strain.name, state + 1): strain_states[row, state] for state in range(len(HpvState))})
+        hiv = self.free.sum(axis=1) + self.cancer.sum(axis=(1, 2))
+        counts.update({(HivState.id, state.value): hiv[state - 1] for state in HivState})
+        cancer = self.cancer.sum(axis=(0, 1))
+        cancer[CancerState.NORMAL - 1] = self.free.sum()
+        counts.update({(CancerState.id, state.value): cancer[state - 1] for state in CancerState})
+        detection = self.cancer.sum(axis=(0, 2))
+        detection[CancerDetectionState.UNDETECTED - 1] += self.free.sum()
+        counts.update({(CancerDetectionState.id, state.value): detection[state - 1] for state in CancerDetectionState})
+        counts[(LifeState.id, LifeState.ALIVE.value)] = cancer.sum()
+        return counts
+
+    # ------ Analysis --------------------------------------------------------------------------------------------------
+    @property
+    def age_index(self) -> pd.Index:
+        ia = self.params.initial_age
+        return pd.Index(range(ia, int(self.params.num_steps / self.params.steps_per_year + 1) + ia))
+
+    def time_ages(self) -> np.array:
+        """ The age that `Analysis` assigns to each time step
+        """
+        return np.round(np.arange(len(self.occupancy_rows)) / self.params.steps_per_year).astype(int) + (
+            self.params.initial_age
+        )
+
+    def count_in(self, field: str, states: tuple) -> pd.Series:
+        """ Return a series containing the number of living agents who are in one of the given states at each age
+        """
+        states = states if isinstance(states, tuple) else (states,)
+        counts = pd.Series(
+            [sum(row.get((field, state), 0) for state in states) for row in self.occupancy_rows], index=self.time_ages()
+        )
+        # --- Like the timelines of `Analysis`: The state after the last time step of each age
+        counts = counts.groupby(level=0).last()
+        return counts.reindex(self.age_index).ffill()
+
+    def count_new(self, field: str, states: tuple) -> pd.Series:
+        """ Return a series containing the number of agents who entered one of the given states at each age
+        """
+        states = states if isinstance(states, tuple) else (states,)
+        counts = self.entries.reindex(columns=[(field, state) for state in states]).fillna(0).sum(axis=1)
+        counts.index = self.time_ages()
+        return counts.groupby(level=0).sum().reindex(self.age_index).fillna(0)
+
+    def prevalence(self, field: str, states: tuple) -> pd.Series:
+        """ Return a series containing the prevalence rate for the given states. See `Analysis.prevalence`.
+        """
+        return self.count_in(field, states) / self.count_in(LifeState.id, (LifeState.ALIVE.value,))
+
+    def incidence(self, field: str, states: tuple) -> pd.Series:
+        """ Return a series containing the incidence rate for the given states. See `Analysis.incidence`.
+        """
+        alive = self.count_in(LifeState.id, (LifeState.ALIVE.value,))
+        alive_count = alive.rolling(2).mean()
+        alive_count[self.params.initial_age] = alive[self.params.initial_age]
+        return self.count_new(field, states) / alive_count
@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class ProbabilityDependencies:
+    # --- The probabilities that must be recomputed for agents after each kind of change. Cancer onset (set by HPV)
+    # does not refresh the detection probability: It is only set as cancer progresses.
+    GRAPH = {
+        "hiv": ("hpv", "life"),
+        "cancer_onset": ("cancer", "life"),
+        "cancer_progression": ("cancer", "cancer_detection", "life"),
+    }
+
+    def __init__(self, model):
+        """ Recompute the probabilities of a state when the states they depend on change
+            - States report the agents whose state changed with `invalidate`. The agents are queued for every
+              probability that depends on the change (see GRAPH).
+            - `flush` recomputes each queued probability once, for all of its queued agents. The model flushes after
+              each state is stepped, so the next state sees up to date probabilities.
+            - Each dependent state provides `update_agent_probabilities(unique_ids)`
+        """
+        self.model = model
+        self.queue = {dependent: [] for dependents in self.GRAPH.values() for dependent in dependents}
+
+    def invalidate(self, change: str, unique_ids: np.array):
+        """ Queue the given agents for every probability that depends on `change`
+            - The agents are copied: Selections are views into kernel buffers that the next selection overwrites
+        """
+        if len(unique_ids) > 0:
+            unique_ids = np.array(unique_ids, copy=True)
+            for dependent in self.GRAPH[change]:
+                self.queue[dependent].append(unique_ids)
+
+    def flush(self):
+        """ Recompute the queued probabilities
+        """
+        for dependent, queued in self.queue.items():
+            if queued:
+                unique_ids = np.unique(np.concatenate(queued))
+                queued.clear()
+                getattr(self.model, dependent).update_agent_probabilities(unique_ids)
@@ -1,5 +1,3 @@
-import pickle
-
 import numpy as np
 
 from model.state import EventState, HivState
@@ -7,16 +5,18 @@ from model.state import EventState, HivState
 
 class Hiv(EventState):
     def __init__(self, model):
-        with (open(model.transition_dir.joinpath("hiv_dictionary.pickle"), "rb")) as openfile:
-            hiv_dict = pickle.load(openfile)
-        super().__init__(enum=HivState, transition_dict=hiv_dict)
+        path = model.transition_dir.joinpath("hiv_dictionary.pickle")
+        super().__init__(enum=HivState, transition_dict=model.tables.load(path, model.table_steps))
         """ HIV Status Tracker
             - Probability of HIV transition is based solely on age.
             - Probabilities should update yearly when the model changes a women's age
         """
+        # --- Dense table indexed by age
+        self.transition_array, self.key_offsets = model.tables.array(path, model.table_steps)
         self.model = model
+        self.rng = model.rng.stream("hiv")
         # No one has HIV
-        self.initiate(count=self.model.params.num_agents, state=HivState.NORMAL, dtype=np.int8)
+        self.initiate(count=self.model.num_agents, state=HivState.NORMAL, dtype=self.model.dtypes.state)
 
     def step(self):
         """ Simulate HIV Transitions
@@ -25,34 +25,26 @@ class Hiv(EventState):
             - Determine if HIV is detected
         """
         if self.model.params.include_hiv:
-            use_agents = self.model.unique_ids[self.model.life.living & (self.values == HivState.NORMAL)]
-            probabilities = self.probabilities[use_agents]
-            selected_agents = probabilities > self.model.rng.rand(len(probabilities))
-            for unique_id in self.model.unique_ids[use_agents][selected_agents]:
-                self.model.state_changes.record_event(
-                    (self.model.time, unique_id, HivState.int, HivState.NORMAL.value, HivState.HIV.value)
+            selected_agents = self.select_agents(self.model.life.living & (self.values == HivState.NORMAL))
+            detection = self.rng.for_agents(selected_agents, draw=1)
+            self.model.state_changes.record_events(
+                (
+                    self.model.time,
+                    self.model.agent_ids[selected_agents],
+                    HivState.int,
+                    HivState.NORMAL.value,
+                    HivState.HIV.value,
                 )
-                self.values[unique_id] = HivState.HIV.value
-                # --- HIV Detection
-                if self.model.rng.rand() < self.model.params.hiv_detection_rate:
-                    self.model.hiv_detected.add(unique_id)
-
-                # ----- Update the agents HPV transition probabilities
-                for strain in self.model.hpv_strains.values():
-                    key = (
-                        self.model.age,
-                        strain.strain,
-                        strain.hpv_immunity[unique_id],
-                        strain.values[unique_id],
-                        self.model.hiv.values[unique_id],
-                    )
-                    strain.probabilities[unique_id] = strain.transition_probability_dict[key]
+            )
+            self.values[selected_agents] = HivState.HIV.value
+            # --- HIV Detection
+            self.model.hiv_detected[selected_agents] = detection < self.model.params.hiv_detection_rate
 
-                # ----- Update the agents life probability
-                hiv = HivState.HIV.value
-                canc = self.model.cancer.values[unique_id]
-                self.model.life.probabilities[unique_id] = self.model.life.transition_dict[(self.model.age, hiv, canc)]
+            # ----- HPV transition and life probabilities follow the new state
+            self.model.dependencies.invalidate("hiv", selected_agents)
 
     def update_probabilities(self):
         if self.model.params.include_hiv:
-            self.probabilities = self.find_probabilities(keys=[(self.model.age,)] * len(self.model.unique_ids))
+            # --- Everyone has the same age
+            probability = self.find_probabilities(self.model.age)
+            self.probabilities = np.full(len(self.model.unique_ids), probability, dtype=self.model.dtypes.probability)
@@ -1,129 +1,280 @@
-import pickle
-from collections import defaultdict
-from copy import copy
+from pathlib import Path
 
 import numpy as np
 
-from model.misc_functions import filter_hpv_dict, normalize, random_selection
+from model.misc_functions import dict_to_array, filter_hpv_dict
 from model.state import CancerState, EventState, HpvImmunity, HpvState, HpvStrain
+from model.tables import TransitionTables
 
 
 class Hpv(EventState):
-    def __init__(self, model, strain):
-        with (open(model.transition_dir.joinpath("hpv_dictionary.pickle"), "rb")) as openfile:
-            hpv_dict = pickle.load(openfile)
-            strain_dict = filter_hpv_dict(hpv_dict, strain)
-        super().__init__(enum=HpvState, transition_dict=strain_dict)
+    def __init__(self, model, strain, transition_dict, stack):
+        super().__init__(enum=HpvState, transition_dict=transition_dict)
         """ HPV State Tracker
             - Probability of HPV transition is based on: age, strain, immunity, current strain status, and hiv status
             - Probability should update:
                 - Yearly (when the model changes the womens ages)
                 - When a women's current strain status changes (occurs within this class)
                 - When a women's HIV status changes (occurs within the HIV class)
+            - The arrays of this class are views into one row of the matrices held by MultiStrainHpv
         """
         self.model = model
         self.strain = strain
-        self.transition_probability_dict = self.make_transition_probabilities()
+        self.stack = stack
+        self.row = strain - stack.key_offsets[0]
+        # ----- Dense tables indexed by (age, immunity, state, hiv[, to_state]). The strain is fixed for this class.
+        self.key_offsets = stack.key_offsets[1:]
+        self.transition_array = stack.transition_array[self.row]
+        self.transition_probability_array = stack.transition_probability_array[self.row]
+        self.next_state_cdf = stack.next_state_cdf[self.row]
         self.probabilities = np.zeros(1)
-        self.agents_with_cancer = set()
+        self.hpv_immunity = None
 
     def step(self):
+        """ Simulate HPV transitions for this strain only. See MultiStrainHpv.step
+        """
+        self.stack.step(rows=np.array([self.row]))
+
+
+class MultiStrainHpv:
+    # --- Position of the current state in the keys of the HPV dictionary: (age, strain, immunity, state, hiv)
+    STATE_KEY = 3
+
+    def __init__(self, model):
+        path = model.transition_dir.joinpath("hpv_dictionary.pickle")
+        hpv_dict = model.tables.load(path, model.table_steps, self.STATE_KEY)
+        """ Simulate every HPV strain in one pass
+            - State, immunity, and transition probabilities are (strain x agent) matrices. Row i holds the strain
+              with value `i + key_offsets[0]`
+            - The Hpv class of each strain provides a single strain view of these matrices
+        """
+        self.model = model
+        self.rng = model.rng.stream("hpv")
+        # ----- Dense tables indexed by (strain, age, immunity, state, hiv[, to_state]). Shared between models.
+        self.transition_array, self.key_offsets, self.transition_probability_array, self.next_state_cdf = (
+            self.load_tables(model.tables, path, model.table_steps)
+        )
+        self.strain_ints = np.array([HpvStrain(row + self.key_offsets[0]).int for row in range(len(HpvStrain))])
+
+        self.strains = dict()
+        for strain in [item.value for item in HpvStrain]:
+            strain_dict = filter_hpv_dict(hpv_dict, strain)
+            self.strains[strain] = Hpv(model=model, strain=strain, transition_dict=strain_dict, stack=self)
+
+        self.values = None
+        self.hpv_immunity = None
+        self.probabilities = None
+        # --- One per strain when transitions are scheduled with waiting times
+        self.schedulers = None
+
+    def initiate(self, count: int):
+        """ Create the (strain x agent) matrices. Everyone starts out NORMAL with no immunity.
+        """
+        shape = (len(self.strains), count)
+        dtypes = self.model.dtypes
+        self.values = np.full(shape, HpvState.NORMAL.value, dtype=dtypes.state)
+        self.hpv_immunity = np.full(shape, HpvImmunity.NORMAL.value, dtype=dtypes.state)
+        self.probabilities = np.zeros(shape, dtype=dtypes.probability)
+        self.bind_views()
+
+    def compact(self, keep: np.array):
+        """ Keep only the agents at the given indices
+        """
+        self.values = self.values[:, keep]
+        self.hpv_immunity = self.hpv_immunity[:, keep]
+        self.probabilities = self.probabilities[:, keep]
+        self.bind_views()
+        if self.schedulers is not None:
+            for scheduler in self.schedulers:
+                scheduler.compact(keep)
+
+    def get_state(self) -> dict:
+        """ Return the (strain x agent) matrices. They are not copied.
+        """
+        return {
+            "values": self.values,
+            "hpv_immunity": self.hpv_immunity,
+            "probabilities": self.probabilities,
+            "schedulers": [scheduler.get_state() for scheduler in self.schedulers] if self.schedulers else None,
+        }
+
+    def set_state(self, state: dict):
+        self.values = state["values"]
+        self.hpv_immunity = state["hpv_immunity"]
+        self.probabilities = state["probabilities"]
+        self.bind_views()
+        if state["schedulers"] is not None:
+            for scheduler, scheduler_state in zip(self.schedulers, state["schedulers"]):
+                scheduler.set_state(scheduler_state)
+
+    def bind_views(self):
+        """ Point the arrays of each strain at its row of the matrices
+        """
+        for strain in self.strains.values():
+            strain.values = self.values[strain.row]
+            strain.hpv_immunity = self.hpv_immunity[strain.row]
+            strain.probabilities = self.probabilities[strain.row]
+
+    def step(self, rows: np.array = None):
         """ Simulate HPV transitions for each strain: Must be alive and cannot have cancer
         Those who do not have cancer are subject to transition.
+
+        Args:
+            rows (np.array, optional): The rows (strains) to simulate. Defaults to all strains.
         """
-        normal_status = self.model.cancer.values == CancerState.NORMAL
-        unique_ids = self.model.unique_ids[self.model.life.living & normal_status]
-        probabilities = self.probabilities[unique_ids]
-        selected_agents = unique_ids[probabilities > self.model.rng.rand(len(probabilities))]
-
-        # ----- Force a transition
-        for unique_id in selected_agents:
-            # --- Find the current status and make a change
-            current_state = self.values[unique_id]
-            hiv_status = self.model.hiv.values[unique_id]
-            key = (
-                self.model.age,
-                self.strain,
-                self.hpv_immunity[unique_id],
-                self.values[unique_id],
-                hiv_status,
-            )
-            probs_list = copy(self.transition_dict[key])
-            # --- Remove their current states probability
-            probs_list[current_state - 1] = 0
-            cdf = normalize(probs_list, return_cdf=True)
+        if rows is None:
+            rows = np.arange(len(self.strains))
+        kernels = self.model.kernels
+        eligible = self.model.life.living_cancer_free
+        if self.schedulers is None:
+            unique_ids = self.model.unique_ids[eligible]
+            random = self.rng.for_agents(unique_ids[None, :], draw=rows[:, None])
+            selected_rows, selected_agents = kernels.select_pairs(self.probabilities, rows, unique_ids, random)
+        else:
+            living = self.model.life.living
+            selected = [self.schedulers[row].select(self.probabilities[row], eligible, living) for row in rows]
+            selected_rows = np.repeat(rows, [len(agents) for agents in selected])
+            selected_agents = np.concatenate(selected)
+
+        # ----- Force a transition: Draw the new state from the conditional cdf that excludes the current state
+        random = self.rng.for_agents(selected_agents, draw=len(self.strains) + selected_rows)
+        current = self.values[selected_rows, selected_agents]
+        new = kernels.next_states(
+            self.next_state_cdf[:, self.model.age - self.key_offsets[1]],
+            self.values,
+            self.hpv_immunity,
+            self.model.hiv.values,
+            self.key_offsets[2:],
+            selected_rows,
+            selected_agents,
+            random,
+            HpvState.NORMAL.value,
+            current.dtype,
+        )
 
-            new = random_selection(random=self.model.rng.rand(), cdf=cdf, options=self.integers)
+        # --- Agents without another state to move to remain where they are
+        changed = new != current
+        selected_rows, selected_agents = selected_rows[changed], selected_agents[changed]
+        current, new = current[changed], new[changed]
 
-            self.model.state_changes.record_event(
-                (self.model.time, unique_id, HpvStrain(self.strain).int, self.values[unique_id], HpvState(new).value)
-            )
-            self.values[unique_id] = HpvState(new).value
-
-            # ----- Returning to normal builds some immunity to HPV
-            if new == HpvState.NORMAL:
-                self.hpv_immunity[unique_id] = max(self.hpv_immunity[unique_id], HpvImmunity.NATURAL.value)
-            # --- Cancer: record state change and update probability
-            elif new == HpvState.CANCER:
-                # Only move to cancer if agent does not already have cancer
-                if unique_id not in self.agents_with_cancer:
-                    self.agents_with_cancer.add(unique_id)
-                    # state change
-                    self.model.state_changes.record_event(
-                        (self.model.time, unique_id, CancerState.int, CancerState.NORMAL.value, CancerState.LOCAL.value)
-                    )
-                    # cancer progression probability
-                    key = (self.model.cancer_detection.values[unique_id], CancerState.LOCAL.value)
-                    self.model.cancer.probabilities[unique_id] = self.model.cancer.transition_probability_dict[key]
-                    # cancer status change
-                    self.model.cancer.values[unique_id] = CancerState.LOCAL.value
-                    hiv = self.model.hiv.values[unique_id]
-                    self.model.life.probabilities[unique_id] = self.model.life.transition_dict[
-                        (self.model.age, hiv, CancerState.LOCAL.value)
-                    ]
-
-            # ----- Update the transition_probabilities
-            key = (
-                self.model.age,
-                self.strain,
-                self.hpv_immunity[unique_id],
-                self.values[unique_id],
-                hiv_status,
+        self.model.state_changes.record_events(
+            (self.model.time, self.model.agent_ids[selected_agents], self.strain_ints[selected_rows], current, new)
+        )
+        self.values[selected_rows, selected_agents] = new
+
+        # ----- Returning to normal builds some immunity to HPV
+        to_normal = new == HpvState.NORMAL
+        normal_rows, normal_agents = selected_rows[to_normal], selected_agents[to_normal]
+        self.hpv_immunity[normal_rows, normal_agents] = np.maximum(
+            self.hpv_immunity[normal_rows, normal_agents], HpvImmunity.NATURAL.value
+        )
+
+        # --- Cancer: record state change and update probability. Several strains may reach cancer at once.
+        to_cancer = np.unique(selected_agents[new == HpvState.CANCER])
+        # Only move to cancer if agent does not already have cancer
+        to_cancer = to_cancer[self.model.cancer.values[to_cancer] == CancerState.NORMAL]
+        if len(to_cancer) > 0:
+            normal, local = CancerState.NORMAL.value, CancerState.LOCAL.value
+            self.model.state_changes.record_events(
+                (self.model.time, self.model.agent_ids[to_cancer], CancerState.int, normal, local)
             )
-            self.probabilities[unique_id] = self.transition_probability_dict[key]
+            # cancer status change. Cancer progression and death probabilities follow the new state.
+            self.model.cancer.values[to_cancer] = CancerState.LOCAL.value
+            self.model.life.get_cancer(to_cancer)
+            self.model.dependencies.invalidate("cancer_onset", to_cancer)
 
-    def make_transition_probabilities(self):
-        """ Create a dictionary of probabilities to transition (excluding the current state)
+        # ----- Update the transition_probabilities
+        self.probabilities[selected_rows, selected_agents] = self.find_transition_probabilities(
+            selected_rows, selected_agents
+        )
+        self.update_max_state(np.unique(selected_agents))
+
+    @staticmethod
+    def load_tables(tables: TransitionTables, path: Path, steps: int = 1) -> tuple:
+        """ Return the dense tables of an HPV dictionary file, creating them the first time. Returns the transition
+        array, its key offsets, the transition probabilities, and the next state cdf. See `TransitionTables.load`.
         """
-        probs = dict()
-        for k, v in self.transition_dict.items():
-            state = k[3]
-            probability_to_transition = 1 - v[state - 1]
-            probs[k] = probability_to_transition
-        return probs
+        return tables.get(
+            ("hpv", path.resolve(), steps),
+            lambda: MultiStrainHpv.make_tables(tables.load(path, steps, MultiStrainHpv.STATE_KEY)),
+        )
 
-    def update_probabilities(self):
-        """ Loop up each agents transition probability. Occurs once a year
-        """
-        keys = list(
-            zip(
-                [self.model.age] * len(self.model.unique_ids),
-                [self.strain] * len(self.model.unique_ids),
-                self.hpv_immunity.astype(int),
-                self.values.astype(int),
-                self.model.hiv.values.astype(int),
-            )
+    @staticmethod
+    def make_tables(hpv_dict: dict) -> tuple:
+        """ Create the dense tables of the HPV dictionary. See `load_tables`.
+        """
+        transition_array, offsets = dict_to_array(hpv_dict)
+        transition_array = np.ascontiguousarray(np.moveaxis(transition_array, 1, 0))
+        tables = (
+            transition_array,
+            tuple(offsets[[1, 0, 2, 3, 4]].tolist()),
+            MultiStrainHpv.make_transition_probabilities(transition_array),
+            MultiStrainHpv.make_next_state_cdf(transition_array),
         )
-        self.probabilities = np.zeros(len(self.model.unique_ids))
+        for table in tables:
+            if isinstance(table, np.ndarray):
+                table.setflags(write=False)
+        return tables
+
+    @staticmethod
+    def make_transition_probabilities(transition_array: np.array) -> np.array:
+        """ Create an array of probabilities to transition (excluding the current state), indexed by
+        (strain, age, immunity, state, hiv)
+        """
+        stay = np.diagonal(transition_array, axis1=-3, axis2=-1)
+        return np.ascontiguousarray(1 - np.moveaxis(stay, -1, -2))
 
-        locs = defaultdict(list)
-        for i, key in enumerate(keys):
-            locs[key].append(i)
+    @staticmethod
+    def make_next_state_cdf(transition_array: np.array) -> np.array:
+        """ Create an array with the cdf of the next state given that a transition occurs, indexed by
+        (strain, age, immunity, state, hiv, to_state). The current state is removed before normalizing. If no other
+        state can be reached, all of the probability is given to the current state.
+        """
+        probs = transition_array.copy()
+        states = np.arange(probs.shape[-1])
+        probs[..., states, :, states] = 0
+        stuck = probs.sum(axis=-1) == 0
+        probs[..., states, :, states] = np.moveaxis(stuck, -2, 0)
 
-        for key, value in locs.items():
-            self.probabilities[value] = self.transition_probability_dict[key]
+        cdf = np.cumsum(probs / probs.sum(axis=-1, keepdims=True), axis=-1)
+        cdf[..., -1] = 1
+        return cdf
 
-    def update_hpv_state(self):
-        self.model.max_hpv_state.values = np.vstack([[self.model.hpv_strains[s.value].values] for s in HpvStrain]).max(
-            axis=0
+    def table_index(self, rows, unique_ids) -> tuple:
+        """ Return the (strain, age, immunity, state, hiv) index into the transition arrays for the given rows and
+        agents. `rows` and `unique_ids` are broadcast against each other.
+        """
+        offsets = self.key_offsets
+        return (
+            rows,
+            self.model.age - offsets[1],
+            self.hpv_immunity[rows, unique_ids] - offsets[2],
+            self.values[rows, unique_ids] - offsets[3],
+            self.model.hiv.values[unique_ids] - offsets[4],
         )
+
+    def find_transition_probabilities(self, rows, unique_ids) -> np.array:
+        """ Look up the probability of transitioning out of the current state for the given rows and agents
+        """
+        return self.transition_probability_array[self.table_index(rows, unique_ids)]
+
+    def update_agent_probabilities(self, unique_ids):
+        """ Look up the transition probability of every strain for the given agents
+        """
+        rows = np.arange(len(self.strains)).reshape((-1,) + (1,) * np.ndim(unique_ids))
+        self.probabilities[:, unique_ids] = self.find_transition_probabilities(rows, unique_ids)
+
+    def update_probabilities(self):
+        """ Look up each agents transition probability for every strain. Occurs once a year
+        """
+        self.update_agent_probabilities(self.model.unique_ids)
+
+    def update_hpv_state(self):
+        """ Compute the most advanced HPV state of every agent
+        """
+        self.model.max_hpv_state.values = self.values.max(axis=0)
+
+    def update_max_state(self, unique_ids):
+        """ Recompute the most advanced HPV state of agents whose strain states changed
+        """
+        self.model.max_hpv_state.values[unique_ids] = self.values[:, unique_ids].max(axis=0)
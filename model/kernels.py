@@ -0,0 +1,198 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# ----- Loop kernels: Written as plain loops so that they can be compiled by numba ------------------------------------
+def select_loop(unique_ids, probabilities, random, out):
+    count = 0
+    for i in range(len(unique_ids)):
+        if probabilities[unique_ids[i]] > random[i]:
+            out[count] = unique_ids[i]
+            count += 1
+    return count
+
+
+def select_pairs_loop(probabilities, rows, unique_ids, random, out_rows, out_agents):
+    count = 0
+    for i in range(len(rows)):
+        for j in range(len(unique_ids)):
+            if probabilities[rows[i], unique_ids[j]] > random[i, j]:
+                out_rows[count] = rows[i]
+                out_agents[count] = unique_ids[j]
+                count += 1
+    return count
+
+
+def next_states_loop(cdf, values, immunity, hiv, offsets, rows, unique_ids, random, first_state, out):
+    for i in range(len(rows)):
+        row, unique_id = rows[i], unique_ids[i]
+        state_cdf = cdf[row, immunity[row, unique_id] - offsets[0], values[row, unique_id] - offsets[1]]
+        state_cdf = state_cdf[hiv[unique_id] - offsets[2]]
+        count = 0
+        for j in range(len(state_cdf)):
+            if state_cdf[j] <= random[i]:
+                count += 1
+        out[i] = first_state + count
+
+
+def draw_states_loop(cdf, rows, random, first_state, out):
+    for i in range(len(rows)):
+        count = 0
+        for j in range(cdf.shape[1]):
+            if cdf[rows[i], j] <= random[i]:
+                count += 1
+        out[i] = first_state + count
+
+
+# ----- Array kernels: The same operations written with NumPy ---------------------------------------------------------
+def select_array(unique_ids, probabilities, random, out):
+    selected = unique_ids[probabilities[unique_ids] > random]
+    out[: len(selected)] = selected
+    return len(selected)
+
+
+def select_pairs_array(probabilities, rows, unique_ids, random, out_rows, out_agents):
+    row_index, agent_index = np.nonzero(probabilities[np.ix_(rows, unique_ids)] > random)
+    out_rows[: len(row_index)] = rows[row_index]
+    out_agents[: len(agent_index)] = unique_ids[agent_index]
+    return len(row_index)
+
+
+def next_states_array(cdf, values, immunity, hiv, offsets, rows, unique_ids, random, first_state, out):
+    index = (
+        rows,
+        immunity[rows, unique_ids] - offsets[0],
+        values[rows, unique_ids] - offsets[1],
+        hiv[unique_ids] - offsets[2],
+    )
+    out[:] = (cdf[index] <= random[:, None]).sum(axis=1) + first_state
+
+
+def draw_states_array(cdf, rows, random, first_state, out):
+    out[:] = (cdf[rows] <= random[:, None]).sum(axis=1) + first_state
+
+
+class Kernels:
+    """ Step kernels shared by the model states. Each kernel takes its random numbers as input, so every backend
+    produces identical results from the same random stream.
+        - Results are written into preallocated buffers that are reused between steps. The arrays returned are views
+          into those buffers and are only valid until the kernel is called again.
+    """
+
+    name = None
+    select_kernel = None
+    select_pairs_kernel = None
+    next_states_kernel = None
+    draw_states_kernel = None
+
+    def __init__(self):
+        self.buffers = dict()
+
+    def buffer(self, name: str, size: int, dtype: type = np.int64) -> np.array:
+        """ Return a buffer with room for at least `size` values. Buffers grow but are never shrunk.
+        """
+        buffer = self.buffers.get(name)
+        if buffer is None or len(buffer) < size or buffer.dtype != dtype:
+            buffer = np.empty(max(size, 1), dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+    def select(self, unique_ids: np.array, probabilities: np.array, random: np.array) -> np.array:
+        """ Return the agents whose probability is larger than their random number
+
+        Args:
+            unique_ids (np.array): The agents to consider
+            probabilities (np.array): The probability of every agent
+            random (np.array): One random number per agent in `unique_ids`
+        """
+        out = self.buffer("select", len(unique_ids), unique_ids.dtype)
+        count = self.select_kernel(unique_ids, probabilities, random, out)
+        return out[:count]
+
+    def select_pairs(self, probabilities: np.array, rows: np.array, unique_ids: np.array, random: np.array) -> tuple:
+        """ Return the (row, agent) pairs of a (row x agent) probability matrix that are larger than their random
+        number. Pairs are ordered by row, then by agent.
+
+        Args:
+            probabilities (np.array): (row x agent) matrix of probabilities
+            rows (np.array): The rows to consider
+            unique_ids (np.array): The agents to consider
+            random (np.array): A (rows x unique_ids) matrix of random numbers
+        """
+        out_rows = self.buffer("select_pairs_rows", len(rows) * len(unique_ids), rows.dtype)
+        out_agents = self.buffer("select_pairs_agents", len(rows) * len(unique_ids), unique_ids.dtype)
+        count = self.select_pairs_kernel(probabilities, rows, unique_ids, random, out_rows, out_agents)
+        return out_rows[:count], out_agents[:count]
+
+    def next_states(
+        self, cdf, values, immunity, hiv, offsets, rows, unique_ids, random, first_state, dtype
+    ) -> np.array:
+        """ Draw the next HPV state of each (row, agent) pair from the cdf of its (row, immunity, state, hiv) key
+
+        Args:
+            cdf (np.array): The next state cdf for the current age, indexed by (row, immunity, state, hiv, to_state)
+            values (np.array): (row x agent) matrix of states
+            immunity (np.array): (row x agent) matrix of immunity
+            hiv (np.array): The hiv state of every agent
+            offsets (tuple): The offsets of the immunity, state, and hiv keys
+            rows (np.array): The row of each pair
+            unique_ids (np.array): The agent of each pair
+            random (np.array): One random number per pair
+            first_state (int): The state value of the first cdf column
+            dtype (type): The dtype of the returned states
+        """
+        out = self.buffer("next_states", len(rows), dtype)[: len(rows)]
+        self.next_states_kernel(cdf, values, immunity, hiv, offsets, rows, unique_ids, random, first_state, out)
+        return out
+
+    def draw_states(self, cdf: np.array, index: tuple, random: np.array, first_state: int, dtype: type) -> np.array:
+        """ Draw a state for each agent from the cdf at its index
+
+        Args:
+            cdf (np.array): The cdfs, indexed by (key dimensions..., to_state)
+            index (tuple): One array per key dimension, with one entry per agent
+            random (np.array): One random number per agent
+            first_state (int): The state value of the first cdf column
+            dtype (type): The dtype of the returned states
+        """
+        rows = np.ravel_multi_index(index, cdf.shape[:-1])
+        out = self.buffer("draw_states", len(rows), dtype)[: len(rows)]
+        self.draw_states_kernel(cdf.reshape(-1, cdf.shape[-1]), rows, random, first_state, out)
+        return out
+
+
+class NumpyKernels(Kernels):
+    name = "numpy"
+    select_kernel = staticmethod(select_array)
+    select_pairs_kernel = staticmethod(select_pairs_array)
+    next_states_kernel = staticmethod(next_states_array)
+    draw_states_kernel = staticmethod(draw_states_array)
+
+
+if numba is not None:
+
+    class NumbaKernels(Kernels):
+        name = "numba"
+        select_kernel = staticmethod(numba.njit(cache=True, nogil=True)(select_loop))
+        select_pairs_kernel = staticmethod(numba.njit(cache=True, nogil=True)(select_pairs_loop))
+        next_states_kernel = staticmethod(numba.njit(cache=True, nogil=True)(next_states_loop))
+        draw_states_kernel = staticmethod(numba.njit(cache=True, nogil=True)(draw_states_loop))
+
+
+backends = {"numpy": NumpyKernels}
+if numba is not None:
+    backends["numba"] = NumbaKernels
+
+
+def make_kernels(backend: str, logger=None) -> Kernels:
+    """ Create the kernels of the requested backend. Falls back to NumPy if numba is not installed.
+    """
+    if backend == "numba" and numba is None:
+        if logger is not None:
+            logger.warning("numba is not installed. Using the numpy kernels instead.")
+        backend = "numpy"
+    return backends[backend]()
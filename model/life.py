@@ -1,8 +1,6 @@
-import pickle
-
 import numpy as np
 
-from model.state import EventState, LifeState
+from model.state import CancerState, EventState, LifeState
 
 
 class Life(EventState):
@@ -11,36 +9,76 @@ class Life(EventState):
             - Probability of dying is based on age and cancer status and should be updated:
                 - Yearly (when the model changes the women's ages)
                 - On cancer status event change
+            - Keeps views of the living population that are updated as agents die or get cancer:
+                - living: mask of living agents
+                - living_ids: index array of living agents
+                - living_cancer_free: mask of living agents whose cancer state is NORMAL
         """
-        with open(model.transition_dir.joinpath("life_dictionary.pickle"), "rb") as openfile:
-            life_dict = pickle.load(openfile)
-        super().__init__(enum=LifeState, transition_dict=life_dict)
+        path = model.transition_dir.joinpath("life_dictionary.pickle")
+        super().__init__(enum=LifeState, transition_dict=model.tables.load(path, model.table_steps))
+        # --- Dense table indexed by (age, hiv, cancer)
+        self.transition_array, self.key_offsets = model.tables.array(path, model.table_steps)
 
         self.model = model
+        self.rng = model.rng.stream("life")
         # Everyone starts out alive
-        self.initiate(count=model.params.num_agents, state=LifeState.ALIVE, dtype=np.int8)
+        self.initiate(count=model.num_agents, state=LifeState.ALIVE, dtype=model.dtypes.state)
         self.living = self.values == LifeState.ALIVE
+        self.living_cancer_free = None
+        self._living_ids = None
+        self._living_ids_stale = False
 
     def step(self):
         """ Simulate life change for all living agents.
             - Find the probability of death for each agent
             - Record a state change if they die
         """
-        self.update_living()
-        use_agents = self.model.unique_ids[self.living]
-        probabilities = self.probabilities[use_agents]
-        selected_agents = probabilities > self.model.rng.rand(len(probabilities))
-        for unique_id in self.model.unique_ids[use_agents][selected_agents]:
-            self.model.state_changes.record_event(
-                (self.model.time, unique_id, LifeState.int, LifeState.ALIVE.value, LifeState.DEAD.value)
-            )
-            self.values[unique_id] = LifeState.DEAD.value
+        self.die(self.select_agents(self.living, use_agents=self.living_ids))
+
+    def die(self, unique_ids: np.array):
+        """ Record the death of the given agents and remove them from the living views
+        """
+        alive, dead = LifeState.ALIVE.value, LifeState.DEAD.value
+        self.model.state_changes.record_events(
+            (self.model.time, self.model.agent_ids[unique_ids], LifeState.int, alive, dead)
+        )
+        self.values[unique_ids] = LifeState.DEAD.value
+        self.living[unique_ids] = False
+        self.living_cancer_free[unique_ids] = False
+        self._living_ids_stale = self._living_ids_stale or len(unique_ids) > 0
+
+    def get_cancer(self, unique_ids: np.array):
+        """ Remove agents who moved out of the NORMAL cancer state from the cancer free view
+        """
+        self.living_cancer_free[unique_ids] = False
+
+    @property
+    def living_ids(self) -> np.array:
+        """ Index array of the living agents. Rebuilt from the previous array after deaths occur.
+        """
+        if self._living_ids_stale:
+            self._living_ids = self._living_ids[self.living[self._living_ids]]
+            self._living_ids_stale = False
+        return self._living_ids
 
     def update_living(self):
+        """ Rebuild the living views from the state arrays. Only required if states are changed directly.
+        """
         self.living = self.values == LifeState.ALIVE
+        self.living_cancer_free = self.living & (self.model.cancer.values == CancerState.NORMAL)
+        self._living_ids = self.model.unique_ids[self.living]
+        self._living_ids_stale = False
+
+    def find_agent_probabilities(self, unique_ids: np.array) -> np.array:
+        """ Look up the probability of death of the given agents from their current hiv and cancer states
+        """
+        return self.find_probabilities(
+            self.model.age, self.model.hiv.values[unique_ids], self.model.cancer.values[unique_ids]
+        )
+
+    def update_agent_probabilities(self, unique_ids: np.array):
+        self.probabilities[unique_ids] = self.find_agent_probabilities(unique_ids)
 
     def update_probabilities(self):
-        ages = [self.model.age] * self.model.params.num_agents
-        hiv_state = self.model.hiv.values.astype(int)
-        cancer_status = self.model.cancer.values.astype(int)
-        self.probabilities = self.find_probabilities(keys=list(zip(ages, hiv_state, cancer_status)))
+        probabilities = self.find_probabilities(self.model.age, self.model.hiv.values, self.model.cancer.values)
+        self.probabilities = probabilities.astype(self.model.dtypes.probability, copy=False)
@@ -0,0 +1,90 @@
+import numpy as np
+
+from model.scheduler import WaitingTimeScheduler
+
+DTYPE_PROFILES = {
+    # --- The dtypes NumPy uses by default. Recorded events keep the dtypes that NumPy infers.
+    "default": {
+        "probability": np.float64,
+        "id": np.int64,
+        "state": np.int8,
+        "time": None,
+        "agent_time": np.int32,
+        "age": np.int16,
+    },
+    # --- Half the memory per agent: Probabilities lose precision below 1e-7, runs are limited to 65535 time steps, and
+    # ages to 127
+    "compact": {
+        "probability": np.float32,
+        "id": np.uint32,
+        "state": np.int8,
+        "time": np.uint16,
+        "agent_time": np.uint16,
+        "age": np.int8,
+    },
+}
+
+EVENT_COLUMNS = {
+    "Time": "time",
+    "Unique_ID": "id",
+    "Parent_ID": "id",
+    "State_ID": "state",
+    "From": "state",
+    "To": "state",
+    "Event": "state",
+}
+
+
+class DtypeProfile:
+    def __init__(self, name: str, num_steps: int, max_age: int = None):
+        """ The dtypes of the agent arrays and recorded events, used consistently by every state of the model
+            - probability: Transition probabilities, random numbers kept per agent, and agent weights
+            - id: Unique_IDs and agent indices
+            - state: State values
+            - time: Time steps of recorded events
+            - agent_time: Time steps kept per agent (ex: the time of cancer detection)
+            - age: Ages kept per agent. Signed, so that -1 can mark a missing age.
+
+        Args:
+            name (str): A key of DTYPE_PROFILES
+            num_steps (int): The number of time steps of the run, which must fit in the time dtypes
+            max_age (int, optional): The oldest age reached by the run, which must fit in the age dtype. Defaults to
+                None.
+        """
+        if name not in DTYPE_PROFILES:
+            raise ValueError("Unknown memory profile {}. Use one of: {}".format(name, ", ".join(DTYPE_PROFILES)))
+        self.name = name
+        profile = DTYPE_PROFILES[name]
+        self.probability = profile["probability"]
+        self.id = profile["id"]
+        self.state = profile["state"]
+        self.time = profile["time"]
+        self.agent_time = profile["agent_time"]
+        self.age = profile["age"]
+        for dtype in [self.time, self.agent_time]:
+            if dtype is not None and num_steps > np.iinfo(dtype).max:
+                raise ValueError("The {} memory profile supports up to {} time steps".format(name, np.iinfo(dtype).max))
+        if max_age is not None and max_age > np.iinfo(self.age).max:
+            raise ValueError("The {} memory profile supports ages up to {}".format(name, np.iinfo(self.age).max))
+
+    def event_dtypes(self, column_names: list) -> list:
+        """ Return the dtype of each column of an EventStorage, or None to keep the dtypes that NumPy infers
+        """
+        if self.name == "default":
+            return None
+        return [getattr(self, EVENT_COLUMNS[name]) if name in EVENT_COLUMNS else None for name in column_names]
+
+
+def array_bytes(*objects) -> int:
+    """ Return the number of bytes of the arrays held by the objects, including those of their schedulers. Read only
+    arrays are shared transition tables, and are not counted.
+    """
+    total = 0
+    for obj in objects:
+        for value in vars(obj).values():
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, np.ndarray) and item.flags.writeable:
+                    total += item.nbytes
+                elif isinstance(item, WaitingTimeScheduler):
+                    total += array_bytes(item)
+    return total
@@ -52,6 +52,62 @@ def filter_hpv_dict(hpv_dict, strain):
     return new_dict
 
 
+def dict_to_array(transition_dict: dict, drop_dims: tuple = ()) -> (np.array, np.array):
+    """ Convert a dictionary keyed by integer tuples into a dense array with one axis per key dimension.
+    Values that are lists become a trailing axis. Combinations missing from the dictionary are filled with NaN.
+
+    Parameters
+    ----------
+    transition_dict : dictionary with integer tuple keys. Ex {(age, strain, immunity, state, hiv): [p1, p2, ...]}
+    drop_dims : key dimensions to leave out of the array. Should only contain dimensions with a single value.
+
+    Returns the array and the offsets that must be subtracted from each remaining key dimension to index it.
+    """
+    keys = np.array(list(transition_dict.keys()), dtype=np.int64).reshape(len(transition_dict), -1)
+    keep = [i for i in range(keys.shape[1]) if i not in drop_dims]
+    keys = keys[:, keep]
+    offsets = keys.min(axis=0)
+    shape = tuple(keys.max(axis=0) - offsets + 1)
+
+    values = np.array(list(transition_dict.values()), dtype=np.float64)
+    array = np.full(shape + values.shape[1:], np.nan)
+    array[tuple((keys - offsets).T)] = values
+    return array, offsets
+
+
+def power_transition_dict(transition_dict: dict, steps: int, state_key: int = None) -> dict:
+    """ Convert a dictionary of transition probabilities per time step into probabilities over `steps` time steps.
+
+    Parameters
+    ----------
+    transition_dict : dictionary of probabilities. Values are either the probability of a single transition (ex: death),
+        which becomes 1 - (1 - p) ** steps, or the row of a transition matrix for the state at `state_key`.
+    steps : the number of time steps of the dictionary in one new time step
+    state_key : position of the current state in the keys of a dictionary of rows. The rows of keys that only differ
+        in the current state form a transition matrix, which is raised to the power `steps`. States without a row
+        remain in their state.
+
+    Returns a new dictionary with the same keys.
+    """
+    if steps == 1:
+        return transition_dict
+    if state_key is None:
+        return {key: 1 - (1 - value) ** steps for key, value in transition_dict.items()}
+
+    matrices = dict()
+    for key, row in transition_dict.items():
+        matrices.setdefault(key[:state_key] + key[state_key + 1 :], dict())[key[state_key]] = row
+    powered = dict()
+    for other_keys, rows in matrices.items():
+        matrix = np.eye(len(next(iter(rows.values()))))
+        for state, row in rows.items():
+            matrix[state - 1] = row
+        matrix = np.linalg.matrix_power(matrix, steps)
+        for state in rows:
+            powered[other_keys[:state_key] + (state,) + other_keys[state_key:]] = list(matrix[state - 1])
+    return powered
+
+
 class Dynamic2DArray:
     """
     Expandable numpy array designed to be faster than np.append.
@@ -90,17 +146,28 @@ class Dynamic2DArray:
 
 
 class EventStorage:
-    def __init__(self, column_names: list, store_events: bool = True):
+    flush_size = 65536
+    initial_capacity = 1024
+
+    def __init__(self, column_names: list, store_events: bool = True, dtypes: list = None):
         """EventStorage is used to record changes to state variables or to record events in a model
+            - Events are written into one preallocated buffer per column. Buffers double in size when they are full.
+            - Columns without a dtype are promoted as needed, like `np.concatenate` would.
 
         Args:
             column_names (list): A list of the column names
             store_events (bool, optional): Should events be stored. Defaults to True. This parameter can be used to
                 turn off storing of events to save time and memory.
+            dtypes (list, optional): The dtype of each column. None keeps the dtype that NumPy infers. Defaults to
+                None.
         """
         self.store_events = store_events
         self.column_names = column_names
+        self.dtypes = dtypes if dtypes is not None else [None] * len(column_names)
         self.data = []
+        # --- The column buffers are created with the first events, and hold `size` events
+        self.columns = None
+        self.size = 0
 
     def record_event(self, row: tuple):
         """Record a change to a state variable
@@ -110,7 +177,73 @@ class EventStorage:
         """
         if self.store_events:
             self.data.append(row)
+            # --- Rows are Python tuples, which take several times the memory of arrays
+            if len(self.data) >= self.flush_size:
+                self._flush()
+
+    def record_events(self, columns: tuple):
+        """Record many changes at once. Rows keep their order relative to those added with `record_event`.
+
+        Args:
+            columns (tuple): One array of values per column. Must match the length of `self.column_names`. Scalars
+                are repeated for every row.
+        """
+        if self.store_events:
+            self._flush()
+            self._write(np.broadcast_arrays(*columns))
+
+    def _write(self, columns: list):
+        """ Copy one array per column to the end of the column buffers """
+        columns = [np.asarray(column) for column in columns]
+        if self.columns is None:
+            self.columns = [
+                np.empty(max(len(columns[0]), self.initial_capacity), dtype=dtype or column.dtype)
+                for column, dtype in zip(columns, self.dtypes)
+            ]
+        end = self.size + len(columns[0])
+        for i, (column, dtype) in enumerate(zip(columns, self.dtypes)):
+            buffer = self.columns[i]
+            new_dtype = buffer.dtype if dtype is not None else np.result_type(buffer.dtype, column.dtype)
+            if len(buffer) < end or new_dtype != buffer.dtype:
+                grown = np.empty(max(end, 2 * len(buffer)), dtype=new_dtype)
+                grown[: self.size] = buffer[: self.size]
+                self.columns[i] = buffer = grown
+            buffer[self.size : end] = column
+        self.size = end
+
+    def _flush(self):
+        """ Move the individually recorded rows into the column buffers """
+        if self.data:
+            self._write([np.array(column, dtype=dtype) for column, dtype in zip(zip(*self.data), self.dtypes)])
+            self.data = []
+
+    def nbytes(self) -> int:
+        """ Return the number of bytes of the column buffers, including the room that is not used yet """
+        self._flush()
+        return sum(column.nbytes for column in self.columns) if self.columns is not None else 0
+
+    def get_state(self) -> list:
+        """ Return the recorded events, as a list of chunks of column arrays. The arrays are views of the buffers. """
+        self._flush()
+        if self.columns is None:
+            return []
+        return [[column[: self.size] for column in self.columns]]
+
+    def set_state(self, state: list):
+        """ Replace the recorded events with those returned by `get_state` """
+        self.data = []
+        self.columns = None
+        self.size = 0
+        for chunk in state:
+            self._write(chunk)
 
     def make_events(self) -> pd.DataFrame:
         """ Convert the array to a DataFrame """
-        return pd.DataFrame(self.data, columns=self.column_names)
+        self._flush()
+        if self.columns is None and any(dtype is not None for dtype in self.dtypes):
+            return pd.DataFrame(
+                {name: np.array([], dtype=dtype or object) for name, dtype in zip(self.column_names, self.dtypes)}
+            )
+        if self.columns is None:
+            return pd.DataFrame([], columns=self.column_names)
+        return pd.DataFrame({name: column[: self.size].copy() for name, column in zip(self.column_names, self.columns)})
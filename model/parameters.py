@@ -71,16 +71,55 @@ class Parameters(ParameterContainer):
         self.add_param("num_agents", 100)
         self.add_param("num_steps", 120)
         self.add_param("steps_per_year", 12)
+        # Time steps per year of the transition dictionaries. With fewer steps_per_year, they are converted to the
+        # longer time step with matrix powers.
+        self.add_param("table_steps_per_year", 12)
         self.add_param("initial_age", 9)
         self.add_param("seed", 1111)
         self.add_param("hiv_detection_rate", 1)
         self.add_param("include_hiv", True)
-
+        # Years between packing the agent arrays down to living agents. 0 turns compaction off.
+        self.add_param("compaction_interval", 0)
+        # Backend of the step kernels: "numpy" or "numba". Both produce identical results.
+        self.add_param("kernel_backend", "numpy")
+        # Dtypes of the agent arrays and recorded events: "default" or "compact" (float32 probabilities, uint32 ids,
+        # uint16 times). See model/memory.py.
+        self.add_param("memory_profile", "default")
+        # Draw geometric waiting times until each agent's next transition instead of a random number every month
+        self.add_param("sample_waiting_times", False)
+        # Years between saving a checkpoint to the iteration directory, to resume from after a crash. 0 turns it off.
+        self.add_param("checkpoint_interval", 0)
+
+        self.add_param("rng", RngParameters())
+        self.add_param("importance", ImportanceParameters())
         self.add_param("vaccination", VaccinationParameters())
         self.add_param("screening", ScreeningParameters())
         self.add_param("treatment", TreatmentParameters())
 
 
+class RngParameters(ParameterContainer):
+    def __init__(self):
+        super().__init__()
+        # "pcg64", "philox", or "legacy" (a single RandomState stream shared by every subsystem)
+        self.add_param("bit_generator", "pcg64")
+        self.add_param("buffer_size", 4096)
+        # Key the draws made for agents by (seed, Unique_ID, time step, decision), so that scenarios run with the same
+        # seed share their random numbers
+        self.add_param("common_random_numbers", False)
+
+
+class ImportanceParameters(ParameterContainer):
+    def __init__(self):
+        super().__init__()
+        # Split each high risk agent into this many agents, that share its weight and history but continue
+        # independently. Rare outcomes are then simulated more often in the high risk agents. 1 turns splitting off.
+        self.add_param("split_factor", 1)
+        # Agents with HIV are high risk
+        self.add_param("split_hiv", True)
+        # Agents with a strain other than LOW_RISK in this HpvState (value) or worse are high risk. 0 turns it off.
+        self.add_param("split_hpv_state", 0)
+
+
 class ScreeningParameters(ParameterContainer):
     def __init__(self):
         super().__init__()
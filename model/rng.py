@@ -0,0 +1,283 @@
+import zlib
+
+import numpy as np
+
+MASK_64 = 2 ** 64 - 1
+
+
+def hash_uniform(*keys) -> np.array:
+    """ Counter-based uniform random numbers: Each value is a hash of its keys, so the same keys always give the same
+    number. Keys are integers or integer arrays and are broadcast against each other. Uses the splitmix64 mixer.
+    """
+    keys = np.broadcast_arrays(*[np.asarray(key, dtype=np.uint64) for key in keys])
+    h = np.zeros(keys[0].shape, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for key in keys:
+            h = h + key + np.uint64(0x9E3779B97F4A7C15)
+            h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+            h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+            h = h ^ (h >> np.uint64(31))
+    # --- Use the top 53 bits, like Generator.random
+    return (h >> np.uint64(11)) * (1.0 / 2 ** 53)
+
+
+def hash_uniform_scalar(*keys) -> float:
+    """ hash_uniform for scalar keys, using Python integers. Much faster than NumPy for a single value.
+    """
+    h = 0
+    for key in keys:
+        h = (h + int(key) + 0x9E3779B97F4A7C15) & MASK_64
+        h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+        h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & MASK_64
+        h = h ^ (h >> 31)
+    return (h >> 11) * (1.0 / 2 ** 53)
+
+
+class RandomStream:
+    def __init__(self, generator, buffer_size: int = 4096, service=None, key: int = 0):
+        """ Uniform random numbers for one subsystem, handed out from a pre-generated buffer
+            - Large requests are served from the buffer first and the generator second, so the values of a stream
+              depend only on how many values were drawn before them, not on how the requests were sized.
+            - A buffer_size of 0 draws every number directly from the generator
+            - Provides the parts of the RandomState API used by the model: rand, random, and choice
+            - Draws made for specific agents use `for_agents`. With common random numbers, those are keyed by the
+              agent, the time step, the stream, and the draw, instead of coming from the generator.
+        """
+        self.generator = generator
+        self.buffer_size = buffer_size
+        self.service = service
+        self.key = key
+        self.buffer = np.zeros(0)
+        self.position = 0
+
+    def uniform(self, count: int) -> np.array:
+        """ Return the next `count` uniform random numbers of the stream
+        """
+        available = len(self.buffer) - self.position
+        if count <= available:
+            values = self.buffer[self.position : self.position + count]
+            self.position += count
+            return values
+        head = self.buffer[self.position :]
+        remaining = count - available
+        if remaining >= self.buffer_size:
+            # --- Too large to buffer: Draw directly and leave the buffer empty
+            self.buffer, self.position = np.zeros(0), 0
+            return np.concatenate([head, self.generator.random(remaining)])
+        # New buffers are always new arrays, so values handed out earlier are never overwritten
+        self.buffer, self.position = self.generator.random(self.buffer_size), remaining
+        return np.concatenate([head, self.buffer[:remaining]])
+
+    def random(self, size=None):
+        """ Return a single random number, or an array of them if `size` is given
+        """
+        if size is not None:
+            return self.rand(*np.atleast_1d(size))
+        if self.buffer_size == 0:
+            return self.generator.random()
+        if self.position == len(self.buffer):
+            self.buffer, self.position = self.generator.random(self.buffer_size), 0
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+    def rand(self, *shape):
+        """ Return an array of random numbers with the given shape, or a single number if no shape is given
+        """
+        if len(shape) == 0:
+            return self.random()
+        return self.uniform(int(np.prod(shape))).reshape(shape)
+
+    def choice(self, options: list, p: list = None):
+        """ Select one of the options, with probabilities `p` if given
+        """
+        return self._choose(options, p, self.random())
+
+    @staticmethod
+    def _choose(options: list, p: list, random: float):
+        if p is None:
+            return options[int(random * len(options))]
+        cdf = np.cumsum(p)
+        cdf /= cdf[-1]
+        return options[min(np.searchsorted(cdf, random, side="right"), len(options) - 1)]
+
+    def for_agents(self, unique_ids: np.array, draw=0) -> np.array:
+        """ Return one random number for each agent. `draw` separates the decisions made with a stream in the same
+        time step and is broadcast against `unique_ids`, as is the shape of the result.
+        """
+        if self.service is not None and self.service.common_random_numbers:
+            return self.service.agent_uniform(self.key, unique_ids, draw)
+        return self.rand(*np.broadcast_shapes(np.shape(unique_ids), np.shape(draw)))
+
+    def for_agent(self, unique_id: int = None, draw: int = 0) -> float:
+        """ Return a random number for a single agent. See `for_agents`. Without an agent, this is `random()`.
+        """
+        if unique_id is not None and self.service is not None and self.service.common_random_numbers:
+            return self.service.agent_uniform(self.key, unique_id, draw)
+        return self.random()
+
+    def choice_for_agent(self, unique_id: int, options: list, p: list = None, draw: int = 0):
+        """ Select one of the options for a single agent. See `for_agents`.
+        """
+        return self._choose(options, p, self.for_agent(unique_id, draw))
+
+    def get_state(self) -> dict:
+        """ Return the state of the stream: Its buffer and the state of its generator. A shared legacy generator is
+        saved by the service instead.
+        """
+        state = {"buffer": self.buffer, "position": self.position, "bit_generator": None}
+        if isinstance(self.generator, np.random.Generator):
+            state["bit_generator"] = self.generator.bit_generator.state
+        return state
+
+    def set_state(self, state: dict):
+        self.buffer = state["buffer"]
+        self.position = state["position"]
+        if state["bit_generator"] is not None:
+            self.generator.bit_generator.state = state["bit_generator"]
+
+
+class ReplicateStream:
+    def __init__(self, streams: list, service):
+        """ A named stream of a stacked model: One stream per replicate
+            - Draws made for agents come from the stream of each agent's replicate, so every replicate draws the
+              same numbers as a model that simulates it alone
+            - Draws that are not made for agents come from the stream of the first replicate
+        """
+        self.streams = streams
+        self.service = service
+
+    def rand(self, *shape):
+        return self.streams[0].rand(*shape)
+
+    def random(self, size=None):
+        return self.streams[0].random(size)
+
+    def choice(self, options: list, p: list = None):
+        return self.streams[0].choice(options, p=p)
+
+    def for_agents(self, unique_ids: np.array, draw=0) -> np.array:
+        unique_ids, draw = np.broadcast_arrays(unique_ids, draw)
+        replicates = self.service.replicate_of(unique_ids)
+        values = np.zeros(unique_ids.shape)
+        # --- Selecting one replicate keeps the (row major) order of its agents
+        for replicate, stream in enumerate(self.streams):
+            selected = replicates == replicate
+            if selected.any():
+                values[selected] = stream.for_agents(unique_ids[selected], draw=draw[selected])
+        return values
+
+    def for_agent(self, unique_id: int = None, draw: int = 0) -> float:
+        if unique_id is None:
+            return self.random()
+        return self.streams[self.service.replicate_of(unique_id)].for_agent(unique_id, draw)
+
+    def choice_for_agent(self, unique_id: int, options: list, p: list = None, draw: int = 0):
+        return RandomStream._choose(options, p, self.for_agent(unique_id, draw))
+
+
+class RandomService:
+    bit_generators = {"pcg64": np.random.PCG64, "philox": np.random.Philox}
+
+    def __init__(
+        self,
+        seed: int,
+        bit_generator: str = "pcg64",
+        buffer_size: int = 4096,
+        common_random_numbers: bool = False,
+        model=None,
+        replicate_seeds: list = None,
+    ):
+        """ Provide every subsystem of the model with its own stream of random numbers
+            - Each named stream is seeded from the model seed and a hash of its name. Streams are independent and
+              reproducible: Adding a stream or drawing more numbers from one never changes the values of another.
+            - bit_generator "legacy" uses one shared np.random.RandomState for every stream. Streams are then no longer
+              independent: Their values depend on the draws made by every other stream.
+            - With common_random_numbers, draws made for agents are a hash of (seed, Unique_ID, time step, stream,
+              draw). An agent then meets the same randomness in every scenario run with the same seed, which reduces
+              the variance of differences between scenarios. Requires the model, for its time and Unique_IDs.
+            - With replicate_seeds, the model is a stack of replicates and each replicate gets the streams of a
+              service seeded with its own seed. Requires the model, for the replicate of each agent.
+            - The service can be used as a stream itself. Those numbers come from the "model" stream.
+        """
+        self.seed = seed
+        self.bit_generator = bit_generator
+        self.buffer_size = buffer_size
+        self.common_random_numbers = common_random_numbers
+        self.model = model
+        self.legacy = None
+        if bit_generator == "legacy":
+            self.legacy = np.random.RandomState(seed)
+        elif bit_generator not in self.bit_generators:
+            raise ValueError("Unknown bit generator: {}".format(bit_generator))
+        self.streams = dict()
+        self.replicates = None
+        if replicate_seeds is not None:
+            self.replicates = [
+                RandomService(replicate_seed, bit_generator, buffer_size, common_random_numbers, model)
+                for replicate_seed in replicate_seeds
+            ]
+        self.default = self.stream("model")
+
+    def stream(self, name: str):
+        """ Return the stream with the given name, creating it if needed
+        """
+        if name not in self.streams and self.replicates is not None:
+            self.streams[name] = ReplicateStream([service.stream(name) for service in self.replicates], service=self)
+        if name not in self.streams:
+            key = zlib.crc32(name.encode())
+            if self.legacy is not None:
+                # --- Unbuffered, so that the streams draw from the shared RandomState in the same order as before
+                self.streams[name] = RandomStream(self.legacy, buffer_size=0, service=self, key=key)
+            else:
+                seed_sequence = np.random.SeedSequence(self.seed, spawn_key=(key,))
+                generator = np.random.Generator(self.bit_generators[self.bit_generator](seed_sequence))
+                self.streams[name] = RandomStream(generator, buffer_size=self.buffer_size, service=self, key=key)
+        return self.streams[name]
+
+    def agent_uniform(self, key: int, unique_ids: np.array, draw=0) -> np.array:
+        """ Return the common random number of each agent for the current time step. Agents are identified by their
+        Unique_ID within their replicate. Agents created by splitting are numbered after the last replicate.
+        """
+        agent_ids = self.model.agent_ids[unique_ids]
+        agent_ids = np.where(agent_ids < self.model.num_agents, agent_ids % self.model.replicate_size, agent_ids)
+        # --- Scalar keys go first, so only the last rounds of the hash work on arrays
+        if np.ndim(unique_ids) == 0 and np.ndim(draw) == 0:
+            return hash_uniform_scalar(self.seed, self.model.time, key, draw, agent_ids)
+        return hash_uniform(self.seed, self.model.time, key, draw, agent_ids)
+
+    def get_state(self) -> dict:
+        """ Return the state of every stream, so that drawing can be continued later with `set_state`
+        """
+        return {
+            "legacy": self.legacy.get_state() if self.legacy is not None else None,
+            "streams": {
+                name: stream.get_state() for name, stream in self.streams.items() if isinstance(stream, RandomStream)
+            },
+            "replicates": [service.get_state() for service in self.replicates] if self.replicates else None,
+        }
+
+    def set_state(self, state: dict):
+        """ Continue drawing from a state returned by `get_state`. Streams are created if needed.
+        """
+        if state["legacy"] is not None:
+            self.legacy.set_state(state["legacy"])
+        for name, stream_state in state["streams"].items():
+            self.stream(name).set_state(stream_state)
+        if state["replicates"] is not None:
+            for service, service_state in zip(self.replicates, state["replicates"]):
+                service.set_state(service_state)
+
+    def replicate_of(self, unique_ids: np.array) -> np.array:
+        """ Return the replicate of each agent
+        """
+        return self.model.agent_ids[unique_ids] // self.model.replicate_size
+
+    def rand(self, *shape):
+        return self.default.rand(*shape)
+
+    def random(self, size=None):
+        return self.default.random(size)
+
+    def choice(self, options: list, p: list = None):
+        return self.default.choice(options, p=p)
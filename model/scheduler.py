@@ -0,0 +1,89 @@
+import numpy as np
+
+
+class WaitingTimeScheduler:
+    NEVER = np.iinfo(np.int32).max
+
+    def __init__(self, model, count: int, rng):
+        """ Schedule the next transition of each agent instead of drawing a random number every month
+            - Transition probabilities are constant until they are changed, so the number of months until an agent
+              transitions is geometric. One waiting time is drawn per agent and the month it ends is stored.
+            - Waiting times are redrawn when an agent's probability changes. This is detected by comparing the
+              probabilities with the ones used to draw the waiting times, so no state has to report its changes.
+            - Agents who are due but not eligible (ex: already transitioned) are rescheduled. Waiting times are
+              memoryless, so this does not bias the time of their next transition. Dead agents are not rescheduled.
+            - Compacting the agents keeps their waiting times: They are reindexed with the agents (see `compact`).
+            - Cost: Random numbers are only drawn for agents who are due or whose probability changed. Finding them
+              still compares the probabilities and due months of every agent each month, which is linear in the
+              number of agents. These are two vectorized comparisons, several times cheaper than drawing a random
+              number per agent (about 0.6 ms against 4 ms for 500k agents).
+        """
+        self.model = model
+        self.rng = rng
+        self.next_time = None
+        self.scheduled_probabilities = None
+        self.reset(count)
+
+    def reset(self, count: int):
+        """ Forget all waiting times. Every agent is rescheduled the next time `select` is called.
+        """
+        self.next_time = np.full(count, self.NEVER, dtype=np.int32)
+        self.scheduled_probabilities = np.full(count, -1.0, dtype=self.model.dtypes.probability)
+
+    def compact(self, keep: np.array):
+        """ Keep only the agents at the given indices
+        """
+        self.next_time = self.next_time[keep]
+        self.scheduled_probabilities = self.scheduled_probabilities[keep]
+
+    def forget(self, unique_ids: np.array):
+        """ Forget the waiting times of the given agents. They are rescheduled the next time `select` is called.
+        """
+        self.next_time[unique_ids] = self.NEVER
+        self.scheduled_probabilities[unique_ids] = -1.0
+
+    def get_state(self) -> dict:
+        return {"next_time": self.next_time, "scheduled_probabilities": self.scheduled_probabilities}
+
+    def set_state(self, state: dict):
+        self.next_time = state["next_time"]
+        self.scheduled_probabilities = state["scheduled_probabilities"]
+
+    def select(self, probabilities: np.array, eligible: np.array, living: np.array = None) -> np.array:
+        """ Return the eligible agents that transition this month. Should be called once per month.
+
+        Args:
+            probabilities (np.array): The transition probability of every agent
+            eligible (np.array): Mask of the agents that can currently transition
+            living (np.array, optional): Mask of the agents that may become eligible in the future. Other agents are
+                no longer scheduled, so they do not use up random numbers.
+        """
+        time = self.model.time
+        changed = probabilities != self.scheduled_probabilities
+        if living is not None:
+            changed &= living
+        changed = np.flatnonzero(changed)
+        if len(changed) > 0:
+            self.schedule(changed, probabilities[changed], start=time)
+
+        due = np.flatnonzero(self.next_time == time)
+        if living is not None:
+            self.next_time[due[~living[due]]] = self.NEVER
+            due = due[living[due]]
+        # --- Transitioning agents are also rescheduled: Their probability may not change
+        self.schedule(due, probabilities[due], start=time + 1, draw=1)
+        return due[eligible[due]]
+
+    def schedule(self, unique_ids: np.array, probabilities: np.array, start: int, draw: int = 0):
+        """ Draw the month of each agent's next transition, counting `start` as the first month
+        """
+        self.scheduled_probabilities[unique_ids] = probabilities
+        random = self.rng.for_agents(unique_ids, draw=draw)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            waits = np.floor(np.log1p(-random) / np.log1p(-probabilities))
+        # --- Waiting times beyond the end of the simulation (or with a probability of 0) never end
+        never = ~(waits < self.model.params.num_steps)
+        waits[never] = 0
+        times = start + waits.astype(np.int32)
+        times[never] = self.NEVER
+        self.next_time[unique_ids] = times
@@ -1,6 +1,8 @@
 from enum import IntEnum, unique
 from typing import Dict
 
+import numpy as np
+
 from model.event import Event
 from model.parameters import ScreeningParameters
 from model.state import CancerState
@@ -23,64 +25,100 @@ class ScreeningState(IntEnum):
     SURVEILLANCE = 3
 
 
+def draw_for_agents(rng, count: int, unique_ids: np.array = None) -> np.array:
+    """ Return `count` random numbers. Given the agents, the draws are made for them. See `RandomStream.for_agents`.
+    """
+    if unique_ids is None:
+        return rng.rand(count)
+    return rng.for_agents(unique_ids)
+
+
 class ViaScreeningTest:
     def __init__(self, model):
         self.model = model
+        self.rng = model.rng.stream("screening_via")
         self.params = model.params.screening.via
 
-    def get_result(self, true_hpv_state: HpvState, true_cancer_state: CancerState) -> ScreeningTestResult:
-        """ Return the screening test result given a woman's most advanced HPV state and her cancer state.
+    def get_result(
+        self, true_hpv_state: HpvState, true_cancer_state: CancerState, unique_id: int = None
+    ) -> ScreeningTestResult:
+        """ Return the screening test result given a woman's most advanced HPV state and her cancer state. See
+        `get_results`.
+        """
+        unique_ids = None if unique_id is None else np.array([unique_id])
+        results = self.get_results(np.array([true_hpv_state]), np.array([true_cancer_state]), unique_ids)
+        return ScreeningTestResult(results[0])
+
+    def get_results(
+        self, true_hpv_states: np.array, true_cancer_states: np.array, unique_ids: np.array = None
+    ) -> np.array:
+        """ Return the screening test results given the women's most advanced HPV states and their cancer states.
 
         Properties of the test:
         - If the HpvState is NORMAL, HPV, or CIN_1 and the test is specific, then return NEGATIVE.
         - If the HpvState is NORMAL, HPV, or CIN_1 and the test isn't specific, then return POSITIVE.
-        - If the HpvState is CIN_2_3 and the test is sensitive, then return POSITIVE.
-        - If the HpvState is CIN_2_3 and the test isn't sensitive, then return NEGATIVE.
+        - If the HpvState is CIN_2 or CIN_3 and the test is sensitive, then return POSITIVE.
+        - If the HpvState is CIN_2 or CIN_3 and the test isn't sensitive, then return NEGATIVE.
         - If the HpvState is CANCER, the CancerState is LOCAL, and the test is sensitive, then return CANCER.
         - If the HpvState is CANCER, the CancerState is LOCAL, and the test isn't sensitive, then return NEGATIVE.
         - If the HpvState is CANCER and the CancerState is REGIONAL or DISTANT, then return CANCER
             (regardless of the sensitivity).
 
-        Raise a ValueError if true_cancer_state is DEAD. Also raise a ValueError
-        if true_hpv_state is CANCER and true_cancer_state is NORMAL.
+        Raise a ValueError if a true_cancer_state is DEAD. Also raise a ValueError
+        if a true_hpv_state is CANCER and its true_cancer_state is NORMAL.
         """
-
-        if true_cancer_state == CancerState.DEAD:
+        if (true_cancer_states == CancerState.DEAD).any():
             raise ValueError()
-        elif true_hpv_state == HpvState.CANCER and true_cancer_state == CancerState.NORMAL:
+        if ((true_hpv_states == HpvState.CANCER) & (true_cancer_states == CancerState.NORMAL)).any():
             raise ValueError()
-        elif true_hpv_state in [HpvState.NORMAL, HpvState.HPV, HpvState.CIN_1]:
-            if self.model.rng.random() > self.params.specificity:
-                return ScreeningTestResult.POSITIVE
-            else:
-                return ScreeningTestResult.NEGATIVE
-        elif true_hpv_state == HpvState.CIN_2_3:
-            if self.model.rng.random() < self.params.sensitivity:
-                return ScreeningTestResult.POSITIVE
-            else:
-                return ScreeningTestResult.NEGATIVE
-        elif true_cancer_state == CancerState.LOCAL:
-            if self.model.rng.random() < self.params.sensitivity:
-                return ScreeningTestResult.CANCER
-            else:
-                return ScreeningTestResult.NEGATIVE
-        else:
-            return ScreeningTestResult.CANCER
+
+        low = np.isin(true_hpv_states, [HpvState.NORMAL, HpvState.HPV, HpvState.CIN_1])
+        cin_2_3 = np.isin(true_hpv_states, [HpvState.CIN_2, HpvState.CIN_3])
+        local = ~low & ~cin_2_3 & (true_cancer_states == CancerState.LOCAL)
+        tested = low | cin_2_3 | local
+        random = np.zeros(len(true_hpv_states))
+        random[tested] = draw_for_agents(self.rng, tested.sum(), None if unique_ids is None else unique_ids[tested])
+
+        positive, negative = ScreeningTestResult.POSITIVE, ScreeningTestResult.NEGATIVE
+        results = np.full(len(true_hpv_states), ScreeningTestResult.CANCER.value, dtype=np.int8)
+        results[low] = np.where(random[low] > self.params.specificity, positive, negative)
+        results[cin_2_3] = np.where(random[cin_2_3] < self.params.sensitivity, positive, negative)
+        results[local] = np.where(random[local] < self.params.sensitivity, ScreeningTestResult.CANCER, negative)
+        return results
 
 
 class DnaScreeningTest:
+    # --- Detectable HPV strains, and the bit of each strain in the results of `get_results`
+    DETECTABLE = [HpvStrain.SIXTEEN, HpvStrain.EIGHTEEN, HpvStrain.HIGH_RISK]
+    STRAIN_BITS = {strain: 1 << i for i, strain in enumerate(HpvStrain)}
+
     def __init__(self, model):
         self.model = model
+        self.rng = model.rng.stream("screening_dna")
         self.params = model.params.screening.dna
 
-    def get_result(self, true_hpv_states: Dict[HpvStrain, HpvState]) -> Dict[HpvStrain, ScreeningTestResult]:
+    def get_result(
+        self, true_hpv_states: Dict[HpvStrain, HpvState], unique_id: int = None
+    ) -> Dict[HpvStrain, ScreeningTestResult]:
         """ Return the screening test result given a woman's true HPV state for each
-            strain. An independent result is provided for each strain.
+            strain. An independent result is provided for each strain. See `get_results`.
+        """
+        states = np.array([[true_hpv_states[strain]] for strain in HpvStrain])
+        positive = self.get_results(states, None if unique_id is None else np.array([unique_id]))[0]
+        return {
+            strain: ScreeningTestResult.POSITIVE if positive & bit else ScreeningTestResult.NEGATIVE
+            for strain, bit in self.STRAIN_BITS.items()
+        }
+
+    def get_results(self, true_hpv_states: np.array, unique_ids: np.array = None) -> np.array:
+        """ Return the screening test results given the women's true HPV states: A (strain x agent) array with one
+            row per HpvStrain, in order. The result of each woman is a bitmask of the strains that tested POSITIVE.
+            See `STRAIN_BITS`.
 
         Properties of the test:
         - Detectable HPV strains are SIXTEEN, EIGHTEEN, and HIGH_RISK.
         - We say that a woman "has a strain" when her state for that strain is
-          one of HPV, CIN_1, CIN_2_3, or CANCER.
+          one of HPV, CIN_1, CIN_2, CIN_3, or CANCER.
         - Always return NEGATIVE for undetectable strains.
         - If the woman has a detectable strain of HPV and the test is sensitive, then
           return POSITIVE for each detectable strain that she has.
@@ -92,53 +130,36 @@ class DnaScreeningTest:
           specific, then return POSITIVE for the HIGH_RISK strain and NEGATIVE for
           other strains.
         """
-
-        detectable = [
-            HpvStrain.SIXTEEN,
-            HpvStrain.EIGHTEEN,
-            HpvStrain.HIGH_RISK,
-        ]
+        rows = [list(HpvStrain).index(strain) for strain in self.DETECTABLE]
+        has = true_hpv_states[rows] != HpvState.NORMAL
+        has_any = has.any(axis=0)
 
         # Step 1: Compute an overall positive/negative result using the test sensitivity and specificity.
-
-        false_positive = False
-
-        if all(true_hpv_states[strain] == HpvState.NORMAL for strain in detectable):
-            if self.model.rng.random() > self.params.specificity:
-                overall_result = ScreeningTestResult.POSITIVE
-                false_positive = True
-            else:
-                overall_result = ScreeningTestResult.NEGATIVE
-        else:
-            if self.model.rng.random() < self.params.sensitivity:
-                overall_result = ScreeningTestResult.POSITIVE
-            else:
-                overall_result = ScreeningTestResult.NEGATIVE
-
-        if overall_result == ScreeningTestResult.NEGATIVE:
-            return {strain: ScreeningTestResult.NEGATIVE for strain in HpvStrain}
+        random = draw_for_agents(self.rng, true_hpv_states.shape[1], unique_ids)
+        positive = np.where(has_any, random < self.params.sensitivity, random > self.params.specificity)
 
         # Step 2: Compute strain-specific results using deterministic rules.
-
-        result = {strain: ScreeningTestResult.NEGATIVE for strain in HpvStrain}
-
-        for strain in detectable:
-            if true_hpv_states[strain] != HpvState.NORMAL:
-                result[strain] = ScreeningTestResult.POSITIVE
-
-        if false_positive:
-            result[HpvStrain.HIGH_RISK] = ScreeningTestResult.POSITIVE
-
-        return result
+        results = np.zeros(true_hpv_states.shape[1], dtype=np.int8)
+        for strain, strain_has in zip(self.DETECTABLE, has):
+            results[positive & strain_has] |= self.STRAIN_BITS[strain]
+        results[positive & ~has_any] |= self.STRAIN_BITS[HpvStrain.HIGH_RISK]
+        return results
 
 
 class CancerInspectionScreeningTest:
     def __init__(self, model):
         self.model = model
+        self.rng = model.rng.stream("screening_cancer_inspection")
         self.params = model.params.screening.cancer_inspection
 
-    def get_result(self, true_cancer_state: CancerState) -> ScreeningTestResult:
-        """ Return the screening test result given a woman's true cancer state.
+    def get_result(self, true_cancer_state: CancerState, unique_id: int = None) -> ScreeningTestResult:
+        """ Return the screening test result given a woman's true cancer state. See `get_results`.
+        """
+        results = self.get_results(np.array([true_cancer_state]), None if unique_id is None else np.array([unique_id]))
+        return ScreeningTestResult(results[0])
+
+    def get_results(self, true_cancer_states: np.array, unique_ids: np.array = None) -> np.array:
+        """ Return the screening test results given the women's true cancer states.
 
         Properties of the test:
         - Detectable cancer states are REGIONAL and DISTANT.
@@ -147,26 +168,20 @@ class CancerInspectionScreeningTest:
         - If the woman doesn't have a detectable state and the test is specific, then return NEGATIVE.
         - If the woman doesn't have a detectable state and the test isn't specific, then return CANCER.
 
-        Raise a ValueError if true_cancer_state is DEAD.
+        Raise a ValueError if a true_cancer_state is DEAD.
         """
-
-        if true_cancer_state == CancerState.DEAD:
+        if (true_cancer_states == CancerState.DEAD).any():
             raise ValueError()
-        elif true_cancer_state in [CancerState.NORMAL, CancerState.LOCAL]:
-            if self.model.rng.random() > self.params.specificity:
-                return ScreeningTestResult.CANCER
-            else:
-                return ScreeningTestResult.NEGATIVE
-        else:
-            if self.model.rng.random() < self.params.sensitivity:
-                return ScreeningTestResult.CANCER
-            else:
-                return ScreeningTestResult.NEGATIVE
 
+        random = draw_for_agents(self.rng, len(true_cancer_states), unique_ids)
+        undetectable = np.isin(true_cancer_states, [CancerState.NORMAL, CancerState.LOCAL])
+        cancer = np.where(undetectable, random > self.params.specificity, random < self.params.sensitivity)
+        return np.where(cancer, ScreeningTestResult.CANCER, ScreeningTestResult.NEGATIVE).astype(np.int8)
 
-def is_due_for_screening(model, unique_id):
-    """ Return True if the woman is due for a screening test based on her current screening state,
-        her screening history, and the screening interval guidelines.
+
+def due_for_screening(model, unique_ids: np.array) -> np.array:
+    """ Return a mask of the given women who are due for a screening test based on their current screening state,
+        their screening history, and the screening interval guidelines.
 
     Requirements:
     - Women who have been diagnosed with cancer are no longer screened.
@@ -176,39 +191,48 @@ def is_due_for_screening(model, unique_id):
     - Women with HIV have a different screening interval.
         This interval will be used in place of her state-based interval if the HIV-specific interval is shorter.
     """
+    params = model.params.screening
+    states = model.screening_state.values[unique_ids]
+
+    intervals = np.full(max(ScreeningState) + 1, -1)
+    intervals[ScreeningState.ROUTINE] = params.interval_routine
+    intervals[ScreeningState.RE_TEST] = params.interval_re_test
+    intervals[ScreeningState.SURVEILLANCE] = params.interval_surveillance
+    interval = intervals[states]
+    if (interval < 0).any():
+        raise NotImplementedError(f"Unexpected screening state: {states[interval < 0][0]}")
+
+    hiv_detected = model.hiv_detected[unique_ids]
+    interval[hiv_detected] = np.minimum(interval[hiv_detected], params.interval_hiv)
+    last_screen_age = model.last_screen_age[unique_ids]
+    due = (last_screen_age < 0) | (model.age - last_screen_age >= interval)
+
+    due &= model.cancer_detection.values[unique_ids] != CancerDetectionState.DETECTED
+    if model.age < params.age_routine_start or model.age > params.age_routine_end:
+        due &= states != ScreeningState.ROUTINE
+    return due
+
+
+def compliant_with_screening(model, unique_ids: np.array) -> np.array:
+    """ Return a mask of the given women who comply with screening in their current screening state
+    """
+    states = model.screening_state.values[unique_ids]
+    compliant = np.ones(len(unique_ids), dtype=bool)
+    routine = states == ScreeningState.ROUTINE
+    compliant[routine] = model.compliant_routine_state.values[unique_ids[routine]]
+    surveillance = states == ScreeningState.SURVEILLANCE
+    compliant[surveillance] = model.compliant_surveillance_state.values[unique_ids[surveillance]]
+    return compliant
 
-    if model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED:
-        return False
-
-    t1 = model.age < model.params.screening.age_routine_start
-    t2 = model.age > model.params.screening.age_routine_end
-    if model.screening_state.values[unique_id] == ScreeningState.ROUTINE and (t1 or t2):
-        return False
-
-    if model.screening_state.values[unique_id] == ScreeningState.ROUTINE:
-        interval = model.params.screening.interval_routine
-    elif model.screening_state.values[unique_id] == ScreeningState.RE_TEST:
-        interval = model.params.screening.interval_re_test
-    elif model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-        interval = model.params.screening.interval_surveillance
-    else:
-        raise NotImplementedError(f"Unexpected screening state: {model.screening_state.values[unique_id]}")
 
-    if unique_id in model.hiv_detected:
-        interval = min(interval, model.params.screening.interval_hiv)
-    if unique_id not in model.dicts.last_screen_age:
-        return True
-    if model.age - model.dicts.last_screen_age.get(unique_id, 0) >= interval:
-        return True
-    return False
+def is_due_for_screening(model, unique_id):
+    """ Return True if the woman is due for a screening test. See `due_for_screening`.
+    """
+    return bool(due_for_screening(model, np.array([unique_id]))[0])
 
 
 def is_compliant_with_screening(model, unique_id):
-    if model.screening_state.values[unique_id] == ScreeningState.ROUTINE:
-        return model.compliant_routine_state.values[unique_id]
-    elif model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-        return model.compliant_surveillance_state.values[unique_id]
-    return True
+    return bool(compliant_with_screening(model, np.array([unique_id]))[0])
 
 
 class ScreeningProtocol:
@@ -229,19 +253,75 @@ class ScreeningProtocol:
     def apply(self):
         raise NotImplementedError("Must implement this method in a subclass")
 
-    def get_via_result(self, unique_id):
-        return self.via_screening_test.get_result(
-            true_hpv_state=self.model.max_hpv_state.values[unique_id],
-            true_cancer_state=self.model.cancer.values[unique_id],
+    def select_agents(self, unique_id=None) -> np.array:
+        """ Return the women who are screened now: Those who are due for screening and compliant. Their screening age
+        is recorded.
+
+        Args:
+            unique_id (int, optional): Only consider this woman. Defaults to every living woman.
+        """
+        if unique_id is None:
+            unique_ids = self.model.life.living_ids
+        else:
+            unique_ids = np.array([unique_id])
+        screened = due_for_screening(self.model, unique_ids) & compliant_with_screening(self.model, unique_ids)
+        selected = unique_ids[screened]
+        self.model.last_screen_age[selected] = self.model.age
+        return selected
+
+    def record_tests(self, unique_ids: np.array, surveillance: np.array, events: tuple, cost: float):
+        """ Record the cost of a screening test for each woman
+
+        Args:
+            unique_ids (np.array): The women tested
+            surveillance (np.array): Mask of the women tested as part of surveillance
+            events (tuple): The (screening, surveillance) events of the test
+            cost (float): The cost of the test
+        """
+        event = np.where(surveillance, events[1].value, events[0].value)
+        self.model.events.record_events((self.model.time, self.model.agent_ids[unique_ids], event, cost))
+
+    def treat(self, unique_ids: np.array):
+        """ Treat the CIN of each woman and move her to surveillance. Women are treated in order, so that the
+        treatment draws are made in the same order as screening.
+        """
+        for unique_id in np.sort(unique_ids):
+            self.model.treat_cin(unique_id)
+        self.model.screening_state.values[unique_ids] = ScreeningState.SURVEILLANCE
+
+    def detect(self, unique_ids: np.array):
+        """ Record the detection of each woman's cancer and move her to surveillance
+        """
+        for unique_id in np.sort(unique_ids):
+            self.model.detect_cancer(unique_id)
+        self.model.screening_state.values[unique_ids] = ScreeningState.SURVEILLANCE
+
+    def get_via_results(self, unique_ids: np.array) -> np.array:
+        return self.via_screening_test.get_results(
+            true_hpv_states=self.model.max_hpv_state.values[unique_ids],
+            true_cancer_states=self.model.cancer.values[unique_ids],
+            unique_ids=unique_ids,
         )
 
-    def get_dna_result(self, unique_id):
-        return self.dna_screening_test.get_result(
-            true_hpv_states={strain: self.model.hpv_strains[strain].values[unique_id] for strain in HpvStrain}
+    def get_dna_results(self, unique_ids: np.array) -> np.array:
+        return self.dna_screening_test.get_results(
+            true_hpv_states=np.array([self.model.hpv_strains[strain].values[unique_ids] for strain in HpvStrain]),
+            unique_ids=unique_ids,
         )
 
-    def get_cancer_inspection_result(self, unique_id):
-        return self.cancer_inspection_screening_test.get_result(true_cancer_state=self.model.cancer.values[unique_id],)
+    def get_cancer_inspection_results(self, unique_ids: np.array) -> np.array:
+        return self.cancer_inspection_screening_test.get_results(
+            true_cancer_states=self.model.cancer.values[unique_ids], unique_ids=unique_ids
+        )
+
+    def inspect_for_cancer(self, unique_ids: np.array, surveillance: np.array) -> tuple:
+        """ Inspect the women for cancer. Returns the women whose inspection was negative, who are treated for CIN,
+        and the women whose cancer was detected.
+        """
+        events = (Event.SCREENING_CANCER_INSPECTION, Event.SURVEILLANCE_CANCER_INSPECTION)
+        self.record_tests(unique_ids, surveillance, events, self.params.cancer_inspection.cost)
+        results = self.get_cancer_inspection_results(unique_ids)
+        return unique_ids[results == ScreeningTestResult.NEGATIVE], unique_ids[results == ScreeningTestResult.CANCER]
 
 
 class NoScreeningProtocol(ScreeningProtocol):
@@ -257,194 +337,75 @@ class NoScreeningProtocol(ScreeningProtocol):
 
 class ViaScreeningProtocol(ScreeningProtocol):
     def apply(self, unique_id=None):
-        unique_ids = [unique_id]
-        if unique_id is None:
-            unique_ids = self.model.unique_ids[self.model.life.living]
-        for unique_id in unique_ids:
-            if not is_due_for_screening(self.model, unique_id):
-                continue
-            if not is_compliant_with_screening(self.model, unique_id):
-                continue
-            self.model.dicts.last_screen_age[unique_id] = self.model.age
-
-            if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                event = Event.SURVEILLANCE_VIA
-            else:
-                event = Event.SCREENING_VIA
-
-            self.model.events.record_event((self.model.time, unique_id, event.value, self.params.via.cost))
-
-            result = self.get_via_result(unique_id)
-
-            if result == ScreeningTestResult.NEGATIVE:
-                self.model.screening_state.values[unique_id] = ScreeningState.ROUTINE
-            elif result == ScreeningTestResult.POSITIVE:
-                self.model.treat_cin(unique_id)
-                self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-            elif result == ScreeningTestResult.CANCER:
-                self.model.detect_cancer(unique_id)
-                self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-            else:
-                raise NotImplementedError(f"Unexpected screening test result: {result}")
+        unique_ids = self.select_agents(unique_id)
+        surveillance = self.model.screening_state.values[unique_ids] == ScreeningState.SURVEILLANCE
+        self.record_tests(unique_ids, surveillance, (Event.SCREENING_VIA, Event.SURVEILLANCE_VIA), self.params.via.cost)
+
+        results = self.get_via_results(unique_ids)
+
+        self.model.screening_state.values[unique_ids[results == ScreeningTestResult.NEGATIVE]] = ScreeningState.ROUTINE
+        self.treat(unique_ids[results == ScreeningTestResult.POSITIVE])
+        self.detect(unique_ids[results == ScreeningTestResult.CANCER])
 
 
 class DnaThenTreatmentScreeningProtocol(ScreeningProtocol):
     def apply(self, unique_id=None):
-        unique_ids = [unique_id]
-        if unique_id is None:
-            unique_ids = self.model.unique_ids[self.model.life.living]
-        for unique_id in unique_ids:
-            if not is_due_for_screening(self.model, unique_id):
-                continue
-            if not is_compliant_with_screening(self.model, unique_id):
-                continue
-
-            self.model.dicts.last_screen_age[unique_id] = self.model.age
-
-            if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                event = Event.SURVEILLANCE_DNA
-            else:
-                event = Event.SCREENING_DNA
-            self.model.events.record_event((self.model.time, unique_id, event.value, self.params.dna.cost))
-
-            result = self.get_dna_result(unique_id)
-
-            if all(result[strain] == ScreeningTestResult.NEGATIVE for strain in HpvStrain):
-                self.model.screening_state.values[unique_id] = ScreeningState.ROUTINE
-            else:
-                if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                    event2 = Event.SURVEILLANCE_CANCER_INSPECTION
-                else:
-                    event2 = Event.SCREENING_CANCER_INSPECTION
-
-                self.model.events.record_event(
-                    (self.model.time, unique_id, event2.value, self.params.cancer_inspection.cost)
-                )
-
-                result = self.get_cancer_inspection_result(unique_id)
-
-                if result == ScreeningTestResult.NEGATIVE:
-                    self.model.treat_cin(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                elif result == ScreeningTestResult.CANCER:
-                    self.model.detect_cancer(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                else:
-                    raise NotImplementedError(f"Unexpected screening test result: {result}")
+        unique_ids = self.select_agents(unique_id)
+        surveillance = self.model.screening_state.values[unique_ids] == ScreeningState.SURVEILLANCE
+        self.record_tests(unique_ids, surveillance, (Event.SCREENING_DNA, Event.SURVEILLANCE_DNA), self.params.dna.cost)
+
+        positive = self.get_dna_results(unique_ids) != 0
+
+        treated, detected = self.inspect_for_cancer(unique_ids[positive], surveillance[positive])
+        self.model.screening_state.values[unique_ids[~positive]] = ScreeningState.ROUTINE
+        self.treat(treated)
+        self.detect(detected)
 
 
 class DnaThenViaScreeningProtocol(ScreeningProtocol):
     def apply(self, unique_id=None):
-        unique_ids = [unique_id]
-        if unique_id is None:
-            unique_ids = self.model.unique_ids[self.model.life.living]
-
-        for unique_id in unique_ids:
-            if not is_due_for_screening(self.model, unique_id):
-                continue
-            if not is_compliant_with_screening(self.model, unique_id):
-                continue
-
-            self.model.dicts.last_screen_age[unique_id] = self.model.age
-
-            if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                event = Event.SURVEILLANCE_DNA
-            else:
-                event = Event.SCREENING_DNA
-
-            self.model.events.record_event((self.model.time, unique_id, event.value, self.params.dna.cost))
-            result = self.get_dna_result(unique_id)
-
-            stp_pos = ScreeningTestResult.POSITIVE
-            if all(result[strain] == ScreeningTestResult.NEGATIVE for strain in HpvStrain):
-                self.model.screening_state.values[unique_id] = ScreeningState.ROUTINE
-            elif (result[HpvStrain.SIXTEEN] == stp_pos) or (result[HpvStrain.EIGHTEEN] == stp_pos):
-
-                if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                    event2 = Event.SURVEILLANCE_CANCER_INSPECTION
-                else:
-                    event2 = Event.SCREENING_CANCER_INSPECTION
-
-                self.model.events.record_event(
-                    (self.model.time, unique_id, event2.value, self.params.cancer_inspection.cost)
-                )
-                result = self.get_cancer_inspection_result(unique_id)
-
-                if result == ScreeningTestResult.NEGATIVE:
-                    self.model.treat_cin(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                elif result == ScreeningTestResult.CANCER:
-                    self.model.detect_cancer(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                else:
-                    raise NotImplementedError(f"Unexpected screening test result: {result}")
-            else:
-                if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                    event2 = Event.SURVEILLANCE_VIA
-                else:
-                    event2 = Event.SCREENING_VIA
-
-                self.model.events.record_event((self.model.time, unique_id, event2.value, self.params.via.cost))
-                result = self.get_via_result(unique_id)
-
-                if result == ScreeningTestResult.NEGATIVE:
-                    self.model.screening_state.values[unique_id] = ScreeningState.RE_TEST
-                elif result == ScreeningTestResult.POSITIVE:
-                    self.model.treat_cin(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                elif result == ScreeningTestResult.CANCER:
-                    self.model.detect_cancer(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                else:
-                    raise NotImplementedError(f"Unexpected screening test result: {result}")
+        unique_ids = self.select_agents(unique_id)
+        surveillance = self.model.screening_state.values[unique_ids] == ScreeningState.SURVEILLANCE
+        self.record_tests(unique_ids, surveillance, (Event.SCREENING_DNA, Event.SURVEILLANCE_DNA), self.params.dna.cost)
+
+        results = self.get_dna_results(unique_ids)
+        bits = DnaScreeningTest.STRAIN_BITS
+        negative = results == 0
+        positive_16_18 = (results & (bits[HpvStrain.SIXTEEN] | bits[HpvStrain.EIGHTEEN])) != 0
+        other = ~negative & ~positive_16_18
+
+        # --- HPV 16/18: Inspect for cancer
+        treated, detected = self.inspect_for_cancer(unique_ids[positive_16_18], surveillance[positive_16_18])
+        # --- Other high risk HPV: Triage with VIA
+        via_ids = unique_ids[other]
+        events = (Event.SCREENING_VIA, Event.SURVEILLANCE_VIA)
+        self.record_tests(via_ids, surveillance[other], events, self.params.via.cost)
+        via_results = self.get_via_results(via_ids)
+
+        self.model.screening_state.values[unique_ids[negative]] = ScreeningState.ROUTINE
+        self.model.screening_state.values[via_ids[via_results == ScreeningTestResult.NEGATIVE]] = ScreeningState.RE_TEST
+        self.treat(np.concatenate([treated, via_ids[via_results == ScreeningTestResult.POSITIVE]]))
+        self.detect(np.concatenate([detected, via_ids[via_results == ScreeningTestResult.CANCER]]))
 
 
 class DnaThenTriageScreeningProtocol(ScreeningProtocol):
     def apply(self, unique_id=None):
-        unique_ids = [unique_id]
-        if unique_id is None:
-            unique_ids = self.model.unique_ids[self.model.life.living]
-
-        for unique_id in unique_ids:
-            if not is_due_for_screening(self.model, unique_id):
-                continue
-            if not is_compliant_with_screening(self.model, unique_id):
-                continue
-
-            self.model.dicts.last_screen_age[unique_id] = self.model.age
-
-            if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                event = Event.SURVEILLANCE_DNA
-            else:
-                event = Event.SCREENING_DNA
-
-            self.model.events.record_event((self.model.time, unique_id, event.value, self.params.dna.cost))
-            result = self.get_dna_result(unique_id)
-
-            stp_pos = ScreeningTestResult.POSITIVE
-            if all(result[strain] == ScreeningTestResult.NEGATIVE for strain in HpvStrain):
-                self.model.screening_state.values[unique_id] = ScreeningState.ROUTINE
-            elif (result[HpvStrain.SIXTEEN] == stp_pos) or (result[HpvStrain.EIGHTEEN] == stp_pos):
-
-                if self.model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE:
-                    event2 = Event.SURVEILLANCE_CANCER_INSPECTION
-                else:
-                    event2 = Event.SCREENING_CANCER_INSPECTION
-                self.model.events.record_event(
-                    (self.model.time, unique_id, event2.value, self.params.cancer_inspection.cost)
-                )
-                result = self.get_cancer_inspection_result(unique_id)
-
-                if result == ScreeningTestResult.NEGATIVE:
-                    self.model.treat_cin(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                elif result == ScreeningTestResult.CANCER:
-                    self.model.detect_cancer(unique_id)
-                    self.model.screening_state.values[unique_id] = ScreeningState.SURVEILLANCE
-                else:
-                    raise NotImplementedError(f"Unexpected screening test result: {result}")
-            else:
-                self.model.screening_state.values[unique_id] = ScreeningState.RE_TEST
+        unique_ids = self.select_agents(unique_id)
+        surveillance = self.model.screening_state.values[unique_ids] == ScreeningState.SURVEILLANCE
+        self.record_tests(unique_ids, surveillance, (Event.SCREENING_DNA, Event.SURVEILLANCE_DNA), self.params.dna.cost)
+
+        results = self.get_dna_results(unique_ids)
+        bits = DnaScreeningTest.STRAIN_BITS
+        negative = results == 0
+        positive_16_18 = (results & (bits[HpvStrain.SIXTEEN] | bits[HpvStrain.EIGHTEEN])) != 0
+        other = ~negative & ~positive_16_18
+
+        # --- HPV 16/18: Inspect for cancer. Other high risk HPV: Test again later
+        treated, detected = self.inspect_for_cancer(unique_ids[positive_16_18], surveillance[positive_16_18])
+        self.model.screening_state.values[unique_ids[negative]] = ScreeningState.ROUTINE
+        self.model.screening_state.values[unique_ids[other]] = ScreeningState.RE_TEST
+        self.treat(treated)
+        self.detect(detected)
 
 
 protocols = {
@@ -1,6 +1,5 @@
 import numpy as np
 
-from typing import List
 from enum import IntEnum, Enum, unique, auto
 
 
@@ -11,9 +10,16 @@ class EventState:
         # --- inputs
         self.enum = enum
         self.transition_dict = transition_dict
+        self.model = None
+        self.rng = None
         # --- numpy arrays
         self.values = None
         self.probabilities = None
+        # --- Dense transition table with one axis per key dimension. See `find_probabilities`.
+        self.transition_array = None
+        self.key_offsets = None
+        # --- Set when transitions are scheduled with waiting times
+        self.scheduler = None
         # --- quality of life variables
         self.integers = [item.value for item in enum]
         self.names = [item.name for item in enum]
@@ -22,15 +28,55 @@ class EventState:
         self.values = np.zeros(count, dtype=dtype)
         self.values.fill(state.value)
 
-    def find_probabilities(self, keys: List[tuple]) -> np.array:
-        """ Given a set of keys, create a list of probabilities
+    def compact(self, keep: np.array):
+        """ Keep only the agents at the given indices
         """
-
-        # Return the probabilities
-        probabilities = np.zeros(len(keys))
-        for i in range(len(keys)):
-            probabilities[i] = self.transition_dict[keys[i]]
-        return probabilities
+        self.values = self.values[keep]
+        if self.probabilities is not None:
+            self.probabilities = self.probabilities[keep]
+        if self.scheduler is not None:
+            self.scheduler.compact(keep)
+
+    def get_state(self) -> dict:
+        """ Return the agent arrays of the state. They are not copied.
+        """
+        state = {"values": self.values, "probabilities": None, "scheduler": None}
+        if self.probabilities is not None:
+            state["probabilities"] = self.probabilities
+        if self.scheduler is not None:
+            state["scheduler"] = self.scheduler.get_state()
+        return state
+
+    def set_state(self, state: dict):
+        self.values = state["values"]
+        if state["probabilities"] is not None:
+            self.probabilities = state["probabilities"]
+        if state["scheduler"] is not None:
+            self.scheduler.set_state(state["scheduler"])
+
+    def select_agents(self, eligible: np.array, use_agents: np.array = None) -> np.array:
+        """ Return the eligible agents that transition this month
+
+        Args:
+            eligible (np.array): Mask of the agents that can transition
+            use_agents (np.array, optional): The index array of `eligible`, if it is already known
+        """
+        if self.scheduler is not None:
+            return self.scheduler.select(self.probabilities, eligible, living=self.model.life.living)
+        if use_agents is None:
+            use_agents = self.model.unique_ids[eligible]
+        random = self.rng.for_agents(use_agents)
+        return self.model.kernels.select(use_agents, self.probabilities, random)
+
+    def find_probabilities(self, *keys) -> np.array:
+        """ Look up probabilities in the dense transition array
+
+        Args:
+            keys: One integer or array of integers per leading key dimension of the transition dictionary, in the order
+                of its keys. Arrays are broadcast together. Key dimensions that are left out remain as trailing axes.
+        """
+        index = tuple(np.asarray(key) - offset for key, offset in zip(keys, self.key_offsets))
+        return self.transition_array[index]
 
 
 class GenericState(IntEnum):
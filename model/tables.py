@@ -0,0 +1,73 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from model.misc_functions import dict_to_array, power_transition_dict
+
+
+class TransitionTables:
+    def __init__(self):
+        """ Load each transition dictionary, and the arrays derived from it, once per file
+            - Models created with the same TransitionTables share their tables. Files are identified by their resolved
+              path, so the symlinked tables of a batch are shared between scenarios.
+            - Shared tables must never be modified. Arrays are returned read only.
+            - Transition dictionaries hold probabilities per time step of `table_steps_per_year`. Models with fewer
+              steps per year use tables converted with `power_transition_dict`.
+        """
+        self.cache = dict()
+
+    def get(self, key: tuple, build):
+        """ Return the table stored under `key`, calling `build()` to create it the first time
+        """
+        if key not in self.cache:
+            self.cache[key] = build()
+        return self.cache[key]
+
+    def nbytes(self) -> int:
+        """ Return the number of bytes of the arrays in the cache. Dictionaries are not counted.
+        """
+        tables = [table for value in self.cache.values() for table in (value if isinstance(value, tuple) else [value])]
+        return sum(table.nbytes for table in tables if isinstance(table, np.ndarray))
+
+    def load(self, path: Path, steps: int = 1, state_key: int = None) -> dict:
+        """ Return the transition dictionary stored in a pickle file
+
+        Args:
+            path (Path): The pickle file
+            steps (int, optional): Convert the dictionary to `steps` of its time steps. Defaults to 1.
+            state_key (int, optional): See `power_transition_dict`. Defaults to None.
+        """
+
+        def build():
+            if steps != 1:
+                return power_transition_dict(self.load(path), steps, state_key)
+            with open(path, "rb") as openfile:
+                return pickle.load(openfile)
+
+        return self.get(("dict", Path(path).resolve(), steps), build)
+
+    def array(self, path: Path, steps: int = 1, state_key: int = None) -> (np.array, np.array):
+        """ Return the transition dictionary of a pickle file as a dense array, with the offsets of its key dimensions.
+        See `load` and `dict_to_array`.
+        """
+
+        def build():
+            array, offsets = dict_to_array(self.load(path, steps, state_key))
+            array.setflags(write=False)
+            offsets.setflags(write=False)
+            return array, offsets
+
+        return self.get(("array", Path(path).resolve(), steps), build)
+
+
+def table_steps(params) -> int:
+    """ Return the number of time steps of the transition dictionaries in one time step of the model
+    """
+    if params.table_steps_per_year % params.steps_per_year != 0:
+        raise ValueError(
+            "steps_per_year ({}) must divide table_steps_per_year ({})".format(
+                params.steps_per_year, params.table_steps_per_year
+            )
+        )
+    return params.table_steps_per_year // params.steps_per_year
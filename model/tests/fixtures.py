@@ -1,4 +1,7 @@
+import shutil
 from pathlib import Path
+
+import pandas as pd
 import pytest
 
 from model.logger import LoggerFactory
@@ -25,3 +28,29 @@ def model_vaccination():
     model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
     model_vaccination = model
     return model_vaccination
+
+
+@pytest.fixture(scope="function")
+def make_scenario(tmp_path):
+    """ Return a function that creates a small scenario in a temporary directory, with the transition dictionaries of
+    the base scenario. Tests add the parameters they depend on to the 500 agents and 60 time steps of the scenario.
+    """
+
+    def make(name: str = "test", parameters: str = "") -> Path:
+        scenario_dir = tmp_path.joinpath(f"scenario_{name}")
+        scenario_dir.mkdir()
+        shutil.copytree(
+            Path("experiments/usa/scenario_base/transition_dictionaries"),
+            scenario_dir.joinpath("transition_dictionaries"),
+        )
+        scenario_dir.joinpath("parameters.yml").write_text("num_agents: 500\nnum_steps: 60\n" + parameters)
+        return scenario_dir
+
+    return make
+
+
+def read_output(iteration_dir: Path) -> tuple:
+    return (
+        pd.read_parquet(iteration_dir.joinpath("state_changes.parquet")),
+        pd.read_parquet(iteration_dir.joinpath("events.parquet")),
+    )
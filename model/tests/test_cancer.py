@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from model.cancer import Cancer
+from model.cervical_model import CervicalModel
+from model.kernels import NumpyKernels
+from model.logger import LoggerFactory
+from model.misc_functions import normalize
+from model.state import CancerDetectionState, CancerState, LifeState, TimeSinceCancerDetectionState
+from model.tests.fixtures import make_scenario
+
+
+def test_cancer_tables(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    cancer = model.cancer
+    # ----- The dense tables should match the transition dictionary for every progressing key
+    for (detection, state), row in cancer.transition_dict.items():
+        index = (detection - cancer.key_offsets[0], state - cancer.key_offsets[1])
+        assert np.isclose(cancer.transition_probability_array[index], 1 - row[state - 1])
+        if state in [CancerState.LOCAL, CancerState.REGIONAL] and cancer.transition_probability_array[index] > 0:
+            probs = list(row)
+            probs[state - 1] = 0
+            assert np.allclose(cancer.next_state_cdf[index], normalize(probs))
+    assert not cancer.next_state_cdf.flags.writeable
+
+
+def test_cancer_tables_without_normal():
+    # Tables whose cancer keys start after NORMAL still draw new states counted from the first CancerState
+    detected = CancerDetectionState.UNDETECTED.value
+    cancer_dict = {
+        (detected, CancerState.LOCAL.value): [0, 0.5, 0.3, 0.1, 0.1],
+        (detected, CancerState.REGIONAL.value): [0, 0, 0.6, 0.4, 0],
+    }
+    transition_array, offsets, probabilities, cdf = Cancer.make_tables(cancer_dict)
+    assert offsets == (detected, CancerState.LOCAL.value)
+    assert np.allclose(probabilities, [[0.5, 0.4]])
+    assert np.allclose(cdf[0, 0], [0, 0, 0.6, 0.8, 1])
+    assert np.allclose(cdf[0, 1], [0, 0, 0, 1, 1])
+
+    index = (np.array([0, 0, 0, 0]), np.array([0, 0, 0, 1]))
+    new = NumpyKernels().draw_states(cdf, index, np.array([0.1, 0.7, 0.9, 0.5]), CancerState.NORMAL.value, np.int8)
+    assert new.tolist() == [CancerState.REGIONAL, CancerState.DISTANT, CancerState.DEAD, CancerState.DISTANT]
+
+
+def test_cancer_step(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    cancer = model.cancer
+    before = {key: list(value) for key, value in cancer.transition_dict.items()}
+    # ----- Every agent with LOCAL cancer progresses
+    unique_ids = model.unique_ids[:100]
+    cancer.values[unique_ids] = CancerState.LOCAL
+    model.life.update_living()
+    cancer.probabilities.fill(0)
+    cancer.probabilities[unique_ids] = 1
+    cancer.step()
+    model.dependencies.flush()
+
+    new = cancer.values[unique_ids]
+    assert (new > CancerState.LOCAL).all()
+    assert {key: list(value) for key, value in cancer.transition_dict.items()} == before
+    # --- The dependent probabilities follow the new cancer states
+    undetected = CancerDetectionState.UNDETECTED.value
+    assert np.allclose(cancer.probabilities[unique_ids], [1 - before[(undetected, s)][s - 1] for s in new])
+    detection = model.cancer_detection
+    assert np.allclose(detection.probabilities[unique_ids], [detection.transition_dict[s] for s in new])
+    life = model.life
+    assert np.allclose(
+        life.probabilities[unique_ids],
+        [life.transition_dict[(model.age, h, s)] for h, s in zip(model.hiv.values[unique_ids], new)],
+    )
+    # --- Agents who reach the DEAD cancer state die
+    dead = unique_ids[new == CancerState.DEAD]
+    assert (life.values[dead] == LifeState.DEAD).all()
+    assert not life.living[dead].any()
+
+
+def test_time_since_detection(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    detection = model.cancer_detection
+    unique_ids = model.unique_ids[:10]
+    model.cancer.values[unique_ids] = CancerState.LOCAL
+    model.life.update_living()
+    detection.probabilities[unique_ids] = 1
+    detection.step()
+    assert (detection.detection_time[unique_ids] == model.time).all()
+    assert (detection.time_since_detection[unique_ids] == TimeSinceCancerDetectionState.WITHIN_5_YEARS).all()
+    assert (detection.time_since_detection[10:] == 0).all()
+
+    # ----- Agents move to BEYOND_5_YEARS once more than 5 years have passed
+    model.time += 5 * model.params.steps_per_year
+    detection.update_time_since_detection()
+    assert (detection.time_since_detection[unique_ids] == TimeSinceCancerDetectionState.WITHIN_5_YEARS).all()
+    model.time += 1
+    detection.update_time_since_detection()
+    assert (detection.time_since_detection[unique_ids] == TimeSinceCancerDetectionState.BEYOND_5_YEARS).all()
+    assert (detection.time_since_detection[10:] == 0).all()
+
+
+def test_treatment_costs(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    unique_ids = model.unique_ids[:9]
+    model.cancer.values[unique_ids] = np.repeat([CancerState.LOCAL, CancerState.REGIONAL, CancerState.DISTANT], 3)
+    model.life.update_living()
+    model.cancer_detection.probabilities[unique_ids] = 1
+    model.cancer_detection.step()
+
+    events = model.events.make_events()
+    assert list(events.Unique_ID) == list(unique_ids)
+    treatment = model.params.treatment
+    costs = [treatment.cancer_cost_local, treatment.cancer_cost_regional, treatment.cancer_cost_distant]
+    assert list(events.Cost) == list(np.repeat(costs, 3))
+
+    model.cancer.values[model.unique_ids[9]] = CancerState.DEAD
+    with pytest.raises(NotImplementedError):
+        model.cancer_detection.treat_cancer(model.unique_ids[9:10])
+
+
+__all__ = ["make_scenario"]
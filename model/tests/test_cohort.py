@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from model.cervical_model import CervicalModel
+from model.cohort import CohortModel
+from model.logger import LoggerFactory
+from model.state import CancerState, HivState, HpvState, HpvStrain, LifeState
+from model.tests.fixtures import make_scenario
+
+
+def test_cohort_conserves_agents(make_scenario):
+    scenario_dir = make_scenario(parameters="num_steps: 600\nvaccination:\n  schedule:\n    12: 0.5\n")
+    cohort = CohortModel(scenario_dir).run()
+    alive = cohort.count_in(LifeState.id, (LifeState.ALIVE.value,))
+    deaths = cohort.count_new(LifeState.id, (LifeState.DEAD.value,)).cumsum()
+    assert np.allclose(alive + deaths, 500)
+    # --- Every living agent is in exactly one state of each strain
+    for strain in HpvStrain:
+        in_states = cohort.count_in(strain.name, tuple(state.value for state in HpvState))
+        assert np.allclose(in_states, alive)
+    assert cohort.count_in(CancerState.id, (CancerState.LOCAL.value,)).iloc[-1] > 0
+    assert cohort.incidence(CancerState.id, (CancerState.LOCAL.value,)).sum() > 0
+
+
+def test_cohort_matches_agents(make_scenario):
+    # The expected state occupancy should be close to the average of a large agent run
+    scenario_dir = make_scenario(parameters="num_agents: 4000\nnum_steps: 240\n")
+    model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+    model.run()
+    living = model.life.living
+    cohort = CohortModel(scenario_dir).run()
+    alive = cohort.occupancy_rows[-1][(LifeState.id, LifeState.ALIVE.value)]
+    assert abs(living.sum() - alive) < 20
+    hiv = cohort.occupancy_rows[-1][(HivState.id, HivState.HIV.value)] / alive
+    assert abs((model.hiv.values[living] == HivState.HIV).mean() - hiv) < 0.03
+    sixteen = model.hpv.values[HpvStrain.SIXTEEN - 1, living] != HpvState.NORMAL
+    normal = cohort.occupancy_rows[-1][(HpvStrain.SIXTEEN.name, HpvState.NORMAL.value)] / alive
+    assert abs(sixteen.mean() - (1 - normal)) < 0.02
+
+
+def test_cohort_does_not_screen(make_scenario):
+    scenario_dir = make_scenario(parameters="screening:\n  protocol: dna_then_treatment\n")
+    with pytest.raises(ValueError):
+        CohortModel(scenario_dir)
+
+
+__all__ = ["make_scenario"]
@@ -0,0 +1,54 @@
+import numpy as np
+
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.state import CancerState, HivState
+from model.tests.fixtures import make_scenario
+
+
+def test_cancer_onset(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    unique_ids = model.unique_ids[:10]
+    model.cancer.values[unique_ids] = CancerState.LOCAL
+    model.dependencies.invalidate("cancer_onset", unique_ids[:5])
+    model.dependencies.invalidate("cancer_onset", unique_ids[3:])
+
+    # ----- Agents are queued for each dependent probability until the queue is flushed
+    assert len(model.dependencies.queue["life"]) == 2
+    assert not model.dependencies.queue["cancer_detection"]
+    life = model.life.probabilities.copy()
+    model.dependencies.flush()
+    assert not any(model.dependencies.queue.values())
+
+    # ----- Cancer and life probabilities follow the new state. Detection is only refreshed as cancer progresses.
+    assert np.array_equal(
+        model.cancer.probabilities[unique_ids],
+        model.cancer.find_transition_probabilities(unique_ids).astype(model.cancer.probabilities.dtype),
+    )
+    assert np.array_equal(
+        model.life.probabilities[unique_ids],
+        model.life.find_agent_probabilities(unique_ids).astype(model.life.probabilities.dtype),
+    )
+    assert np.array_equal(model.life.probabilities[10:], life[10:])
+    assert (model.cancer_detection.probabilities[unique_ids] == 0).all()
+
+
+def test_queue_survives_later_selections(make_scenario):
+    model = CervicalModel(make_scenario(), 0, logger=LoggerFactory().create_logger())
+    model.hiv.probabilities[:] = 0
+    model.hiv.probabilities[:5] = 1
+    model.cancer.values[10:20] = CancerState.LOCAL
+    model.cancer.probabilities[:] = 1
+
+    # ----- Step HIV and then cancer before flushing: The cancer selection reuses the buffer HIV selected from
+    model.hiv.step()
+    model.cancer.step()
+    hiv_agents = model.unique_ids[model.hiv.values == HivState.HIV]
+    assert np.array_equal(hiv_agents, np.arange(5))
+    assert np.array_equal(model.dependencies.queue["hpv"][0], hiv_agents)
+    cancer_agents = model.unique_ids[model.cancer.values != CancerState.NORMAL]
+    assert len(cancer_agents) > 0
+    assert np.array_equal(np.concatenate(model.dependencies.queue["life"]), np.concatenate([hiv_agents, cancer_agents]))
+
+
+__all__ = ["make_scenario"]
@@ -1,3 +1,5 @@
+import numpy as np
+
 from model.tests.fixtures import model_base
 from model.state import HivState
 
@@ -9,14 +11,26 @@ def test_hiv(model_base):
     assert min(model_base.hiv.values) == HivState.NORMAL
 
     # ----- Update probabilities for 9 year olds
-    model_base.hiv.transition_dict[(9,)] = 0.25
+    model_base.hiv.transition_array = model_base.hiv.transition_array.copy()
+    model_base.hiv.transition_array[9 - model_base.hiv.key_offsets[0]] = 0.25
     model_base.hiv.update_probabilities()
     assert model_base.hiv.probabilities.mean() == 0.25
 
     # ----- Step
     model_base.hiv.step()
+    model_base.dependencies.flush()
     assert model_base.hiv.values.mean() > 1.2
     assert model_base.hiv.values.mean() < 1.3
 
+    # ----- Infected agents have their HPV and life probabilities refreshed
+    infected = model_base.unique_ids[model_base.hiv.values == HivState.HIV]
+    life = model_base.life
+    assert np.array_equal(
+        life.probabilities[infected], life.find_agent_probabilities(infected).astype(life.probabilities.dtype)
+    )
+    hpv = model_base.hpv
+    expected = hpv.find_transition_probabilities(np.arange(len(hpv.strains))[:, None], infected)
+    assert np.array_equal(hpv.probabilities[:, infected], expected.astype(hpv.probabilities.dtype))
+
 
 __all__ = ["model_base"]
@@ -35,4 +35,38 @@ def test_hpv_updates(model_base):
         assert model_base.cancer.probabilities[unique_id] > 0
 
 
+def test_hpv_transition_array(model_base):
+    # ----- The dense tables should match the transition dictionary for every key
+    strain = model_base.hpv_strains[1]
+    offsets = strain.key_offsets
+    for (age, _, immunity, state, hiv), probs_list in strain.transition_dict.items():
+        index = (age - offsets[0], immunity - offsets[1], state - offsets[2], hiv - offsets[3])
+        assert list(strain.transition_array[index]) == list(probs_list)
+        assert strain.transition_probability_array[index] == 1 - probs_list[state - 1]
+
+
+def test_hpv_step_leaves_current_state(model_base):
+    # ----- Selected agents always move to a different state
+    strain = model_base.hpv_strains[2]
+    strain.values.fill(HpvState.HPV)
+    strain.probabilities.fill(1)
+    eligible = model_base.life.living & (model_base.cancer.values == CancerState.NORMAL)
+    strain.step()
+    assert all(strain.values[eligible] != HpvState.HPV)
+    assert all(strain.values[~eligible] == HpvState.HPV)
+
+
+def test_hpv_strain_views(model_base):
+    # ----- Each strain reads and writes its row of the (strain x agent) matrices
+    for strain in model_base.hpv_strains.values():
+        assert strain.values.base is model_base.hpv.values
+        assert strain.probabilities.base is model_base.hpv.probabilities
+        assert strain.hpv_immunity.base is model_base.hpv.hpv_immunity
+    strain = model_base.hpv_strains[3]
+    strain.values[0] = HpvState.CIN_3
+    assert model_base.hpv.values[strain.row, 0] == HpvState.CIN_3
+    model_base.hpv.update_hpv_state()
+    assert model_base.max_hpv_state.values[0] == HpvState.CIN_3
+
+
 __all__ = ["model_base"]
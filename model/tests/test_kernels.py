@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from model.kernels import NumpyKernels, backends, make_kernels
+
+
+@pytest.fixture(params=list(backends))
+def kernels(request):
+    return backends[request.param]()
+
+
+def test_make_kernels():
+    # An unknown backend is an error. numpy is always available
+    assert isinstance(make_kernels("numpy"), NumpyKernels)
+    with pytest.raises(KeyError):
+        make_kernels("fortran")
+
+
+def test_select(kernels):
+    rng = np.random.RandomState(0)
+    probabilities = rng.rand(1000)
+    unique_ids = np.arange(0, 1000, 3)
+    random = rng.rand(len(unique_ids))
+    expected = unique_ids[probabilities[unique_ids] > random]
+    assert np.array_equal(kernels.select(unique_ids, probabilities, random), expected)
+
+
+def test_select_pairs(kernels):
+    # Pairs are ordered by row, then agent, to match np.nonzero
+    rng = np.random.RandomState(0)
+    probabilities = rng.rand(4, 500)
+    rows, unique_ids = np.array([1, 3]), np.arange(0, 500, 2)
+    random = rng.rand(len(rows), len(unique_ids))
+    row_index, agent_index = np.nonzero(probabilities[np.ix_(rows, unique_ids)] > random)
+    selected_rows, selected_agents = kernels.select_pairs(probabilities, rows, unique_ids, random)
+    assert np.array_equal(selected_rows, rows[row_index])
+    assert np.array_equal(selected_agents, unique_ids[agent_index])
+
+
+def test_draw_states(kernels):
+    # The drawn state is the first cdf column above the random number
+    cdf = np.array([[[0.2, 0.5, 1.0], [0.0, 0.0, 1.0]], [[1.0, 1.0, 1.0], [0.3, 0.6, 1.0]]])
+    index = (np.array([0, 0, 0, 1, 1, 0]), np.array([0, 0, 1, 0, 1, 0]))
+    random = np.array([0.1, 0.3, 0.4, 0.9, 0.65, 0.99])
+    new = kernels.draw_states(cdf, index, random, 2, np.int8)
+    assert new.dtype == np.int8
+    assert new.tolist() == [2, 3, 4, 2, 4, 4]
+
+
+def test_backends_agree():
+    # Every backend must draw the same next states from the same random numbers
+    pytest.importorskip("numba")
+    rng = np.random.RandomState(0)
+    cdf = np.cumsum(rng.dirichlet(np.ones(6), size=(4, 3, 6, 2)), axis=-1)
+    cdf[..., -1] = 1
+    values = rng.randint(1, 7, size=(4, 100)).astype(np.int8)
+    immunity = rng.randint(1, 4, size=(4, 100)).astype(np.int8)
+    hiv = rng.randint(1, 3, size=100).astype(np.int8)
+    rows, unique_ids = rng.randint(0, 4, size=50), rng.randint(0, 100, size=50)
+    random = rng.rand(50)
+
+    results = []
+    for backend in backends.values():
+        new = backend().next_states(cdf, values, immunity, hiv, (1, 1, 1), rows, unique_ids, random, 1, np.int8)
+        results.append(new.copy())
+    for new in results:
+        assert np.array_equal(new, results[0])
+    assert results[0].min() >= 1 and results[0].max() <= 6
+
+    index = (immunity[rows, unique_ids] - 1, values[rows, unique_ids] - 1)
+    results = [
+        backend().draw_states(cdf[0, ..., 0, :], index, random, 1, np.int8).copy() for backend in backends.values()
+    ]
+    for new in results:
+        assert np.array_equal(new, results[0])
@@ -1,3 +1,5 @@
+import numpy as np
+
 from model.tests.fixtures import model_base
 from model.state import LifeState, AgeGroup, CancerState, HivState
 
@@ -19,6 +21,14 @@ def test_update_probabilities(model_base):
     assert round(model_base.life.probabilities.mean(), 5) == round(model_base.life.transition_dict[(100, 1, 1)], 5)
 
 
+def test_find_probabilities(model_base):
+    # Encoded key lookups should match the transition dictionary
+    hiv = np.array([HivState.NORMAL, HivState.HIV, HivState.HIV])
+    cancer = np.array([CancerState.NORMAL, CancerState.LOCAL, CancerState.DEAD])
+    expected = [model_base.life.transition_dict[(50, h, c)] for h, c in zip(hiv, cancer)]
+    assert list(model_base.life.find_probabilities(50, hiv, cancer)) == expected
+
+
 def test_life_step(model_base):
     # Women should die in the model
     model_base.life.probabilities.fill(0.5)
@@ -27,4 +37,36 @@ def test_life_step(model_base):
     assert model_base.life.values.mean() < 1.6
 
 
+def test_living_views(model_base):
+    # Agents who die are removed from the living views without rebuilding them
+    unique_ids = model_base.life.living_ids[:5]
+    model_base.life.die(unique_ids)
+    assert not model_base.life.living[unique_ids].any()
+    assert not model_base.life.living_cancer_free[unique_ids].any()
+    assert not np.isin(unique_ids, model_base.life.living_ids).any()
+    # The maintained views should match a full rebuild
+    living_ids = model_base.life.living_ids
+    living_cancer_free = model_base.life.living_cancer_free.copy()
+    model_base.life.update_living()
+    assert np.array_equal(model_base.life.living_ids, living_ids)
+    assert np.array_equal(model_base.life.living_cancer_free, living_cancer_free)
+
+
+def test_compaction(model_base):
+    # Compaction drops the dead but keeps the recorded Unique_ID of each living agent
+    living_ids = model_base.life.living_ids
+    agent_ids = model_base.agent_ids[living_ids]
+    hpv_values = model_base.hpv.values[:, living_ids]
+    model_base.last_screen_age[living_ids[-1]] = 30
+    model_base.dicts.cin_treatment_methods[int(living_ids[-1])] = 1
+    model_base.compact()
+    assert len(model_base.unique_ids) == len(living_ids)
+    assert all(model_base.life.values == LifeState.ALIVE)
+    assert np.array_equal(model_base.agent_ids, agent_ids)
+    assert np.array_equal(model_base.hpv.values, hpv_values)
+    assert np.array_equal(model_base.hpv_strains[1].values, hpv_values[0])
+    assert model_base.last_screen_age[len(living_ids) - 1] == 30
+    assert model_base.dicts.cin_treatment_methods[len(living_ids) - 1] == 1
+
+
 __all__ = ["model_base"]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.misc_functions import EventStorage
+from model.tests.fixtures import make_scenario, read_output
+
+
+def test_compact_profile(make_scenario):
+    reports = dict()
+    for profile in ["default", "compact"]:
+        scenario_dir = make_scenario(name=profile, parameters="memory_profile: {}\nsample_waiting_times: True\n".format(profile)
+        )
+        model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+        model.run()
+        reports[profile] = model.memory_report()
+    assert model.unique_ids.dtype == np.uint32
+    for state in [model.life, model.hiv, model.cancer, model.cancer_detection, model.hpv]:
+        assert state.probabilities.dtype == np.float32
+        assert state.values.dtype == np.int8
+    assert model.life.scheduler.scheduled_probabilities.dtype == np.float32
+    assert model.cancer_detection.detection_time.dtype == np.uint16
+    assert model.last_screen_age.dtype == np.int8
+    state_changes, events = read_output(model.iteration_dir)
+    assert state_changes.Time.dtype == np.uint16 and state_changes.Unique_ID.dtype == np.uint32
+    assert events.Time.dtype == np.uint16
+    assert reports["compact"]["per_agent"] < 0.7 * reports["default"]["per_agent"]
+    assert reports["compact"]["total"] < reports["default"]["total"]
+
+
+def test_unknown_profile(make_scenario):
+    scenario_dir = make_scenario(parameters="memory_profile: tiny\n")
+    with pytest.raises(ValueError):
+        CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+
+
+def test_compact_profile_ages(make_scenario):
+    # Ages are kept in int8 by the compact profile, so runs may not reach age 128
+    parameters = "memory_profile: compact\ninitial_age: 100\nnum_steps: 12000\n"
+    with pytest.raises(ValueError):
+        CervicalModel(make_scenario(parameters=parameters), 0, logger=LoggerFactory().create_logger())
+
+
+def test_event_buffers():
+    # Events are written into buffers that grow as needed. Rows keep their order, and columns without a dtype are
+    # promoted like np.concatenate would.
+    storage = EventStorage(["Time", "Value"])
+    storage.initial_capacity = 4
+    storage.record_event((0, 1))
+    storage.record_events((1, np.arange(5, dtype=np.int8)))
+    buffer = storage.columns[0]
+    storage.record_events((2, np.array([0.5])))
+    storage.record_event((3, 2))
+    assert storage.columns[0] is buffer
+    events = storage.make_events()
+    assert events.Time.tolist() == [0, 1, 1, 1, 1, 1, 2, 3]
+    assert events.Value.tolist() == [1, 0, 1, 2, 3, 4, 0.5, 2]
+    assert events.Value.dtype == np.float64
+
+    # --- The state holds the recorded events, and can be restored into another storage
+    other = EventStorage(["Time", "Value"])
+    other.set_state(storage.get_state())
+    assert other.make_events().equals(events)
+
+
+__all__ = ["make_scenario"]
@@ -0,0 +1,23 @@
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.tests.fixtures import make_scenario, read_output
+
+
+def test_stacked_replicates_match_single_runs(make_scenario):
+    # Each replicate of a stacked run should be identical to running its seed alone, also after compaction
+    scenario_dir = make_scenario(parameters="compaction_interval: 1\n")
+    logger = LoggerFactory().create_logger()
+    seeds = [11, 22]
+    model = CervicalModel(scenario_dir, 0, logger=logger, replicate_seeds=seeds)
+    assert model.num_agents == 1000
+    model.run()
+    for replicate, seed in enumerate(seeds):
+        CervicalModel(scenario_dir, 5, logger=logger, seed=seed).run()
+        state_changes, events = read_output(scenario_dir.joinpath(f"iteration_{replicate}"))
+        single_state_changes, single_events = read_output(scenario_dir.joinpath("iteration_5"))
+        assert len(state_changes) > 0
+        assert state_changes.equals(single_state_changes)
+        assert events.equals(single_events)
+
+
+__all__ = ["make_scenario"]
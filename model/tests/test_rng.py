@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from model.rng import RandomService, hash_uniform, hash_uniform_scalar
+
+
+def test_streams_are_reproducible():
+    # The same seed and stream name give the same numbers, regardless of the other streams
+    a = RandomService(seed=5)
+    b = RandomService(seed=5)
+    a.stream("life").rand(100)
+    assert np.array_equal(a.stream("hpv").rand(10), b.stream("hpv").rand(10))
+    assert not np.array_equal(a.stream("life").rand(10), b.stream("hpv").rand(10))
+
+
+def test_buffering_does_not_change_values():
+    # Values depend only on how many numbers were drawn before them, not on how they were requested
+    a = RandomService(seed=5, buffer_size=16).stream("hpv")
+    b = RandomService(seed=5, buffer_size=16).stream("hpv")
+    values = np.concatenate([[a.rand()], a.rand(3), a.rand(2, 20).ravel(), [a.random()], a.rand(7)])
+    assert np.array_equal(values, b.rand(len(values)))
+
+
+def test_choice():
+    stream = RandomService(seed=5).stream("treatment")
+    choices = [stream.choice([0, 1], p=[0.25, 0.75]) for _ in range(4000)]
+    assert abs(np.mean(choices) - 0.75) < 0.03
+
+
+def test_legacy():
+    # Legacy mode draws every stream from a single shared RandomState
+    rng = RandomService(seed=5, bit_generator="legacy")
+    assert rng.stream("hpv").generator is rng.stream("life").generator
+    assert np.array_equal(rng.rand(5), np.random.RandomState(5).rand(5))
+    with pytest.raises(ValueError):
+        RandomService(seed=5, bit_generator="mt")
+
+
+def test_common_random_numbers():
+    # An agent's numbers depend on the agent, time step and draw, not on the other agents or the draw order
+    model = SimpleNamespace(time=3, agent_ids=np.arange(100), replicate_size=100, num_agents=100)
+    rng = RandomService(seed=5, common_random_numbers=True, model=model)
+    stream = rng.stream("life")
+    values = stream.for_agents(np.array([3, 5, 7]))
+    assert stream.for_agents(np.array([5]))[0] == values[1]
+    assert stream.for_agent(7) == values[2]
+    assert stream.for_agents(np.array([5]), draw=1)[0] != values[1]
+    assert rng.stream("hiv").for_agent(5) != values[1]
+    model.time = 4
+    assert stream.for_agent(5) != values[1]
+    # --- Uniform on [0, 1)
+    values = hash_uniform(5, 0, np.arange(100000))
+    assert values.min() >= 0 and values.max() < 1
+    assert abs(values.mean() - 0.5) < 0.01
+    assert hash_uniform_scalar(5, 0, 17) == values[17]
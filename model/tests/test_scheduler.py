@@ -0,0 +1,50 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from model.memory import DtypeProfile
+from model.rng import RandomService
+from model.scheduler import WaitingTimeScheduler
+
+
+def make_model(num_steps=1000):
+    rng = RandomService(seed=0).stream("test")
+    return SimpleNamespace(
+        time=0, rng=rng, params=SimpleNamespace(num_steps=num_steps), dtypes=DtypeProfile("default", num_steps)
+    )
+
+
+def test_waiting_times_are_geometric():
+    # The mean number of months before a transition is (1 - p) / p
+    model = make_model()
+    scheduler = WaitingTimeScheduler(model=model, count=100000, rng=model.rng)
+    scheduler.schedule(np.arange(100000), np.full(100000, 0.1), start=0)
+    waits = scheduler.next_time
+    assert abs(waits.mean() - 9) < 0.2
+
+
+def test_select_matches_monthly_rate():
+    # Each month, about p of the eligible agents transition. Ineligible agents never do
+    model = make_model()
+    scheduler = WaitingTimeScheduler(model=model, count=20000, rng=model.rng)
+    probabilities = np.full(20000, 0.05)
+    eligible = np.arange(20000) < 10000
+    counts = []
+    for time in range(24):
+        model.time = time
+        selected = scheduler.select(probabilities, eligible)
+        assert eligible[selected].all()
+        counts.append(len(selected))
+    assert abs(np.mean(counts) / 10000 - 0.05) < 0.005
+
+
+def test_probability_change_reschedules():
+    # Agents whose probability changes are redrawn: A probability of 0 never transitions, 1 always does
+    model = make_model()
+    scheduler = WaitingTimeScheduler(model=model, count=100, rng=model.rng)
+    eligible = np.ones(100, dtype=bool)
+    scheduler.select(np.full(100, 0.5), eligible)
+    model.time = 1
+    assert len(scheduler.select(np.zeros(100), eligible)) == 0
+    model.time = 2
+    assert len(scheduler.select(np.ones(100), eligible)) == 100
@@ -1,6 +1,10 @@
+import numpy as np
 import pytest
+from model.cervical_model import CervicalModel
 from model.event import Event
+from model.logger import LoggerFactory
 from model.screening import (
+    DnaScreeningTest,
     DnaThenTreatmentScreeningProtocol,
     DnaThenTriageScreeningProtocol,
     DnaThenViaScreeningProtocol,
@@ -13,7 +17,7 @@ from model.screening import (
 )
 from model.state import CancerDetectionState, CancerState, HivState, HpvState, HpvStrain
 
-from model.tests.fixtures import model_screening
+from model.tests.fixtures import make_scenario, model_screening
 
 
 def test_screening(model_screening):
@@ -52,16 +56,13 @@ def default_model(
     model.params.screening.interval_routine = 10
     model.age = age
     model.screening_state.values[unique_id] = screening_state
-    model.dicts.last_screen_age.pop(unique_id, None)
-    if last_screen_age:
-        model.dicts.last_screen_age[unique_id] = last_screen_age
+    model.last_screen_age[unique_id] = last_screen_age if last_screen_age else -1
     model.compliant_routine_state.values[unique_id] = compliant_routine
     model.compliant_surveillance_state.values[unique_id] = compliant_surveillance
     model.cancer_detection.values[unique_id] = cancer_detection
     model.cancer.values[unique_id] = cancer_state
     model.hiv.values[unique_id] = hiv_state
-    if hiv_detected:
-        model.hiv_detected.add(unique_id)
+    model.hiv_detected[unique_id] = hiv_detected
 
     for strain in model.hpv_strains:
         model.hpv_strains[strain].values[unique_id] = hpv_state
@@ -104,6 +105,13 @@ class MockScreeningTest:
     def get_result(self, *args, **kwargs):
         return self.result
 
+    def get_results(self, *args, unique_ids, **kwargs):
+        result = self.result
+        if isinstance(result, dict):
+            bits = DnaScreeningTest.STRAIN_BITS
+            result = sum(bits[strain] for strain, item in result.items() if item == ScreeningTestResult.POSITIVE)
+        return np.full(len(unique_ids), result, dtype=np.int8)
+
 
 class TestIsDue:
     # Check if women is due for screening
@@ -252,7 +260,7 @@ class TestNoScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == screening_state
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model.last_screen_age[unique_id] == -1
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert model.events.arr.size == 0
 
@@ -284,7 +292,7 @@ class TestProtocolNoncompliant:
         protocol.apply(unique_id)
 
         assert model_screening.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model_screening.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model_screening.last_screen_age[unique_id] == -1
         assert model_screening.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert model_screening.events.arr.size == 0
 
@@ -311,7 +319,7 @@ class TestProtocolNoncompliant:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert model.events.arr.size == 0
 
@@ -334,7 +342,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model.last_screen_age[unique_id] == -1
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert model.events.arr.size == 0
 
@@ -354,7 +362,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -377,7 +385,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -401,7 +409,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -425,7 +433,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -448,7 +456,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -471,7 +479,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -495,7 +503,7 @@ class TestViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -522,7 +530,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model.last_screen_age[unique_id] == -1
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert model.events.make_events().shape[0] == 0
 
@@ -543,7 +551,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -568,7 +576,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -595,7 +603,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -622,7 +630,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -646,7 +654,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -671,7 +679,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -698,7 +706,7 @@ class TestDnaThenTreatmentScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -728,7 +736,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model.last_screen_age[unique_id] == -1
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert len(model.events.make_events()) == 0
 
@@ -750,7 +758,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -775,7 +783,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -803,7 +811,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -833,7 +841,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -861,7 +869,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.RE_TEST
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -886,7 +894,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -910,7 +918,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -936,7 +944,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -963,7 +971,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -990,7 +998,7 @@ class TestDnaThenTriageScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.RE_TEST
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -1017,7 +1025,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 0
+        assert model.last_screen_age[unique_id] == -1
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         assert len(model.events.make_events()) == 0
 
@@ -1039,7 +1047,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -1064,7 +1072,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -1092,7 +1100,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -1122,7 +1130,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -1152,7 +1160,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.RE_TEST
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -1182,7 +1190,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -1212,7 +1220,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 20
+        assert model.last_screen_age[unique_id] == 20
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -1239,7 +1247,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == age
+        assert model.last_screen_age[unique_id] == age
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -1263,7 +1271,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.ROUTINE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 1
@@ -1288,7 +1296,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -1315,7 +1323,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -1341,7 +1349,7 @@ class TestDnaThenViaScreeningProtocol:
         )
         protocol.apply(unique_id)
         assert model.screening_state.values[unique_id] == ScreeningState.RE_TEST
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         print(events)
@@ -1369,7 +1377,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.UNDETECTED
         events = model.events.make_events()
         assert events.shape[0] == 3
@@ -1396,7 +1404,7 @@ class TestDnaThenViaScreeningProtocol:
         protocol.apply(unique_id)
 
         assert model.screening_state.values[unique_id] == ScreeningState.SURVEILLANCE
-        assert model.dicts.last_screen_age.get(unique_id, 0) == 40
+        assert model.last_screen_age[unique_id] == 40
         assert model.cancer_detection.values[unique_id] == CancerDetectionState.DETECTED
         events = model.events.make_events()
         assert events.shape[0] == 2
@@ -1406,4 +1414,39 @@ class TestDnaThenViaScreeningProtocol:
         assert events.Cost.values[1] == model.params.screening.via.cost
 
 
-__all__ = ["model_screening"]
+__all__ = ["make_scenario", "model_screening"]
+
+
+@pytest.mark.parametrize("protocol", ["via", "dna_then_treatment", "dna_then_via", "dna_then_triage"])
+def test_population_matches_single_agents(make_scenario, protocol):
+    """
+    Screening the whole population at once should give the same events and states as screening each woman on her own.
+    Common random numbers give every woman the same draws either way.
+    """
+
+    def make_model(name):
+        parameters = f"screening:\n  protocol: {protocol}\nrng:\n  common_random_numbers: true\n"
+        model = CervicalModel(make_scenario(name, parameters), 0, logger=LoggerFactory().create_logger())
+        model.age = 30
+        model.hpv.values[:, ::5] = HpvState.CIN_2
+        model.hpv.values[0, ::7] = HpvState.HPV
+        model.hpv.values[:, ::11] = HpvState.CANCER
+        model.cancer.values[::11] = CancerState.LOCAL
+        model.hpv.update_hpv_state()
+        model.life.update_living()
+        model.screening_state.values[::3] = ScreeningState.SURVEILLANCE
+        return model
+
+    population, single = make_model("population"), make_model("single")
+    population.screening_protocol.apply()
+    for unique_id in single.life.living_ids:
+        single.screening_protocol.apply(unique_id)
+
+    for name in ["events", "state_changes"]:
+        events = [getattr(model, name).make_events() for model in [population, single]]
+        events = [df.sort_values(list(df.columns)).reset_index(drop=True) for df in events]
+        assert len(events[0]) > 0
+        assert events[0].equals(events[1])
+    for name in ["screening_state", "cancer_detection"]:
+        assert np.array_equal(getattr(population, name).values, getattr(single, name).values)
+    assert np.array_equal(population.last_screen_age, single.last_screen_age)
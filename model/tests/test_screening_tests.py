@@ -1,12 +1,15 @@
 import collections
 import itertools
 
+import numpy as np
 import pytest
 import scipy.stats
 import pandas as pd
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
 from model.screening import CancerInspectionScreeningTest, DnaScreeningTest, ScreeningTestResult, ViaScreeningTest
 from model.state import CancerState, HpvState, HpvStrain
-from model.tests.fixtures import model_screening
+from model.tests.fixtures import make_scenario, model_screening
 
 
 Case = collections.namedtuple("Case", ["truth", "sensitive", "specific", "expected", "exception"])
@@ -382,7 +385,7 @@ class TestViaScreeningTest:
                     expected = ScreeningTestResult.NEGATIVE
                 else:
                     expected = ScreeningTestResult.POSITIVE
-            elif hpv == HpvState.CIN_2_3:
+            elif hpv in [HpvState.CIN_2, HpvState.CIN_3]:
                 if is_sensitive:
                     expected = ScreeningTestResult.POSITIVE
                 else:
@@ -442,7 +445,7 @@ class TestViaScreeningTest:
 
         t = ViaScreeningTest(model_screening)
         observed = (
-            pd.Series([t.get_result(HpvState.CIN_2_3, CancerState.NORMAL).value for _ in range(n_tries)])
+            pd.Series([t.get_result(HpvState.CIN_2, CancerState.NORMAL).value for _ in range(n_tries)])
             .value_counts()
             .loc[ScreeningTestResult.POSITIVE]
         )
@@ -490,4 +493,44 @@ class TestViaScreeningTestHelpers:
         assert observed == expected
 
 
-__all__ = ["model_screening"]
+class TestBatchResults:
+    """
+    The array variants of the screening tests should match the scalar results for every agent.
+    """
+
+    @pytest.fixture
+    def model(self, make_scenario):
+        parameters = "rng:\n  common_random_numbers: true\n"
+        return CervicalModel(make_scenario(parameters=parameters), 0, logger=LoggerFactory().create_logger())
+
+    def test_via_results(self, model):
+        t = ViaScreeningTest(model)
+        hpv = np.array([HpvState.NORMAL, HpvState.CIN_1, HpvState.CIN_2, HpvState.CIN_3, HpvState.CANCER] * 20)
+        cancer = np.where(hpv == HpvState.CANCER, CancerState.LOCAL, CancerState.NORMAL)
+        unique_ids = model.unique_ids[: len(hpv)]
+        results = t.get_results(hpv, cancer, unique_ids)
+        assert list(results) == [t.get_result(h, c, u).value for h, c, u in zip(hpv, cancer, unique_ids)]
+
+        with pytest.raises(ValueError):
+            t.get_results(np.array([HpvState.CANCER]), np.array([CancerState.NORMAL]))
+
+    def test_dna_results(self, model):
+        t = DnaScreeningTest(model)
+        hpv = np.where(np.random.default_rng(0).random((len(HpvStrain), 100)) < 0.3, HpvState.HPV, HpvState.NORMAL)
+        unique_ids = model.unique_ids[:100]
+        results = t.get_results(hpv, unique_ids)
+        for i, unique_id in enumerate(unique_ids):
+            expected = t.get_result({strain: hpv[row, i] for row, strain in enumerate(HpvStrain)}, unique_id)
+            assert {strain: bool(results[i] & bit) for strain, bit in t.STRAIN_BITS.items()} == {
+                strain: result == ScreeningTestResult.POSITIVE for strain, result in expected.items()
+            }
+
+    def test_cancer_inspection_results(self, model):
+        t = CancerInspectionScreeningTest(model)
+        cancer = np.array([CancerState.NORMAL, CancerState.LOCAL, CancerState.REGIONAL, CancerState.DISTANT] * 25)
+        unique_ids = model.unique_ids[: len(cancer)]
+        results = t.get_results(cancer, unique_ids)
+        assert list(results) == [t.get_result(c, u).value for c, u in zip(cancer, unique_ids)]
+
+
+__all__ = ["make_scenario", "model_screening"]
@@ -0,0 +1,100 @@
+import pickle
+
+import pytest
+
+from model.cervical_model import CervicalModel
+from model.variants import ForkedVariants
+from model.logger import LoggerFactory
+from model.tests.fixtures import make_scenario, read_output
+
+SCREENING = (
+    "screening:\n  protocol: dna_then_treatment\n  age_routine_start: 11\n  compliance:\n    never: 0.3\n"
+    "vaccination:\n  schedule:\n    12: 0.5\n"
+)
+
+
+def test_fork_matches_full_run(make_scenario):
+    # A scenario forked after two years of the base scenario matches a full run, as screening starts at 11. Agents are
+    # compacted every year, before and after the fork.
+    compaction = "compaction_interval: 1\n"
+    base_dir, screening_dir = make_scenario("base", compaction), make_scenario("screening", compaction + SCREENING)
+    logger = LoggerFactory().create_logger()
+    model = CervicalModel(base_dir, 0, logger=logger, seed=3)
+    for _ in range(24):
+        model.step()
+    state = pickle.loads(pickle.dumps(model.get_state()))
+    fork = model.fork(screening_dir, 0)
+    model.run()
+    fork.run()
+    restored = CervicalModel(screening_dir, 1, logger=logger, seed=3)
+    restored.set_state(state)
+    restored.run()
+    CervicalModel(screening_dir, 2, logger=logger, seed=3).run()
+    full_state_changes, full_events = read_output(screening_dir.joinpath("iteration_2"))
+    for iteration in [0, 1]:
+        state_changes, events = read_output(screening_dir.joinpath(f"iteration_{iteration}"))
+        assert state_changes.equals(full_state_changes)
+        assert events.equals(full_events)
+    assert len(full_events) > 0
+
+
+def test_set_state_requires_same_structure(make_scenario):
+    logger = LoggerFactory().create_logger()
+    model = CervicalModel(make_scenario("base"), 0, logger=logger, seed=3)
+    other = CervicalModel(make_scenario("small", "num_agents: 100\n"), 0, logger=logger, seed=3)
+    with pytest.raises(ValueError):
+        other.set_state(model.get_state())
+
+
+def test_variants_shared_steps(make_scenario):
+    base_dir, screening_dir = make_scenario("base"), make_scenario("screening", SCREENING)
+    logger = LoggerFactory().create_logger()
+    ForkedVariants([base_dir, screening_dir], 0, logger=logger, seed=3, shared_steps=24).run()
+    CervicalModel(screening_dir, 1, logger=logger, seed=3).run()
+    assert read_output(screening_dir.joinpath("iteration_0"))[1].equals(
+        read_output(screening_dir.joinpath("iteration_1"))[1]
+    )
+    # --- Interventions may not start during the shared steps
+    with pytest.raises(ValueError):
+        ForkedVariants([base_dir, screening_dir], 0, logger=logger, shared_steps=36)
+
+
+def test_resume_from_checkpoint(make_scenario):
+    # A run that crashes after a checkpoint continues from it and produces the same output as an uninterrupted run
+    scenario_dir = make_scenario("checkpoint", "checkpoint_interval: 2\ncompaction_interval: 1\n")
+    logger = LoggerFactory().create_logger()
+    model = CervicalModel(scenario_dir, 0, logger=logger, seed=3)
+    step = model.step
+
+    def crashing_step():
+        if model.time == 30:
+            raise RuntimeError("Crash")
+        step()
+
+    model.step = crashing_step
+    with pytest.raises(RuntimeError):
+        model.run()
+    assert model.checkpoint_path.exists()
+    assert not model.checkpoint_path.with_name("checkpoint.pickle.tmp").exists()
+
+    resumed = CervicalModel(scenario_dir, 0, logger=logger, seed=3)
+    assert resumed.resume()
+    assert resumed.time == 24
+    resumed.run()
+    assert not resumed.checkpoint_path.exists()
+    CervicalModel(scenario_dir, 1, logger=logger, seed=3).run()
+    for name in [0, 1]:
+        assert read_output(scenario_dir.joinpath("iteration_0"))[name].equals(
+            read_output(scenario_dir.joinpath("iteration_1"))[name]
+        )
+
+
+def test_invalid_checkpoint_is_ignored(make_scenario):
+    scenario_dir = make_scenario("checkpoint")
+    model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger(), seed=3)
+    model.checkpoint_path.write_bytes(b"partial")
+    assert not model.resume()
+    assert model.time == 0
+
+
+__all__ = ["make_scenario"]
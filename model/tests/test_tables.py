@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.misc_functions import power_transition_dict
+from model.tests.fixtures import make_scenario
+
+
+def test_power_transition_dict():
+    # --- Probabilities of a single transition
+    powered = power_transition_dict({(9,): 0.1, (10,): 0}, steps=3)
+    assert np.isclose(powered[(9,)], 1 - 0.9 ** 3)
+    assert powered[(10,)] == 0
+    # --- Rows of a transition matrix, keyed by (group, state). State 3 has no row and is absorbing.
+    rows = {(1, 1): [0.9, 0.1, 0], (1, 2): [0.2, 0.7, 0.1], (2, 1): [1, 0, 0]}
+    powered = power_transition_dict(rows, steps=2, state_key=1)
+    matrix = np.array([[0.9, 0.1, 0], [0.2, 0.7, 0.1], [0, 0, 1]])
+    assert np.allclose(powered[(1, 1)], (matrix @ matrix)[0])
+    assert np.allclose(powered[(1, 2)], (matrix @ matrix)[1])
+    assert np.allclose(powered[(2, 1)], [1, 0, 0])
+    assert power_transition_dict(rows, steps=1, state_key=1) is rows
+
+
+def test_coarse_time_steps(make_scenario):
+    scenario_dir = make_scenario(parameters="steps_per_year: 4\nnum_steps: 40\n")
+    model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+    assert model.table_steps == 3
+    life = model.tables.load(scenario_dir.joinpath("transition_dictionaries", "life_dictionary.pickle"))
+    assert np.isclose(model.life.transition_dict[(9, 1, 1)], 1 - (1 - life[(9, 1, 1)]) ** 3)
+    model.run()
+    assert model.age == 9 + 9
+
+    scenario_dir = make_scenario(name="weekly", parameters="steps_per_year: 52\n")
+    with pytest.raises(ValueError):
+        CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+
+
+__all__ = ["make_scenario"]
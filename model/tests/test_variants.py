@@ -0,0 +1,117 @@
+import gc
+import shutil
+import weakref
+
+import pytest
+
+from model.cervical_model import CervicalModel
+from model.variants import ForkedVariants
+from model.logger import LoggerFactory
+from model.tests.fixtures import make_scenario, read_output
+
+
+def test_variants_matches_single_runs(make_scenario):
+    # Forked variants share their tables, but each should be identical to running it alone
+    screening = "screening:\n  protocol: dna_then_treatment\nvaccination:\n  schedule:\n    9: 0.5\n"
+    scenario_dirs = [make_scenario("base"), make_scenario("screening", screening)]
+    # --- Link the tables, like the scenarios of a batch
+    transition_dir = scenario_dirs[1].joinpath("transition_dictionaries")
+    shutil.rmtree(transition_dir)
+    transition_dir.symlink_to(scenario_dirs[0].joinpath("transition_dictionaries").resolve())
+    logger = LoggerFactory().create_logger()
+    models = ForkedVariants(scenario_dirs, 0, logger=logger, seed=7)
+    models.run()
+    # --- Each table was loaded once for both variants
+    tables = CervicalModel(scenario_dirs[0], 9, logger=logger).tables
+    assert len(models.tables.cache) == len(tables.cache)
+    for scenario_dir in scenario_dirs:
+        CervicalModel(scenario_dir, 5, logger=logger, seed=7).run()
+        state_changes, events = read_output(scenario_dir.joinpath("iteration_0"))
+        single_state_changes, single_events = read_output(scenario_dir.joinpath("iteration_5"))
+        assert state_changes.equals(single_state_changes)
+        assert events.equals(single_events)
+
+
+def test_variants_requires_same_time_settings(make_scenario):
+    scenario_dirs = [make_scenario("base"), make_scenario("short", "num_steps: 24\n")]
+    with pytest.raises(ValueError):
+        ForkedVariants(scenario_dirs, 0, logger=LoggerFactory().create_logger())
+
+
+@pytest.mark.parametrize("shared_steps", [-1, 60, 61])
+def test_variants_requires_shared_steps_before_the_end(make_scenario, shared_steps):
+    scenario_dirs = [make_scenario("base"), make_scenario("other")]
+    with pytest.raises(ValueError):
+        ForkedVariants(scenario_dirs, 0, logger=LoggerFactory().create_logger(), shared_steps=shared_steps)
+
+
+def test_variants_holds_one_variant(make_scenario):
+    # Variants are created one at a time, from a single snapshot of the shared steps
+    screening = "screening:\n  protocol: via\n  age_routine_start: 30\n"
+    scenario_dirs = [make_scenario(name, screening * (name == "via")) for name in ["base", "via", "other"]]
+    models = ForkedVariants(scenario_dirs, 0, logger=LoggerFactory().create_logger(), shared_steps=24)
+    created = []
+    make_model = models.make_model
+
+    def tracked_model(scenario_dir):
+        gc.collect()
+        assert all(model() is None for model in created)
+        model = make_model(scenario_dir)
+        created.append(weakref.ref(model))
+        return model
+
+    models.make_model = tracked_model
+    models.run()
+    # --- The model of the shared steps, and one per variant. The first variant is created again after the shared steps.
+    assert len(created) == 5
+    CervicalModel(scenario_dirs[1], 5, logger=LoggerFactory().create_logger()).run()
+    for output, single_output in zip(*[read_output(scenario_dirs[1].joinpath(f"iteration_{i}")) for i in [0, 5]]):
+        assert output.equals(single_output)
+
+
+def test_variants_resumes(make_scenario, monkeypatch):
+    # An interrupted run of forked variants continues from the checkpoints of the shared steps and of each variant
+    screening = "screening:\n  protocol: via\n  age_routine_start: 30\n"
+    scenario_dirs = [
+        make_scenario(name, "checkpoint_interval: 1\n" + screening * (name == "via"))
+        for name in ["base", "via", "other"]
+    ]
+    logger = LoggerFactory().create_logger()
+    models = ForkedVariants(scenario_dirs, 0, logger=logger, shared_steps=30)
+    make_model = models.make_model
+
+    def crash(scenario_dir):
+        model = make_model(scenario_dir)
+        if scenario_dir.name == "scenario_via":
+            step = model.step
+
+            def crashing_step():
+                if model.time == 40:
+                    raise RuntimeError("Crash")
+                step()
+
+            model.step = crashing_step
+        return model
+
+    models.make_model = crash
+    with pytest.raises(RuntimeError):
+        models.run()
+    assert models.shared_checkpoint_path.exists()
+    assert scenario_dirs[1].joinpath("iteration_0", "checkpoint.pickle").exists()
+
+    # --- Rerun: The shared steps and the interrupted variant are not simulated again
+    steps = []
+    step = CervicalModel.step
+    monkeypatch.setattr(CervicalModel, "step", lambda model: steps.append(model.time) or step(model))
+    ForkedVariants(scenario_dirs, 0, logger=logger, shared_steps=30).run()
+    assert min(steps) == 30
+    assert steps.count(30) == 2
+    assert not models.shared_checkpoint_path.exists()
+    monkeypatch.undo()
+    for scenario_dir in scenario_dirs:
+        CervicalModel(scenario_dir, 5, logger=logger).run()
+        for output, single_output in zip(*[read_output(scenario_dir.joinpath(f"iteration_{i}")) for i in [0, 5]]):
+            assert output.equals(single_output)
+
+
+__all__ = ["make_scenario"]
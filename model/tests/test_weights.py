@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from model.analysis import add_weights, read_weights
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.state import HpvState
+from model.tests.fixtures import make_scenario, read_output
+
+
+def test_split_agents(make_scenario):
+    parameters = "num_steps: 120\nimportance:\n  split_factor: 3\n  split_hpv_state: {}\n".format(HpvState.HPV.value)
+    scenario_dir = make_scenario(parameters=parameters)
+    model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+    model.run()
+    weights = read_weights(model.iteration_dir)
+    parents = weights[weights.Unique_ID == weights.Parent_ID]
+    copies = weights[weights.Unique_ID != weights.Parent_ID]
+    assert len(parents) > 0
+    assert len(copies) == 2 * len(parents)
+    assert np.allclose(weights.Weight, 1 / 3)
+    # --- Copies are numbered after the original agents, and the total weight is unchanged
+    assert sorted(copies.Unique_ID) == list(range(500, 500 + len(copies)))
+    assert np.isclose(500 - len(parents) + weights.Weight.sum(), 500)
+    assert len(np.unique(model.agent_ids)) == len(model.agent_ids)
+
+    # --- Copies receive the history of their parent, which their parent already represents
+    state_changes, _ = read_output(model.iteration_dir)
+    weighted = add_weights(state_changes, weights, copy_parent_events=True)
+    copy = copies.iloc[0]
+    copied = weighted[(weighted.Unique_ID == copy.Unique_ID) & (weighted.Time < copy.Time)]
+    parent = state_changes[(state_changes.Unique_ID == copy.Parent_ID) & (state_changes.Time < copy.Time)]
+    assert len(copied) == len(parent) > 0
+    assert (copied.Weight == 0).all()
+    later = weighted[weighted.Time >= weighted.Unique_ID.map(weights.set_index("Unique_ID").Time)]
+    assert np.allclose(later.Weight, 1 / 3)
+    assert weighted.loc[~weighted.Unique_ID.isin(weights.Unique_ID), "Weight"].eq(1).all()
+
+
+def test_unweighted_output(make_scenario):
+    scenario_dir = make_scenario()
+    model = CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger())
+    model.run()
+    assert read_weights(model.iteration_dir) is None
+    state_changes, _ = read_output(model.iteration_dir)
+    assert add_weights(state_changes, None).Weight.eq(1).all()
+    pd.testing.assert_frame_equal(add_weights(state_changes, None).drop(columns="Weight"), state_changes)
+
+
+def test_split_agents_requires_single_replicate(make_scenario):
+    scenario_dir = make_scenario(parameters="importance:\n  split_factor: 2\n")
+    with pytest.raises(ValueError):
+        CervicalModel(scenario_dir, 0, logger=LoggerFactory().create_logger(), replicate_seeds=[1, 2])
+
+
+__all__ = ["make_scenario"]
@@ -4,20 +4,21 @@ class CinTreatmentMethod:
         self.params = params
         self.rng = rng
 
-    def is_effective(self):
-        return self.rng.random() < self.params.effectiveness
+    def is_effective(self, unique_id: int = None):
+        return self.rng.for_agent(unique_id, draw=1) < self.params.effectiveness
 
 
 class CinTreatmentMethodFactory:
     def __init__(self, model):
         self.model = model
+        self.rng = model.rng.stream("treatment")
         self.params = model.params.treatment
         self.methods = [
-            CinTreatmentMethod("leep", self.params.leep, self.model.rng),
-            CinTreatmentMethod("cryo", self.params.cryo, self.model.rng),
+            CinTreatmentMethod("leep", self.params.leep, self.rng),
+            CinTreatmentMethod("cryo", self.params.cryo, self.rng),
         ]
         self.proportions = [m.params.proportion for m in self.methods]
         self.options = [i for i in range(len(self.methods))]
 
-    def get_method(self):
-        return self.model.rng.choice(self.options, p=self.proportions)
+    def get_method(self, unique_id: int = None):
+        return self.rng.choice_for_agent(unique_id, self.options, p=self.proportions)
@@ -0,0 +1,144 @@
+import math
+from pathlib import Path
+
+from model.cervical_model import CervicalModel
+from model.logger import LoggerFactory
+from model.parameters import Parameters
+from model.tables import TransitionTables
+
+
+class ForkedVariants:
+    def __init__(
+        self,
+        scenario_dirs: list,
+        iteration: int = 0,
+        logger: LoggerFactory = None,
+        seed: int = 1111,
+        replicate_seeds: list = None,
+        shared_steps: int = 0,
+    ):
+        """ Run the scenario variants of an iteration in one process, one after another. Their common beginning is only
+        simulated once: Every variant is forked from a snapshot of the shared steps.
+            - Variants share one set of transition tables. Scenarios of a batch link to the same tables, so they are
+              loaded and converted to arrays once instead of once per scenario.
+            - Each variant keeps its own agents and random streams. Its output is identical to running it alone.
+            - Variants must use the same time settings, so that their clocks and ages stay aligned
+            - The first `shared_steps` time steps are only simulated once, by a model of the first variant. Every
+              variant is then forked from a snapshot of its state. Variants may only differ in their screening and
+              vaccination parameters, and those may only differ once the shared steps are over.
+            - Memory: The variants are run one after another, and only one of them holds its agents at a time. The
+              snapshot of the shared steps is kept until the last variant is forked, so at most two copies of the
+              agents are in memory: The snapshot and the running variant (or the model of the shared steps).
+            - Runs with a `checkpoint_interval` can be resumed after a crash. Each variant is checkpointed like a single
+              run, and continues from its own checkpoint. The shared steps are checkpointed separately (see
+              `shared_checkpoint_path`), and their final state is kept until every variant has finished.
+
+        Args:
+            scenario_dirs (list): The scenario directories of the variants
+            iteration (int, optional): The iteration to run for every variant. Defaults to 0.
+            logger (LoggerFactory, optional): Logger to use for writing log messages. Defaults to None.
+            seed (int, optional): The seed of every variant. Defaults to 1111.
+            replicate_seeds (list, optional): See CervicalModel. Defaults to None.
+            shared_steps (int, optional): The number of time steps that every variant has in common. Defaults to 0.
+        """
+        self.scenario_dirs = [Path(scenario_dir) for scenario_dir in scenario_dirs]
+        self.iteration = iteration
+        self.logger = logger
+        self.seed = seed
+        self.replicate_seeds = replicate_seeds
+        self.tables = TransitionTables()
+        # --- Only the parameters are loaded up front: The agents of a variant are created when it is run
+        self.variant_params = []
+        for scenario_dir in self.scenario_dirs:
+            params = Parameters()
+            params.update_from_file(scenario_dir.joinpath("parameters.yml"))
+            self.variant_params.append(params)
+        for scenario_dir, params in zip(self.scenario_dirs[1:], self.variant_params[1:]):
+            for name in ["num_steps", "steps_per_year", "initial_age"]:
+                if getattr(params, name) != getattr(self.variant_params[0], name):
+                    raise ValueError(
+                        "Forked variants must have the same {}: {} and {} differ".format(
+                            name, self.scenario_dirs[0], scenario_dir
+                        )
+                    )
+        self.params = self.variant_params[0]
+        if not 0 <= shared_steps < self.params.num_steps:
+            raise ValueError(
+                "shared_steps must be at least 0 and less than num_steps ({}): {}".format(
+                    self.params.num_steps, shared_steps
+                )
+            )
+        self.shared_steps = shared_steps
+        if shared_steps > 0:
+            self.check_shared_steps()
+
+    def check_shared_steps(self):
+        """ Raise a ValueError if a variant could differ from the first variant during the shared steps
+        """
+        first = self.params.export_to_dict()
+        # --- The ages reached by the yearly updates of the shared steps
+        last_age = self.params.initial_age + math.ceil(self.shared_steps / self.params.steps_per_year) - 1
+        ignored = ["num_steps", "kernel_backend", "compaction_interval", "screening", "vaccination"]
+        for scenario_dir, variant_params in zip(self.scenario_dirs[1:], self.variant_params[1:]):
+            params = variant_params.export_to_dict()
+            if any(first[key] != params[key] for key in first if key not in ignored):
+                raise ValueError(
+                    "{} differs from {} during the shared steps".format(scenario_dir, self.scenario_dirs[0])
+                )
+            schedules = [
+                {age: p for age, p in item["vaccination"]["schedule"].items() if age <= last_age}
+                for item in [first, params]
+            ]
+            screens = [
+                item["screening"]["protocol"] != "none" and item["screening"]["age_routine_start"] <= last_age
+                for item in [first, params]
+            ]
+            screening_differs = (screens[0] or screens[1]) and first["screening"] != params["screening"]
+            if schedules[0] != schedules[1] or screening_differs:
+                raise ValueError("The interventions of {} start during the shared steps".format(scenario_dir))
+
+    def make_model(self, scenario_dir: Path) -> CervicalModel:
+        return CervicalModel(
+            scenario_dir,
+            self.iteration,
+            logger=self.logger,
+            seed=self.seed,
+            replicate_seeds=self.replicate_seeds,
+            tables=self.tables,
+        )
+
+    @property
+    def shared_checkpoint_path(self) -> Path:
+        return self.scenario_dirs[0].joinpath(f"iteration_{self.iteration}", "shared_checkpoint.pickle")
+
+    def run_shared_steps(self) -> dict:
+        """ Simulate the shared steps with a model of the first variant, and return its state
+        """
+        model = self.make_model(self.scenario_dirs[0])
+        # --- A checkpoint past the shared steps was made with more shared steps, and cannot be used
+        if model.resume(self.shared_checkpoint_path) and model.time > self.shared_steps:
+            model = self.make_model(self.scenario_dirs[0])
+        checkpoint_steps = self.params.checkpoint_interval * self.params.steps_per_year
+        while model.time < self.shared_steps:
+            model.step()
+            if checkpoint_steps and (model.time % checkpoint_steps == 0 or model.time == self.shared_steps):
+                model.save_checkpoint(self.shared_checkpoint_path)
+        return model.get_state()
+
+    def run(self, print_status=False):
+        snapshot = None
+        for scenario_dir in self.scenario_dirs:
+            model = self.make_model(scenario_dir)
+            # --- Variants without a checkpoint of their own are forked from the shared steps
+            if not model.resume() and self.shared_steps > 0:
+                if snapshot is None:
+                    del model
+                    snapshot = self.run_shared_steps()
+                    model = self.make_model(scenario_dir)
+                model.set_state(snapshot)
+            model.run(print_status=print_status)
+            # --- Release the agents of this variant before the next one is created
+            del model
+        # --- Every variant is complete, so the shared steps are no longer needed
+        if self.shared_checkpoint_path.exists():
+            self.shared_checkpoint_path.unlink()
@@ -9,11 +9,12 @@ from src.run_mass_runs import get_run_analysis
 
 
 class Runner:
-    def __init__(self, directory: str, cpus: int, num_iterations: int, seed: int = 1111):
+    def __init__(self, directory: str, cpus: int, num_iterations: int, seed: int = 1111, replicates: int = 1):
         self.directory = Path(directory)
         self.cpus = cpus
         self.num_iterations = num_iterations
         self.seed = seed
+        self.replicates = max(replicates, 1)
         self.logger_factory = LoggerFactory()
         self.is_experiment = not self.directory.name.startswith("scenario")
         self.logger = self.logger_factory.create_logger(self.directory.joinpath("run.log"))
@@ -61,8 +62,11 @@ class Runner:
         self.logger.info("All tasks complete")
 
     def _get_scenario_tasks(self, directory, pool):
-        for iteration in range(self.num_iterations):
+        # --- Iterations get the same seeds however they are grouped into stacked replicates
+        seeds = [self.rng.randint(1, 2 ** 30) for _ in range(self.num_iterations)]
+        for iteration in range(0, self.num_iterations, self.replicates):
             self.logger.debug("Adding iteration [{}] to queue".format(iteration))
+            replicate_seeds = seeds[iteration : iteration + self.replicates]
             yield {
                 "scenario": directory.name,
                 "iteration": iteration,
@@ -72,13 +76,16 @@ class Runner:
                         scenario_dir=directory,
                         iteration=iteration,
                         logger_factory=self.logger_factory,
-                        seed=self.rng.randint(1, 2 ** 30),
+                        seed=replicate_seeds[0],
+                        replicate_seeds=replicate_seeds if len(replicate_seeds) > 1 else None,
                     ),
                 ),
             }
 
 
-def run_iteration(scenario_dir: Path, logger_factory: LoggerFactory, iteration: int, seed: int = 1111):
+def run_iteration(
+    scenario_dir: Path, logger_factory: LoggerFactory, iteration: int, seed: int = 1111, replicate_seeds: list = None
+):
 
     iteration_dir = scenario_dir.joinpath(f"iteration_{iteration}")
     iteration_dir.mkdir(exist_ok=True)
@@ -86,7 +93,12 @@ def run_iteration(scenario_dir: Path, logger_factory: LoggerFactory, iteration:
 
     try:
         logger.info("Initializing the model")
-        model = CervicalModel(scenario_dir=scenario_dir, iteration=iteration, logger=logger, seed=seed)
+        model = CervicalModel(
+            scenario_dir=scenario_dir, iteration=iteration, logger=logger, seed=seed, replicate_seeds=replicate_seeds
+        )
+
+        # --- Continue from the latest checkpoint of a previous attempt, if there is one
+        model.resume()
 
         logger.info("Running the model")
         model.run()
@@ -118,8 +130,16 @@ if __name__ == "__main__":
     parser.add_argument(
         "--seed", type=int, default=1111, help="seed for the random number generator (default: %(default)s)"
     )
+    parser.add_argument(
+        "--replicates",
+        type=int,
+        default=1,
+        help="number of iterations simulated together as one stacked population (default: %(default)s)",
+    )
     args = parser.parse_args()
 
     print(args)
-    runner = Runner(directory=args.input_dir, cpus=args.cpus, num_iterations=args.n, seed=args.seed,)
+    runner = Runner(
+        directory=args.input_dir, cpus=args.cpus, num_iterations=args.n, seed=args.seed, replicates=args.replicates
+    )
     runner.run()
@@ -2,7 +2,7 @@ import argparse
 from pathlib import Path
 
 import pandas as pd
-from model.analysis import Analysis
+from model.analysis import Analysis, add_weights, read_weights
 from model.event import Event
 from model.parameters import Parameters
 from model.state import CancerDetectionState, CancerState, HivState, LifeState, HpvState, HpvStrain
@@ -38,10 +38,17 @@ def analyze(scenario_dir: Path, iteration: int = 0):
     params = Parameters()
     params.update_from_file(iteration_path.parent.joinpath("parameters.yml"))
 
-    agent_index = pd.Index(range(params.num_agents))
+    # Importance weighted runs also contain the agents created by splitting. They inherit the history of their parent.
+    weights = read_weights(iteration_path)
+    num_agents = params.num_agents
+    if weights is not None:
+        num_agents += int((weights.Unique_ID != weights.Parent_ID).sum())
+    agent_index = pd.Index(range(num_agents))
 
     # Read all of the state changes
-    temp_df = pd.read_parquet(iteration_path.joinpath("state_changes.parquet"))
+    temp_df = add_weights(
+        pd.read_parquet(iteration_path.joinpath("state_changes.parquet")), weights, copy_parent_events=True
+    )
 
     # At what time did each agent die?
     death_time = temp_df[temp_df.State == LifeState.id][["Time", "Unique_ID"]]
@@ -59,6 +66,10 @@ def analyze(scenario_dir: Path, iteration: int = 0):
     hiv_time = hiv_time.set_index("Unique_ID").rename(columns={"Time": "hiv_time"}).reindex(agent_index)
 
     agents = pd.concat(objs=(death_time, cancer_time, hiv_time), axis=1,)
+    # The final weight of each agent
+    agents["weight"] = 1
+    if weights is not None:
+        agents["weight"] = weights.set_index("Unique_ID").Weight.reindex(agent_index).fillna(1)
 
     # Compute the age in years. We're rounding to help avoid floating point issues when using these ages later.
     for field in ("death", "cancer", "hiv"):
@@ -79,7 +90,8 @@ def analyze(scenario_dir: Path, iteration: int = 0):
     # ------------------------------------------------------------------------------------------------------------------
     # Gather the cost data.
 
-    costs = pd.read_parquet(iteration_path.joinpath("events.parquet"))
+    costs = add_weights(pd.read_parquet(iteration_path.joinpath("events.parquet")), weights)
+    costs["Cost"] = costs["Cost"] * costs["Weight"]
     # Calculate age
     costs["Age"] = params.initial_age + costs["Time"] / params.steps_per_year
 
@@ -96,9 +108,13 @@ def analyze(scenario_dir: Path, iteration: int = 0):
     # Compute the iteration-level results.
     results = {}
 
-    results["lifespan"] = agents["death_age"].mean()
-    results["lifespan_hiv"] = agents.loc[agents["got_hiv"], "death_age"].mean()
-    results["lifespan_no_hiv"] = agents.loc[~agents["got_hiv"], "death_age"].mean()
+    def weighted_mean(values: pd.Series) -> float:
+        weight = agents.loc[values.index, "weight"]
+        return (values * weight).sum() / weight.sum() if len(values) > 0 else float("nan")
+
+    results["lifespan"] = weighted_mean(agents["death_age"])
+    results["lifespan_hiv"] = weighted_mean(agents.loc[agents["got_hiv"], "death_age"])
+    results["lifespan_no_hiv"] = weighted_mean(agents.loc[~agents["got_hiv"], "death_age"])
     results["cost_total"] = costs["Cost"].sum()
 
     for e in Event:
@@ -107,9 +123,9 @@ def analyze(scenario_dir: Path, iteration: int = 0):
 
     for ages in AGE_RANGES:
         rng = f"{ages[0]}_{ages[1]}"
-        results[f"alive_{ages[0]}"] = agents[f"alive_{ages[0]}"].sum()
-        results[f"cancers_{rng}"] = agents[f"cancer_{rng}"].sum()
-        results[f"cancer_deaths_{rng}"] = agents[f"cancer_death_{rng}"].sum()
+        results[f"alive_{ages[0]}"] = agents.loc[agents[f"alive_{ages[0]}"], "weight"].sum()
+        results[f"cancers_{rng}"] = agents.loc[agents[f"cancer_{rng}"], "weight"].sum()
+        results[f"cancer_deaths_{rng}"] = agents.loc[agents[f"cancer_death_{rng}"], "weight"].sum()
         results[f"cost_total_{rng}"] = costs[f"cost_{rng}"].sum()
 
     for field in ("cancers", "cancer_deaths", "cost_total"):
@@ -135,10 +151,10 @@ def analyze(scenario_dir: Path, iteration: int = 0):
         
         try:
             # Calculate population and cancer deaths using boolean indexing
-            population = agents[agents['death_age'] >= start_age].shape[0]
-            cancer_deaths = agents[(agents['cancer_age'] >= start_age) & 
-                                   (agents['cancer_age'] < end_age) & 
-                                   (agents['death_age'] - agents['cancer_age'] <= 5)].shape[0]
+            population = agents.loc[agents['death_age'] >= start_age, 'weight'].sum()
+            cancer_deaths = agents.loc[(agents['cancer_age'] >= start_age) & 
+                                       (agents['cancer_age'] < end_age) & 
+                                       (agents['death_age'] - agents['cancer_age'] <= 5), 'weight'].sum()
             
             incidence = (cancer_deaths / population) * 100_000 if population > 0 else 0
             results[f"Cancer_Death_Inc_Per_100k_{age_group}"] = round(incidence, 4) / 5 # TODO: verify / 5 is correct
@@ -2,6 +2,7 @@ import argparse
 from pathlib import Path
 
 from model.cervical_model import CervicalModel
+from model.variants import ForkedVariants
 from model.logger import LoggerFactory
 
 from src.analyze import analyze
@@ -11,12 +12,23 @@ from src.helper_functions import multi_process
 def run_and_analyze(scenario_dir, iteration, seed):
     # Setup & Run Model
     model = CervicalModel(scenario_dir, iteration, logger=LoggerFactory().create_logger(), seed=seed)
+    model.resume()
     model.run()
     # Analyze Model
     analyze(scenario_dir, int(iteration))
 
 
-def main(country: str, batch: str, seed: int):
+def run_and_analyze_variants(scenario_dirs, iteration, seed, shared_steps=0):
+    # Setup & Run every scenario of the iteration, one after another. Resumes the checkpoints of an interrupted run.
+    logger = LoggerFactory().create_logger()
+    models = ForkedVariants(scenario_dirs, iteration, logger=logger, seed=seed, shared_steps=shared_steps)
+    models.run()
+    # Analyze Models
+    for scenario_dir in scenario_dirs:
+        analyze(scenario_dir, int(iteration))
+
+
+def main(country: str, batch: str, seed: int, fork_variants: bool = False, shared_steps: int = 0):
     experiment_dir = Path(f"experiments/{country}")
     batch_dir = experiment_dir.joinpath(batch)
     logger_factory = LoggerFactory()
@@ -31,13 +43,24 @@ def main(country: str, batch: str, seed: int):
                     run_list.append(
                         {
                             "scenario_dir": scenario_dir,
-                            "iteration": iteration_i.name.replace("iteration_", ""),
+                            "iteration": int(iteration_i.name.replace("iteration_", "")),
                             "seed": int(seed),
                         }
                     )
 
     # ----- Run the scenarios
-    multi_process(run_and_analyze, run_list, logger, "scenario_dir")
+    if fork_variants:
+        # --- One task per iteration: The scenarios of an iteration share their transition tables
+        variant_runs = dict()
+        for run in run_list:
+            variant_runs.setdefault(run["iteration"], []).append(run["scenario_dir"])
+        run_list = [
+            {"scenario_dirs": scenario_dirs, "iteration": iteration, "seed": int(seed), "shared_steps": shared_steps}
+            for iteration, scenario_dirs in variant_runs.items()
+        ]
+        multi_process(run_and_analyze_variants, run_list, logger, "iteration")
+    else:
+        multi_process(run_and_analyze, run_list, logger, "scenario_dir")
 
 
 if __name__ == "__main__":
@@ -45,11 +68,34 @@ if __name__ == "__main__":
     parser.add_argument("batch", help="name of the batch directory")
     parser.add_argument("--country", type=str, default="all", help="The directory containing the experiment")
     parser.add_argument("--seed", type=int, default=1111, help="The seed for the run")
+    parser.add_argument(
+        "--fork-variants",
+        action="store_true",
+        help="Run the scenarios of each iteration in one process, forked from their shared steps, sharing tables",
+    )
+    parser.add_argument(
+        "--shared-steps",
+        type=int,
+        default=0,
+        help="With --fork-variants, the number of time steps simulated once and shared by every scenario",
+    )
     args = parser.parse_args()
 
     if args.country == "all":
         run_list = []
         for country in ["zambia", "japan", "usa", "india"]:
-            main(batch=args.batch, country=country, seed=args.seed)
+            main(
+                batch=args.batch,
+                country=country,
+                seed=args.seed,
+                fork_variants=args.fork_variants,
+                shared_steps=args.shared_steps,
+            )
     else:
-        main(batch=args.batch, country=args.country, seed=args.seed)
+        main(
+            batch=args.batch,
+            country=args.country,
+            seed=args.seed,
+            fork_variants=args.fork_variants,
+            shared_steps=args.shared_steps,
+        )